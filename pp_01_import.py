@@ -1,46 +1,58 @@
 import pandas as pd
 import numpy as np
 from matplotlib import pyplot as plt
-from opensignalsreader import OpenSignalsReader
 import os
+import sys
+
+# helper modules live next to the notebook scripts in pyfiles/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pyfiles'))
+import importer
+import manifest
+import parallel
 
 ## Import all files
 # Parameters
 sourceDataFolder = 'C:/Users/seinj/Teaching/Data/source-data'
 rawDataFolder = 'C:/Users/seinj/Teaching/Data/raw-data'
-participants = ['sub-01', 'sub-02']
-tasks = ['base', 'walk']
-sessions = ['ground', 'high']
-
-for pi in participants:
-    for ti in tasks:
-        for si in sessions:
-
-            # assemble file name
-            filename = sourceDataFolder + '/' + pi + '_' + ti + '-' + si + '.txt'
-
-            # skip the missing file
-            if filename == sourceDataFolder + '/sub-02_base-high.txt':
-                print('skipping sub-02 base high file')
-                continue
-
-            # Convert all other files
-            acq = OpenSignalsReader(filename, show=True)
-
-            # Access the processed ECG signal and print the first 5 elements
-            ecg_signal = acq.signal('ECG')
-            print(ecg_signal[:5])
-
-            # Access the processed EMG signal and print the first 5 elements
-            emg_signal = acq.signal('EMG')
-            print(emg_signal[:5])
-
-            ## Save data in a .csv format
-            output_filename_ecg = rawDataFolder + '/' + pi + '_' + ti + '-' + si + '_ecg.csv'
-            output_filename_emg = rawDataFolder + '/' + pi + '_' + ti + '-' + si + '_emg.csv'
-
-            # Save the NumPy array to a CSV file
-            np.savetxt(output_filename_ecg, ecg_signal, delimiter=',', header='ECG')
-            np.savetxt(output_filename_emg, emg_signal, delimiter=',', header='EMG')
-            print(f"Wrote files {output_filename_ecg} and {output_filename_emg}")
 
+# Recordings to import: every OpenSignals file in the source folder (missing
+# combinations, such as sub-02 base high, are simply not there); restrict with
+# e.g. participants = ['sub-01'] (None imports all)
+participants = None
+tasks = None
+sessions = None
+
+# Also write the old one-value-per-line .csv files (e.g. to share with collaborators)
+export_csv = False
+
+# 'stream' reads each file chunk by chunk with flat memory use; 'opensignalsreader'
+# reads the whole file at once and shows the OpenSignals plots
+parser = 'stream'
+
+# Number of recordings converted in parallel; 1 converts them one after the other,
+# e.g. parallel.default_workers() uses all cores
+n_workers = 1
+
+# One job per recording found in the source folder
+recordings = manifest.select(manifest.scan_source(sourceDataFolder), participants=participants,
+                             tasks=tasks, sessions=sessions)
+
+jobs = []
+for recording in recordings:
+    jobs.append({
+        "source_folder": sourceDataFolder,
+        "raw_folder": rawDataFolder,
+        "participant": recording["participant"],
+        "task": recording["task"],
+        "session": recording["session"],
+        "channels": {'ECG': 'ECG', 'EMG': 'EMG'},
+        "show": True,
+        "export_csv": export_csv,
+        "parser": parser,
+    })
+
+# Convert all files (the guard keeps worker processes from re-running the import),
+# then index the raw data folder for the next scripts
+if __name__ == '__main__':
+    importer.import_all(jobs, n_workers=n_workers)
+    manifest.build(rawDataFolder)
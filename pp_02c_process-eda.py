@@ -2,59 +2,62 @@ import neurokit2 as nk
 import pandas as pd
 import matplotlib.pyplot as plt
 import os as os
+import sys
+
+# helper modules live next to the notebook scripts in pyfiles/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pyfiles'))
+import manifest
+import signal_store
 
 # Paths to folders
 raw_data_folder = 'C:/Users/seinj/Teaching/Data/raw-data/'
 results_folder = 'C:/Users/seinj/Teaching/Results/'
 os.makedirs(results_folder, exist_ok=True)
 
-# parameters
+# parameters: the recordings with an EDA channel in the raw data folder (see manifest.py),
+# restricted to these participants / tasks / sessions (None keeps all)
 participants = ['sub-01']
-tasks = ['base', 'walk']
-sessions = ['ground', 'high']
+tasks = None
+sessions = None
+recordings = manifest.select(manifest.load(raw_data_folder), participants=participants,
+                             tasks=tasks, sessions=sessions, modality='EDA')
 
 all_results = []
 
-for pi in participants:
-    for ti in tasks:
-        for si in sessions:
-
-            # assemble file name
-            filename = raw_data_folder + '/' + pi + '_' + ti + '-' + si + '_eda.csv'
-
-            # skip the missing file
-            if filename == raw_data_folder + '/sub-02_base-high_eda.csv':
-                print('skipping sub-02 base high file')
-                continue
-            print('reading in ' + filename)
+for recording in recordings:
 
-            # read in the data in respective conditions
-            subdata = pd.read_csv(filename, header=None, names=['EDA'], skiprows=1)
+    # recording name and its parts
+    name = recording["name"]
+    pi, ti, si = recording["participant"], recording["task"], recording["session"]
+    filename = recording["path"]
+    sampling_rate = recording["sampling_rate"]  # from the OpenSignals header
+    print('reading in ' + filename)
 
-            # Extract the single column as a vector
-            eda_data = subdata['EDA'].values
+    # open the EDA channel of the respective condition (memory-mapped, no copy)
+    eda_data = signal_store.open_channel(raw_data_folder, name, 'eda')
 
-            # process the full time window
-            signals_full, info = nk.eda_process(eda_data, sampling_rate=1000)
+    # process the full time window
+    signals_full, info = nk.eda_process(eda_data, sampling_rate=sampling_rate)
 
-            if filename != raw_data_folder + '/sub-02_base-ground_eda.csv': # The exception is made for this file because this file contains no bursts
-                # plot results
-                nk.eda_plot(signals_full, info)
+    # recordings without any skin conductance response (e.g. sub-02 base ground) cannot be plotted
+    if signals_full["SCR_Peaks"].sum() > 0:
+        # plot results
+        nk.eda_plot(signals_full, info)
 
-                # Save the current figure to a file
-                figure_filename = results_folder + f'/{pi}_{ti}_{si}_eda_nk.png'
-                plt.savefig(figure_filename, bbox_inches='tight',
-                            pad_inches=0.1)  # Save the current active plot as a PNG file
-                print(f"Saved figure to {figure_filename}")
+        # Save the current figure to a file
+        figure_filename = results_folder + f'/{pi}_{ti}_{si}_eda_nk.png'
+        plt.savefig(figure_filename, bbox_inches='tight',
+                    pad_inches=0.1)  # Save the current active plot as a PNG file
+        print(f"Saved figure to {figure_filename}")
 
-            # summarize the number of activation and mean amplitude for the given interval
-            results = nk.eda_analyze(signals_full, method="interval-related")
-            print(results)
+    # summarize the number of activation and mean amplitude for the given interval
+    results = nk.eda_analyze(signals_full, method="interval-related")
+    print(results)
 
-            # Append the results to the list with participant and condition as metadata
-            results['Participant'] = pi
-            results['Condition'] = ti + '_' + si
-            all_results.append(results)
+    # Append the results to the list with participant and condition as metadata
+    results['Participant'] = pi
+    results['Condition'] = ti + '_' + si
+    all_results.append(results)
 
 # Concatenate all the results into a single DataFrame
 final_results = pd.concat(all_results, ignore_index=True)
@@ -7,9 +7,13 @@
 import pandas as pd
 import numpy as np
 from matplotlib import pyplot as plt
-from opensignalsreader import OpenSignalsReader
 import os
 
+import importer
+import manifest
+import parallel
+import qc
+
 
 # In[6]:
 
@@ -17,37 +21,54 @@ import os
 # Parameters
 sourceDataFolder = '/Users/erwin/Documents/ProjectPsychophysiologyData/source-data'
 rawDataFolder = '/Users/erwin/Documents/ProjectPsychophysiologyData/raw-data/'
-participants = ['sub-1', 'sub-2', 'sub-3']
-tasks = ['baseline', 'spiderhand', 'spidervideo']
+
+# Recordings to import: every OpenSignals file in the source folder, optionally
+# restricted, e.g. participants = ['sub-1'] (None imports all)
+participants = None
+tasks = None
+
+# Also write the old one-value-per-line .csv files (e.g. to share with collaborators)
+export_csv = False
+
+# 'stream' reads each file chunk by chunk with flat memory use; 'opensignalsreader'
+# reads the whole file at once and shows the OpenSignals plots
+parser = 'stream'
+
+# Number of recordings converted in parallel; 1 converts them one after the other,
+# e.g. parallel.default_workers() uses all cores
+n_workers = 1
 
 # Ensure output directory exists
 if not os.path.exists(rawDataFolder):
     os.makedirs(rawDataFolder)
 
-for pi in participants:
-    for ti in tasks:
-        
-            # assemble file name 
-            filename = sourceDataFolder + '/' + pi + '_' + ti + '.txt'
-            
-            # Convert all other files 
-            acq = OpenSignalsReader(filename, show=True)
-
-            # Access the processed ECG / EDA signal and print the first 5 elements
-            ecg_signal = acq.signal(1) 
-            print(ecg_signal[:5]) 
-            eda_signal = acq.signal(2)
-            print(eda_signal[:5]) 
-
-            ## Save data in a .csv format 
-            output_filename_ecg = rawDataFolder + '/' + pi + '_' + ti + '_ecg.csv'
-            output_filename_eda = rawDataFolder + '/' + pi + '_' + ti + '_eda.csv'
-        
-            # Save the NumPy array to a CSV file
-            np.savetxt(output_filename_ecg, ecg_signal, delimiter=',', header='ECG')
-            np.savetxt(output_filename_eda, eda_signal, delimiter=',', header='EDA')
-        
-            print(f"Wrote files {output_filename_ecg} and {output_filename_eda}")
+# One job per recording found in the source folder: the ECG / EDA signals are OpenSignals channels 1 and 2
+recordings = manifest.select(manifest.scan_source(sourceDataFolder), participants=participants, tasks=tasks)
+
+jobs = []
+for recording in recordings:
+    jobs.append({
+        "source_folder": sourceDataFolder,
+        "raw_folder": rawDataFolder,
+        "participant": recording["participant"],
+        "task": recording["task"],
+        "session": recording["session"],
+        "channels": {'ECG': 1, 'EDA': 2},
+        "show": True,
+        "export_csv": export_csv,
+        "parser": parser,
+    })
+
+# Convert all files (the guard keeps worker processes from re-running the import),
+# then index the raw data folder for the next scripts
+if __name__ == '__main__':
+    importer.import_all(jobs, n_workers=n_workers)
+    entries = manifest.build(rawDataFolder)
+
+    # Channels that did not pass the signal-quality check of the import (see qc.py)
+    quality = qc.table(entries)
+    if len(quality) and (quality['status'] != 'ok').any():
+        print(quality[quality['status'] != 'ok'].to_string(index=False))
 
 
 # In[ ]:
@@ -13,7 +13,11 @@ import pandas as pd  # installing neurokit2 installs most other packages too
 import numpy as np
 import scipy.signal as signal
 import matplotlib.pyplot as plt
-import pickle
+
+import filters
+import manifest
+import pan_tompkins
+import signal_store
 
 
 # In[2]:
@@ -22,109 +26,121 @@ import pickle
 # File path to raw data folder
 raw_data_folder = '/Users/erwin/Documents/ProjectPsychophysiologyData/raw-data/'
 
-# parameters
-participants = ['sub-1', 'sub-2', 'sub-3']
-tasks = ['baseline', 'spiderhand', 'spidervideo']
-
-
-# ## 2. Concatenate data
-# 
-# Preprocessing operations will be applied to all data equally, regardless of which condition or which participant it is from. 
-# Thus, it is efficient to *concatenate*, or to stack the data next to each other, without having to point to multiple variable names. 
-
-# In[3]:
-
+# parameters: every recording with an ECG channel in the raw data folder (see manifest.py);
+# restrict with e.g. participants = ['sub-1'] (None keeps all)
+participants = None
+tasks = None
+recordings = manifest.select(manifest.load(raw_data_folder), participants=participants, tasks=tasks,
+                             modality='ECG')
 
-alldata = []
-
-for pi in participants:
-    for ti in tasks:
-            
-            # assemble file name 
-            filename = raw_data_folder + '/' + pi + '_' + ti + '_ecg.csv'
-            
-            # read in the data in respective conditions
-            subdata = pd.read_csv(filename)
-
-            # append to the empty list
-            alldata.append({"participant": pi, "condition": ti, "data": subdata})
+# File path to derivative data folder
+derivative_folder = '/Users/erwin/Documents/ProjectPsychophysiologyData/preprocessed-data/'
 
 
 # ## recap
 # We base our preprocessing steps on the description of **Pan-Tompkins algorithm**, that prepares the data for peak extraction. 
 # 
-# ## 3. Create a band-pass filter and apply it to the data
+# ## 2. Create a band-pass filter and apply it to the data
 # 
 # The first step is to create a band-pass filter. 
 # 
 # > A band-pass filter is applied to increase the signal-to-noise ratio. A filter bandwidth of 5-15 Hz is suggested to maximize the QRS contribute and reduce muscle noise, baseline wander, powerline interference and the P wave/T wave frequency content. (wikipedia, Pan-Tompkins algorithm)
 # 
-# ## 4. Derivative filter
+# ## 3. Derivative filter
 # 
 # Then we apply a simplyfied version of a derivative filter, that simply computes the difference between data points, which provides information on the slope of the changes. 
 # 
-# ## 5. Squaring
+# ## 4. Squaring
 # 
 # As the next step, the filtered signal is squared to enhance the dominant peaks (QRSs) and reduce the possibility of erroneously recognizing a T wave as an R peak. 
 # 
-# We iterate over all data files, then visualize and example section of the data. 
+# ## 5. Moving-window integration and R-peak detection
+# The last steps of the Pan-Tompkins algorithm (see `pan_tompkins.py`): the squared derivative is averaged over a 150 ms window, and adaptive thresholds on that integrated signal separate the QRS complexes from noise. Each R peak is placed on the maximum of the filtered ECG within the window. 
+# 
+# ## 6. Save the data
+# Every array is saved separately (`preprocessed_ecg/<recording>_<field>.npy`, listed in `preprocessed_ecg/<recording>.json`), so later stages can open just the arrays they need. The unfiltered data stays in the raw data folder.
+# 
+# We go through the recordings one at a time: the ECG is opened memory-mapped, filtered block by block (see `filters.py`) straight into the memory-mapped `.npy` files of the stage, its R peaks are detected and its index entry is written before the next recording is opened. Memory use therefore does not grow with the length or the number of recordings. 
 
-# In[4]:
+# In[3]:
 
 
-# parameters
-fs = 1000  
+# parameters (the sampling rate of every recording comes from its OpenSignals header)
 lowcut = 0.5
 highcut = 30.0
-
-# create the Butterworth filter
-b, a = signal.butter(1, [lowcut / (0.5 * fs), highcut / (0.5 * fs)], btype='band')
-
-# Iterate over all participants in alldata
-for participant_data in alldata:
-    condition_name = participant_data["condition"]
-    ecg_data = participant_data["data"]
-    participnat_name = participant_data["participant"]
-    
-    # Apply the filter 
-    filtered_ecg = signal.lfilter(b, a, ecg_data)
-    derivative_ecg = np.diff(filtered_ecg.flatten()) 
-    squared_ecg = np.square(derivative_ecg)  # or use filtered_ecg ** 2
-    
-    # Store the filtered data back into the participant's data dictionary
-    participant_data["filtered_data"] = filtered_ecg
-    participant_data["derive_sq_data"] = squared_ecg
-
-    # Display the filtered ECG 
-    plt.figure(figsize=(10, 6))
-    
-    # Plot the first 10 seconds 
-    plt.plot(ecg_data.to_numpy()[10000:20000], label="Unfiltered ECG", color='blue', alpha=0.2)
-    plt.plot(filtered_ecg[10000:20000], label="Filtered ECG", color='red', alpha=0.6)
-    
-    # Add title and labels
-    plt.title(f"ECG Signal - {participant_data['participant']} ({condition_name})")
-    plt.xlabel("Samples")
-    plt.ylabel("Amplitude (mV)")
- 
-    # Display the diffsquared data 
-    plt.figure(figsize=(10, 6))
-    plt.plot(squared_ecg[10000:20000], label="Filtered ECG", color='red', alpha=0.6)
-   
-
-
-# ## 6. Save the data
-
-# In[5]:
-
-
-# File path to derivative data folder
-derivative_folder = '/Users/erwin/Documents/ProjectPsychophysiologyData/preprocessed-data/'
-output_filename   = derivative_folder + 'preprocessed_ecg.pkl'
-
-# Save alldata as a pickle file
-with open(output_filename, 'wb') as f:
-    pickle.dump(alldata, f)
+block_size = 1000000  # samples processed at a time
+
+# batch mode: pack all recordings into one zero-padded 2-D array and filter them in a
+# single call (fastest for many short recordings, but holds all of them in memory);
+# show_plots shows the example plots of every recording (closed before the next one)
+batch_mode = False
+show_plots = False
+
+# create the Butterworth filter for every sampling rate
+bandpass = {fs: filters.ecg_bandpass(fs, lowcut, highcut) for fs in {r["sampling_rate"] for r in recordings}}
+
+# (an empty selection has nothing to pack)
+if batch_mode and recordings:
+    if len(bandpass) > 1:
+        raise ValueError(f"batch_mode needs recordings of one sampling rate, not {sorted(bandpass)}")
+    b, a = next(iter(bandpass.values()))
+    batch = filters.PackedBatch.pack([signal_store.open_channel(raw_data_folder, r["name"], 'ecg') for r in recordings])
+    filtered_batch, squared_batch = filters.preprocess_ecg_batch(batch, b, a)
+
+# Iterate over all recordings
+for i, recording in enumerate(recordings):
+    participant_name, condition_name, session = recording["participant"], recording["task"], recording["session"]
+    sampling_rate = recording["sampling_rate"]
+
+    # open the ECG channel of the respective condition (memory-mapped, no copy)
+    ecg_data = signal_store.open_channel(raw_data_folder, recording["name"], 'ecg')
+
+    # Apply the filter, the derivative and the squaring
+    if batch_mode:
+        filtered_ecg, squared_ecg = filtered_batch[i], squared_batch[i]
+    else:
+        b, a = bandpass[sampling_rate]
+        filtered_ecg = signal_store.open_stage_field(derivative_folder, 'preprocessed_ecg', participant_name,
+                                                     condition_name, 'filtered_data', (len(ecg_data),), session=session)
+        squared_ecg = signal_store.open_stage_field(derivative_folder, 'preprocessed_ecg', participant_name,
+                                                    condition_name, 'derive_sq_data', (max(len(ecg_data) - 1, 0),),
+                                                    session=session)
+        filters.preprocess_ecg(ecg_data, b, a, block_size=block_size, filtered=filtered_ecg, squared=squared_ecg)
+
+    # Detect the R peaks
+    r_peaks = pan_tompkins.detect(squared_ecg, filtered_ecg, sampling_rate=sampling_rate)
+    print(f"{recording['name']}: {len(r_peaks)} R peaks")
+
+    # Save the filtered and the derivative-squared data and the R peaks
+    signal_store.write_stage_record(derivative_folder, 'preprocessed_ecg', participant_name, condition_name,
+                                    {"filtered_data": filtered_ecg, "derive_sq_data": squared_ecg,
+                                     "r_peaks": r_peaks}, session)
+
+    if show_plots:
+        # Display the filtered ECG 
+        plt.figure(figsize=(10, 6))
+
+        # Plot the first 10 seconds 
+        plt.plot(ecg_data[10000:20000], label="Unfiltered ECG", color='blue', alpha=0.2)
+        plt.plot(filtered_ecg[10000:20000], label="Filtered ECG", color='red', alpha=0.6)
+
+        # Add title and labels
+        plt.title(f"ECG Signal - {participant_name} ({condition_name})")
+        plt.xlabel("Samples")
+        plt.ylabel("Amplitude (mV)")
+
+        # Display the diffsquared data 
+        plt.figure(figsize=(10, 6))
+        plt.plot(squared_ecg[10000:20000], label="Filtered ECG", color='red', alpha=0.6)
+
+        # Show the two figures of this recording and free them before the next one
+        plt.show()
+        plt.close('all')
+
+    # Drop the arrays of this recording before the next one
+    del ecg_data, filtered_ecg, squared_ecg, r_peaks
+
+print(f"Preprocessed ECG data saved to {signal_store.stage_folder(derivative_folder, 'preprocessed_ecg')}")
 
 
 # In[ ]:
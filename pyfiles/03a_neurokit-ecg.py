@@ -11,6 +11,14 @@ import matplotlib as matplotlib
 import numpy as np
 import os as os
 
+import analysis
+import instrument
+import manifest
+import parallel
+import qc
+import render
+import results_store
+
 from neurokit2.misc import NeuroKitWarning
 from neurokit2.signal.signal_rate import _signal_rate_plot
 from neurokit2.ecg.ecg_peaks import _ecg_peaks_plot
@@ -20,118 +28,138 @@ from neurokit2.ecg.ecg_segment import ecg_segment
 raw_data_folder = '/Users/erwin/Documents/ProjectPsychophysiologyData/raw-data/'
 results_folder = '/Users/erwin/Documents/ProjectPsychophysiologyData/results/'
 
-# Parameters
-participants = ['sub-1', 'sub-2', 'sub-3']
-tasks = ['baseline', 'spiderhand', 'spidervideo']
-
-all_results = []
-
-# Loop through participants and tasks
-for pi in participants:
-    for ti in tasks:
-        filename = os.path.join(raw_data_folder, f"{pi}_{ti}_ecg.csv")
-        print(f"Processing: {filename}")
-
-        if not os.path.exists(filename):
-            print(f"File not found: {filename}")
-            continue  # Skip to the next file if not found
-
-        # Read in the data in respective conditions
-        subdata = pd.read_csv(filename, header=None, names=['ECG'], skiprows=1)
-
-        # Extract the single column as a vector
-        ecg_data = subdata['ECG'].values
-
-        # Process the full time window
-        signals_full, info = nk.ecg_process(ecg_data, sampling_rate=1000)
-
-        # Select segment to plot
-        ecg_signals = signals_full  # You can adjust the segment here if needed
-
-        # Extract R-peaks (take those from df as it might have been cropped)
-        if "ECG_R_Peaks" in ecg_signals.columns:
-            info["ECG_R_Peaks"] = np.where(ecg_signals["ECG_R_Peaks"] == 1)[0]
-
-        # Prepare figure and set axes
-        gs = matplotlib.gridspec.GridSpec(2, 2, width_ratios=[2 / 3, 1 / 3])
-        fig = plt.figure(constrained_layout=False)
-        ax0 = fig.add_subplot(gs[0, :-1])
-        ax1 = fig.add_subplot(gs[1, :-1], sharex=ax0)
-        ax2 = fig.add_subplot(gs[:, -1])
-
-        # Plot signals
-        phase = None
-        if "ECG_Phase_Ventricular" in ecg_signals.columns:
-            phase = ecg_signals["ECG_Phase_Ventricular"].values
-
-        ax0 = _ecg_peaks_plot(
-            ecg_signals["ECG_Clean"].values,
-            info=info,
-            sampling_rate=info["sampling_rate"],
-            raw=ecg_signals["ECG_Raw"].values,
-            quality=ecg_signals["ECG_Quality"].values,
-            phase=phase,
-            ax=ax0,
-        )
-
-        # Plot Heart Rate
-        ax1 = _signal_rate_plot(
-            ecg_signals["ECG_Rate"].values,
-            info["ECG_R_Peaks"],
-            sampling_rate=info["sampling_rate"],
-            title="Heart Rate",
-            ytitle="Beats per minute (bpm)",
-            color="#FF5722",
-            color_mean="#FF9800",
-            color_points="#FFC107",
-            ax=ax1,
-        )
-
-        # Plot individual heartbeats
-        ax2 = ecg_segment(
-            ecg_signals,
-            info["ECG_R_Peaks"],
-            info["sampling_rate"],
-            show="return",
-            ax=ax2,
-        )
-
-        ax0.set_position([0.1, 0.9, 0.8, 0.2])
-        ax1.set_position([0.1, 0.5, 0.8, 0.2])
-        ax2.set_position([0.1, 0.1, 0.8, 0.2])
-
-        # Save the current figure to a file
-        figure_filename = results_folder + f'/{pi}_{ti}_ecg_nk.png'
-        plt.savefig(figure_filename, bbox_inches='tight', pad_inches=0.1)  # Save the current active plot as a PNG file
-        print(f"Saved figure to {figure_filename}")
-
-        # Close the plot to free memory after saving
-        plt.close()
-
-        # Process full-length interval-related data
-        results = nk.ecg_intervalrelated(signals_full, sampling_rate=1000)
-        print(results)
-
-        # Check if results is a valid DataFrame
-        if isinstance(results, pd.DataFrame):
-            # Append the results to the list with participant and condition as metadata
-            results['Participant'] = pi
-            results['Condition'] = ti
-            all_results.append(results)
-        else:
-            print(f"Results for {pi} {ti} are not in DataFrame format.")
-
-# Concatenate all the results into a single DataFrame
-if all_results:
-    final_results = pd.concat(all_results, ignore_index=True)
-
-    # Save the concatenated DataFrame to a CSV file
-    output_filename = results_folder + 'ecg_results.csv'
-    final_results.to_csv(output_filename, index=False)
-
-    print(f"Saved results to {output_filename}")
-else:
-    print("No valid results to save.")
+# nk.ecg_process outputs are cached here and only recomputed when the input signal
+# or the processing parameters change (set to None to always recompute)
+cache_folder = '/Users/erwin/Documents/ProjectPsychophysiologyData/cache/'
+
+# Parameters: every recording with an ECG channel in the raw data folder (see manifest.py);
+# restrict with e.g. participants = ['sub-1'] (None keeps all)
+participants = None
+tasks = None
+
+# R-peak detection: 'neurokit' (nk.ecg_process) or 'pantompkins' (pan_tompkins.py on the
+# 02a preprocessing, much faster; the figures are still drawn from nk.ecg_process)
+peak_method = 'neurokit'
+
+# Downsample the ECG to this rate (Hz) before processing, e.g. 500 (R-peak timing needs at
+# least ~250 Hz); None processes it at the sampling rate of the recording
+ecg_rate = None
+
+# Signal-quality gate (see qc.py): 'segment' leaves out recordings that failed the QC of the
+# import and analyses partly bad ones on their longest clean stretch only, 'skip' only leaves
+# out the failed ones, None analyses every recording as a whole
+quality_gate = 'segment'
+
+# Delete the stored results of recordings that are no longer in the raw data folder
+# (they are left out of the results either way)
+prune_stale = False
+
+# HRV time-courses: windows of hrv_window seconds every hrv_step seconds, computed from the
+# R-peaks of the analysis and saved to ecg_hrv_windows.csv (None skips them)
+hrv_window = None  # e.g. 60
+hrv_step = 5
+
+# Draw the diagnostic figures (set to False for analysis-only runs)
+make_figures = True
+
+# Reduce every plotted trace to a min/max envelope of this many bins, so drawing
+# time does not depend on the recording length (None plots every sample)
+plot_pixels = 2000
+
+# Number of recordings processed in parallel; 1 processes them one after the other,
+# e.g. parallel.default_workers() uses all cores
+n_workers = 1
+
+# Measure the wall time, CPU time and peak memory of every stage and recording and write
+# them to ecg_run_report.json next to the results (trace_memory also measures the memory
+# allocated within each stage, which makes the run slower)
+instrument_run = False
+trace_memory = False
+
+# Process all recordings; the recordings are selected under the guard too, as that reads
+# and may write the sidecars and the manifest, which worker processes must not repeat when
+# they import this script. A recording that fails is reported and skipped instead of
+# aborting the whole batch
+if __name__ == '__main__':
+    # One job per recording that passes the quality gate (recordings imported before qc.py are checked now)
+    recordings = qc.index(raw_data_folder, manifest.select(manifest.load(raw_data_folder), participants=participants,
+                                                           tasks=tasks, modality='ECG'))
+    recordings, rejected = qc.select(recordings, 'ECG', quality_gate)
+    jobs = []
+    for recording in recordings:
+        jobs.append({
+            "raw_data_folder": raw_data_folder,
+            "participant": recording["participant"],
+            "task": recording["task"],
+            "session": recording["session"],
+            "cache_folder": cache_folder,
+            "target_rate": ecg_rate,
+            "segment": recording["segment"],
+        })
+
+    analysis_jobs = [dict(job, peak_method=peak_method) for job in jobs]
+    if instrument_run:
+        instrument.enable(trace_memory=trace_memory)
+
+    # Recordings that failed the quality gate are not analysed and lose the results of an earlier run
+    for recording in rejected:
+        print(f"Skipping {recording['name']}: ECG failed the quality check "
+              f"({', '.join(recording['qc']['ECG']['issues'])})")
+        results_store.remove(results_folder, 'ecg', recording["participant"], recording["task"],
+                             recording["session"])
+    for job in jobs:
+        if job["segment"] is not None:
+            print(f"Analysing {job['participant']} {job['task']} from sample {job['segment'][0]} to "
+                  f"{job['segment'][1]} only (the clean part of the ECG)")
+
+    # Every recording's results are stored as soon as it is done (see results_store.py), so
+    # an interrupted run keeps the recordings finished so far
+    outputs = instrument.run_jobs(analysis.analyze_ecg, analysis_jobs, n_workers=n_workers, capture_errors=True,
+                                  callback=results_store.writer(results_folder, 'ecg'), group='analysis')
+
+    for job, results in zip(jobs, outputs):
+        if isinstance(results, parallel.JobError):
+            print(f"Processing {job['participant']} {job['task']} failed: {results.error}")
+            print(results.traceback)
+
+    # Concatenate the results of all recordings in the raw data folder (also those of earlier
+    # runs, see results_store.py) into a single CSV file
+    if prune_stale:
+        for path in results_store.prune(results_folder, 'ecg', raw_data_folder):
+            print(f"Removed stale results {path}")
+    with instrument.stage('write results'):
+        output_filename = results_store.export_csv(results_folder, 'ecg', raw_data_folder)
+
+    if output_filename is not None:
+        print(f"Saved results to {output_filename}")
+    else:
+        print("No valid results to save.")
+
+    # HRV time-courses (the R-peaks come from the cache filled by the analysis above)
+    if hrv_window is not None:
+        window_jobs = [dict(job, window=hrv_window, step=hrv_step) for job in analysis_jobs]
+        outputs = instrument.run_jobs(analysis.analyze_hrv_windows, window_jobs, n_workers=n_workers,
+                                      capture_errors=True, group='hrv windows')
+        window_results = [results for results in outputs
+                          if results is not None and not isinstance(results, parallel.JobError)]
+        for error in parallel.failed(outputs):
+            print(f"HRV windows of {error.job['participant']} {error.job['task']} failed: {error.error}")
+        if window_results:
+            output_filename = results_folder + 'ecg_hrv_windows.csv'
+            pd.concat(window_results, ignore_index=True).to_csv(output_filename, index=False)
+            print(f"Saved HRV time-courses to {output_filename}")
+
+    # Draw the figures from the cached processing outputs
+    if make_figures:
+        render_jobs = [dict(job, results_folder=results_folder, n_pixels=plot_pixels) for job in jobs]
+        render.render_all(render.render_ecg, render_jobs, n_workers=n_workers)
+
+    # Run report and the slowest recordings and stages
+    if instrument_run:
+        report_filename = instrument.write_report(results_folder + 'ecg_run_report.json',
+                                                  {"n_workers": n_workers, "recordings": len(jobs)})
+        instrument.print_summary()
+        print(f"Saved run report to {report_filename}")
 
 
 # In[ ]:
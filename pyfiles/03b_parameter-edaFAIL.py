@@ -4,7 +4,7 @@
 # # EDA Parameter extraction
 # 
 # ## 1. Import packages and load the data 
-# Last time, we saved the data in pkl format that preserves the structure of python variable. 
+# Last time, we saved every array of every recording separately. We only open the downsampled data, memory-mapped. 
 
 # In[1]:
 
@@ -13,15 +13,15 @@ import pandas as pd
 import numpy as np
 from scipy.signal import find_peaks, butter, filtfilt
 import matplotlib.pyplot as plt
-import pickle
 
-# File path to the pickle file
+import eda_decompose
+import signal_store
+
+# File path to the preprocessed data
 derivative_folder = '/Users/erwin/Documents/ProjectPsychophysiologyData/preprocessed-data/'
-output_filename = derivative_folder + 'preprocessed_eda.pkl'
 
-# Load the pickle file
-with open(output_filename, 'rb') as f:
-    loaded_data = pickle.load(f)
+# Open the downsampled data of all recordings
+loaded_data = signal_store.open_stage(derivative_folder, 'preprocessed_eda', fields=['downsampled_data'])
     
 # Display the loaded data
 print(loaded_data)
@@ -32,7 +32,6 @@ print(loaded_data)
 # In[6]:
 
 
-import pickle
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
@@ -41,10 +40,6 @@ from scipy.signal import butter, filtfilt, find_peaks
 # Define sampling frequency (downsampled to 10 Hz)
 sampling_frequency = 10  # For example
 
-# Load the pickle file
-with open(output_filename, 'rb') as f:
-    loaded_data = pickle.load(f)
-
 # 1. Extract the Tonic Component (SCL) using low-pass filtering
 def low_pass_filter(data, cutoff, fs, order=4):
     nyquist = 0.5 * fs
@@ -61,10 +56,10 @@ for participant_data in loaded_data:
     condition = participant_data['condition']
     
     # Extract the raw data (downsampled data can be used here too)
-    raw_data = participant_data['downsampled_data']  # You can use raw_data or downsampled_data based on your need
+    raw_data = participant_data['downsampled_data']  # The 1000 Hz raw data can be opened from the raw data folder instead
     
     # Convert the raw EDA data to a numpy array
-    eda_data = raw_data['EDA'].dropna().values  # Drop NaN values if any
+    eda_data = raw_data[~np.isnan(raw_data)]  # Drop NaN values if any
     
     # Create a time array based on the length of the cleaned data
     time = np.arange(len(eda_data)) / sampling_frequency
@@ -97,8 +92,48 @@ for participant_data in loaded_data:
     plt.show()
 
 
+# ## 3. Causal (online) decomposition
+# `filtfilt` filters forward and backward, so it needs the whole recording. `eda_decompose.py` computes the decomposition forward in time, block by block, as it would run during a live session; the raw signal is delayed by the group delay of the low-pass before the tonic component is subtracted. A lower filter order means less delay but a less sharp separation. 
+# 
+# The table compares it with the filtfilt + find_peaks result above: the error of the tonic / phasic components, the SCR peaks found by both (within 1 s) and the delay until a peak is reported.
+
 # In[ ]:
 
 
+comparison = []
+for participant_data in loaded_data:
+    eda_data = participant_data['downsampled_data']
+    eda_data = eda_data[~np.isnan(eda_data)]
+
+    for order in [1, 2, 4]:
+        result = eda_decompose.compare(eda_data, sampling_frequency, cutoff=cutoff_frequency, order=order,
+                                       peak_height=peak_threshold)
+        comparison.append({"participant": participant_data['participant'],
+                           "condition": participant_data['condition'], "order": order, **result})
+
+comparison = pd.DataFrame(comparison)
+print(comparison.groupby('order').mean(numeric_only=True))
+
+# Online and offline components of the last recording
+tonic_online, phasic_online, peaks_online, _ = eda_decompose.decompose_online(
+    eda_data, sampling_frequency, cutoff=cutoff_frequency, order=2, peak_height=peak_threshold)
+tonic_offline, phasic_offline, peaks_offline = eda_decompose.decompose_offline(
+    eda_data, sampling_frequency, cutoff=cutoff_frequency, peak_height=peak_threshold)
+
+time = np.arange(len(eda_data)) / sampling_frequency
+plt.figure(figsize=(12, 6))
+plt.plot(time, phasic_offline, label="Phasic, filtfilt", alpha=0.8)
+plt.plot(time, phasic_online, label="Phasic, causal (order 2)", alpha=0.8)
+plt.scatter(peaks_offline / sampling_frequency, phasic_offline[peaks_offline], color="red", label="SCR Peaks, filtfilt")
+plt.scatter(peaks_online / sampling_frequency, phasic_online[peaks_online], color="black", marker="x",
+            label="SCR Peaks, causal")
+plt.xlabel("Time (s)")
+plt.ylabel("EDA (µS)")
+plt.title(f"Causal vs. zero-phase decomposition ({participant} - {condition})")
+plt.legend()
+plt.grid(True)
+plt.tight_layout()
+plt.show()
 
 
+# In[ ]:
@@ -13,50 +13,21 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
 
+import results_store
+import summary
 
-# ## Load Data
-# Load the `.csv` file containing the summary of ECG results.
+
+# ## Parameters
 
 # In[13]:
 
 
-# Paths to folders
+# Paths to folders (the results are those of the recordings in the raw data folder, see results_store.py)
+raw_data_folder = '/Users/erwin/Documents/ProjectPsychophysiologyData/raw-data/'
 results_folder = '/Users/erwin/Documents/ProjectPsychophysiologyData/results/'
 
-# Load the .csv file
-filename = results_folder + 'ecg_results.csv'
-results = pd.read_csv(filename)
-
-# Display the data
-results.head()
-
-
-# ## Filter Data by Condition
-# Separate the data into `baseline`, `spiderhand`, and `spidervideo` conditions.
-
-# In[14]:
-
-
-# Filter rows for each condition
-baseline = results[results['Condition'] == 'baseline']
-spiderhand = results[results['Condition'] == 'spiderhand']
-spidervideo = results[results['Condition'] == 'spidervideo']
-
-# Calculate mean values for each condition
-conditions = ['Baseline', 'Spiderhand', 'Spidervideo']
-averages = [baseline['ECG_Rate_Mean'].mean(), 
-            spiderhand['ECG_Rate_Mean'].mean(), 
-            spidervideo['ECG_Rate_Mean'].mean()]
-
-# Display means
-averages
-
-
-# ## Define Plot Colors and Styles
-# Set up color schemes, line styles, and marker styles for visualization.
-
-# In[15]:
-
+# Conditions in plot order
+condition_names = ['baseline', 'spiderhand', 'spidervideo']
 
 # Define colors and styles
 bar_colors = ['#fde725', '#21918c', '#440154']
@@ -65,58 +36,82 @@ line_styles = ['-', '--', ':']  # Solid, dashed, dotted
 marker_styles = ['o', 's', '^']  # Circle, square, triangle
 
 
-# ## Create Plot
-# Visualize the data using a bar chart with scatter plots and connect individual participant data points with distinct lines.
+# ## Summarize and plot
+# Load the ECG results of all recordings (the per-recording results of `03a`, see `results_store.py`) and arrange them by participant and condition (see `summary.py`); a missing recording leaves a gap instead of stopping the summary. The means, participant counts and ratios to baseline of every metric are saved, and the average heart rate per condition is plotted as a bar chart with the individual participant data points connected by distinct lines. 
+# 
+# `summarize` takes the results folder, so the pipeline (`pipeline.py`) runs it on its own folders. 
+
+# In[14]:
+
+
+def summarize(results_folder, raw_data_folder, show=True):
+    """Write ecg_summary.csv and ecg_summary_with_lines.png of the results in results_folder."""
+    # Load the results, one row per recording
+    results = results_store.read(results_folder, 'ecg', raw_data_folder)
+    print(results.head())
+
+    # Participant x condition x metric
+    condition_summary = summary.Summary(results, conditions=condition_names)
+    for participant, condition in condition_summary.missing():
+        print(f"No results for {participant} ({condition})")
+
+    # Calculate mean values for each condition
+    conditions = [condition.capitalize() for condition in condition_names]
+    averages = condition_summary.means()['ECG_Rate_Mean'].tolist()
+    print(averages)
+
+    # Means, participant counts and ratios to baseline of every metric
+    condition_summary.table().to_csv(results_folder + 'ecg_summary.csv')
+
+    # Create the plot
+    fig, ax = plt.subplots(figsize=(6, 4))
+
+    # Bar plot
+    ax.bar(conditions, averages, color=bar_colors, width=0.3)
+
+    # Plot participant data (one row of heart rates per participant)
+    bpm = condition_summary.metric('ECG_Rate_Mean')
+
+    for i, (participant, participant_bpm) in enumerate(bpm.iterrows()):
+        # Plot lines and markers for participant
+        ax.plot(
+            conditions,
+            participant_bpm.values,
+            marker=marker_styles[i % len(marker_styles)], 
+            linestyle=line_styles[i % len(line_styles)], 
+            color='black', 
+            label=participant,
+            alpha=0.8,
+            linewidth=1.5
+        )
+
+    # Add labels, title, and legend
+    ax.set_ylabel('Heart Rate (bpm)')
+    ax.set_title('Average Heart Rate by Condition with Participant Trends')
+    ax.legend(loc='upper right', bbox_to_anchor=(1.4, 1), title='Participants')
+
+    # Add grid lines
+    ax.grid(True, which='both', axis='y', linestyle='--', linewidth=0.7, color='gray', alpha=0.7)
+
+    # Save the plot
+    figure_filename = results_folder + 'ecg_summary_with_lines.png'
+    plt.tight_layout()
+    plt.subplots_adjust(right=0.7)
+    plt.savefig(figure_filename, bbox_inches='tight', pad_inches=0.1)
+
+    # Display the plot
+    if show:
+        plt.show()
+    else:
+        plt.close(fig)
+    return condition_summary
+
 
 # In[17]:
 
 
-# Create the plot
-fig, ax = plt.subplots(figsize=(6, 4))
-
-# Bar plot
-ax.bar(conditions, averages, color=bar_colors, width=0.3)
-
-# Plot participant data
-participants = results['Participant'].unique()
-
-for i, participant in enumerate(participants):
-    # Filter participant data
-    participant_data = results[results['Participant'] == participant]
-    participant_bpm = [
-        participant_data[participant_data['Condition'] == 'baseline']['ECG_Rate_Mean'].values[0],
-        participant_data[participant_data['Condition'] == 'spiderhand']['ECG_Rate_Mean'].values[0],
-        participant_data[participant_data['Condition'] == 'spidervideo']['ECG_Rate_Mean'].values[0]
-    ]
-    
-    # Plot lines and markers for participant
-    ax.plot(
-        conditions,
-        participant_bpm,
-        marker=marker_styles[i % len(marker_styles)], 
-        linestyle=line_styles[i % len(line_styles)], 
-        color='black', 
-        label=participant,
-        alpha=0.8,
-        linewidth=1.5
-    )
-
-# Add labels, title, and legend
-ax.set_ylabel('Heart Rate (bpm)')
-ax.set_title('Average Heart Rate by Condition with Participant Trends')
-ax.legend(loc='upper right', bbox_to_anchor=(1.4, 1), title='Participants')
-
-# Add grid lines
-ax.grid(True, which='both', axis='y', linestyle='--', linewidth=0.7, color='gray', alpha=0.7)
-
-# Save the plot
-figure_filename = results_folder + 'ecg_summary_with_lines.png'
-plt.tight_layout()
-plt.subplots_adjust(right=0.7)
-plt.savefig(figure_filename, bbox_inches='tight', pad_inches=0.1)
-
-# Display the plot
-plt.show()
+if __name__ == '__main__':
+    summarize(results_folder, raw_data_folder)
 
 
 # In[ ]:
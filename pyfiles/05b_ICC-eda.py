@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# # Reliability of the EDA metrics
+# Intraclass correlations of every metric in eda_results.csv, with participants as targets and the conditions as repeated measurements (see `icc.py`): ICC(1), ICC(2,1) and ICC(3,1), each with a bootstrap confidence interval over participants.
+
+# In[1]:
+
+
+import icc
+import results_store
+import summary
+
+# Paths to folders (the results are those of the recordings in the raw data folder, see results_store.py)
+raw_data_folder = '/Users/erwin/Documents/ProjectPsychophysiologyData/raw-data/'
+results_folder = '/Users/erwin/Documents/ProjectPsychophysiologyData/results/'
+
+# Bootstrap parameters
+n_resamples = 2000
+confidence = 0.95
+seed = 0
+n_workers = 1  # e.g. parallel.default_workers() uses all cores
+
+# Metric for the interpretation below
+metric = 'SCR_Peaks_N'
+
+
+# In[2]:
+
+
+def compute_icc(results_folder, raw_data_folder, n_resamples=n_resamples, confidence=confidence, seed=seed,
+                n_workers=n_workers):
+    """Write eda_icc.csv, the ICCs of every metric of the results in results_folder; returns the table."""
+    # Load the results: one row per participant and condition
+    condition_summary = summary.Summary(results_store.read(results_folder, 'eda', raw_data_folder))
+
+    # All metrics at once
+    table = icc.icc_table(condition_summary.values, condition_summary.metrics, n_resamples=n_resamples,
+                          confidence=confidence, seed=seed, n_workers=n_workers)
+    output_filename = results_folder + 'eda_icc.csv'
+    table.to_csv(output_filename)
+    print(f"Saved ICCs of {len(table)} metrics to {output_filename}")
+    return table
+
+
+if __name__ == '__main__':
+    table = compute_icc(results_folder, raw_data_folder)
+
+    # Print the ICC and its interpretation
+    row = table.loc[metric]
+    print(row.round(4).to_string())
+    print(f"The ICC(1) indicates that {row['ICC1'] * 100:.2f}% of the variability in {metric} is due to "
+          f"differences between participants, rather than differences between conditions (within participants) "
+          f"({confidence * 100:.0f}% CI {row['ICC1_CI_Low'] * 100:.2f}% to {row['ICC1_CI_High'] * 100:.2f}%).")
+
+
+# In[ ]:
+
+
+
+
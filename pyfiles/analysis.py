@@ -0,0 +1,164 @@
+# # Per-recording NeuroKit analysis
+# The body of the participant x task loops of 03a_neurokit-ecg.py and
+# 03b_neurokit-eda.py, as functions of one recording. The scripts hand them to
+# parallel.run_jobs so recordings can be processed on several cores.
+# Figures are drawn afterwards by render.py from the cached processing outputs.
+# With peak_method='pantompkins' the ECG analysis skips nk.ecg_process and uses the
+# R-peaks of pan_tompkins.py, which is much faster on long recordings.
+# The steps are marked as instrument.stage()s, measured when instrumentation is enabled.
+# Recordings are processed at the sampling rate of their sidecar, or, with target_rate,
+# downsampled to that rate first (EDA needs far less than the 1000 Hz of the kit).
+# analyze_hrv_windows gives HRV time-courses from the same R-peaks (see hrv_windows.py).
+# segment restricts the analysis to a part of the recording, e.g. the longest clean
+# stretch of a partly bad recording (see qc.py); times are then relative to its start.
+# session selects a recording of a participant / task with several sessions (the manifest's
+# "session", e.g. sub-01_base-ground); results are labelled by participant and task only.
+# The processing outputs are compact.Signals (float32 traces, R-peaks etc. as index
+# arrays); the DataFrame is only built for the nk.*_intervalrelated functions.
+
+import neurokit2 as nk
+import numpy as np
+import pandas as pd
+
+import compact
+import filters
+import hrv_windows
+import instrument
+import nk_cache
+import pan_tompkins
+import signal_store
+
+
+def open_recording(raw_data_folder, participant, task, channel, session=None):
+    """The memory-mapped channel and its sampling rate, or (None, None) if the recording is missing."""
+    name = signal_store.recording_name(participant, task, session)
+    filename = signal_store.sidecar_path(raw_data_folder, name)
+    print(f"Processing: {filename}")
+
+    if not signal_store.exists(raw_data_folder, name):
+        print(f"File not found: {filename}")
+        return None, None
+    meta = signal_store.read_sidecar(raw_data_folder, name)
+    return signal_store.open_channel(raw_data_folder, name, channel, meta), meta["sampling_rate"]
+
+
+def read_recording(raw_data_folder, participant, task, channel, target_rate=None, segment=None, session=None):
+    """The channel in memory and its sampling rate, downsampled to target_rate if given.
+
+    segment [start, stop] (samples at the recording's rate) reads only that part.
+    """
+    # Read the channel into memory, so the 'read' stage includes the disk access
+    with instrument.stage('read'):
+        data, sampling_rate = open_recording(raw_data_folder, participant, task, channel, session)
+        if data is None:
+            return None, None
+        if segment is not None:
+            data = data[segment[0]:segment[1]]
+        data = np.array(data)
+
+    if target_rate is not None and target_rate < sampling_rate:
+        with instrument.stage('resample'):
+            data, sampling_rate = filters.resample(data, sampling_rate, target_rate)
+    return data, sampling_rate
+
+
+def _label(results, participant, task):
+    # Check if results is a valid DataFrame
+    if not isinstance(results, pd.DataFrame):
+        print(f"Results for {participant} {task} are not in DataFrame format.")
+        return None
+
+    # Add participant and condition as metadata
+    results['Participant'] = participant
+    results['Condition'] = task
+    return results
+
+
+def peak_signals(peaks, n_samples, sampling_rate=1000):
+    """The ECG_R_Peaks / ECG_Rate columns of nk.ecg_process for given R-peaks."""
+    r_peaks = np.zeros(n_samples, dtype=int)
+    r_peaks[peaks] = 1
+    rate = nk.signal_rate(peaks, sampling_rate=sampling_rate, desired_length=n_samples)
+    return pd.DataFrame({"ECG_Rate": rate, "ECG_R_Peaks": r_peaks})
+
+
+def ecg_signals(raw_data_folder, participant, task, cache_folder=None, peak_method='neurokit', target_rate=None,
+                segment=None, session=None):
+    """The processed ECG of one recording (compact.Signals, sampling rate), or (None, None) if it is missing.
+
+    peak_method 'neurokit' runs nk.ecg_process (cached), 'pantompkins' only detects
+    the R-peaks with pan_tompkins.py (no cleaning / quality / delineation columns).
+    target_rate downsamples the ECG first (R-peak timing needs at least ~250 Hz).
+    """
+    ecg_data, sampling_rate = read_recording(raw_data_folder, participant, task, 'ecg', target_rate, segment, session)
+    if ecg_data is None:
+        return None, None
+
+    if peak_method == 'neurokit':
+        # Process the full time window (or load it from the cache)
+        with instrument.stage('nk.ecg_process'):
+            signals_full, info = nk_cache.process_compact('ecg', ecg_data, sampling_rate=sampling_rate,
+                                                          cache_folder=cache_folder)
+    elif peak_method == 'pantompkins':
+        with instrument.stage('pan_tompkins'):
+            peaks = pan_tompkins.ecg_peaks(ecg_data, sampling_rate=sampling_rate)
+            signals_full = compact.Signals.from_dataframe(peak_signals(peaks, len(ecg_data),
+                                                                       sampling_rate=sampling_rate))
+    else:
+        raise ValueError(f"Unknown peak_method '{peak_method}', use 'neurokit' or 'pantompkins'.")
+    return signals_full, sampling_rate
+
+
+def analyze_ecg(raw_data_folder, participant, task, cache_folder=None, peak_method='neurokit', target_rate=None,
+                segment=None, session=None):
+    """Process one ECG recording and return its interval-related results (see ecg_signals)."""
+    signals_full, sampling_rate = ecg_signals(raw_data_folder, participant, task, cache_folder, peak_method,
+                                              target_rate, segment, session)
+    if signals_full is None:
+        return None
+
+    # Process full-length interval-related data
+    with instrument.stage('nk.ecg_intervalrelated'):
+        results = nk.ecg_intervalrelated(signals_full.to_dataframe(), sampling_rate=sampling_rate)
+    print(results)
+    return _label(results, participant, task)
+
+
+def analyze_hrv_windows(raw_data_folder, participant, task, cache_folder=None, peak_method='neurokit',
+                        target_rate=None, window=60, step=5, segment=None, session=None):
+    """HRV time-course of one ECG recording: windows of window seconds every step seconds.
+
+    The R-peaks are those of analyze_ecg (loaded from the cache with the same settings).
+    """
+    signals_full, sampling_rate = ecg_signals(raw_data_folder, participant, task, cache_folder, peak_method,
+                                              target_rate, segment, session)
+    if signals_full is None:
+        return None
+
+    with instrument.stage('hrv_windows'):
+        peaks = signals_full.events("ECG_R_Peaks")
+        results = hrv_windows.windowed_hrv(peaks, sampling_rate, window, step,
+                                           duration=len(signals_full) / sampling_rate)
+    return _label(results, participant, task)
+
+
+def analyze_eda(raw_data_folder, participant, task, cache_folder=None, target_rate=None, segment=None, session=None):
+    """Process one EDA recording and return its interval-related results.
+
+    target_rate downsamples the EDA first; SCRs are slow, so 10-50 Hz gives the same
+    metrics at a fraction of the cost (see validate_rates.py).
+    """
+    eda_data, sampling_rate = read_recording(raw_data_folder, participant, task, 'eda', target_rate, segment, session)
+    if eda_data is None:
+        return None
+
+    # Process the full time window (or load it from the cache)
+    with instrument.stage('nk.eda_process'):
+        signals_full, info = nk_cache.process('eda', eda_data, sampling_rate=sampling_rate,
+                                              cache_folder=cache_folder)
+
+    # Process full-length interval-related data
+    with instrument.stage('nk.eda_intervalrelated'):
+        results = nk.eda_intervalrelated(signals_full, sampling_rate=sampling_rate)
+    print(results)
+    return _label(results, participant, task)
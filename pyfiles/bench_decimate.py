@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# # Benchmark: EDA downsampling
+# Compares the slicing used in 02b_preprocess-eda.py (eda_data.iloc[::100]) with the
+# anti-aliased decimation in filters.py, on synthetic 1000 Hz EDA-like signals of
+# increasing length: throughput in million input samples per second, and how much
+# 50 Hz mains noise ends up in the 10 Hz series (slicing aliases it, decimation removes it).
+
+import time
+
+import numpy as np
+import pandas as pd
+
+import filters
+
+# Parameters
+sampling_rate = 1000
+downsample_factor = 100  # From 1000 Hz to 10 Hz
+hours = [0.25, 1, 4]
+block_size = 100000  # Block size of the streaming run
+repeats = 3
+
+
+def synthetic_eda(n, rng):
+    # Slow tonic drift + a few SCR-like bumps + mains noise slightly off 50 Hz
+    t = np.arange(n) / sampling_rate
+    clean = 5 + 0.5 * np.sin(2 * np.pi * t / 600) + 0.3 * (np.sin(2 * np.pi * t / 45) > 0.95)
+    noise = 0.2 * np.sin(2 * np.pi * 50.01 * t) + 0.01 * rng.standard_normal(n)
+    return clean, clean + noise
+
+
+def best_time(func):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def stream(x):
+    decimator = filters.Decimator(downsample_factor)
+    parts = [decimator.process(x[i:i + block_size]) for i in range(0, len(x), block_size)]
+    parts.append(decimator.flush())
+    return np.concatenate(parts)[decimator.delay:]
+
+
+if __name__ == '__main__':
+    rng = np.random.default_rng(0)
+    rows = []
+    for h in hours:
+        n = int(h * 3600 * sampling_rate)
+        clean, eda = synthetic_eda(n, rng)
+        eda_data = pd.DataFrame({'EDA': eda})
+        reference = clean[::downsample_factor]
+
+        methods = {
+            'iloc[::100]': lambda: eda_data.iloc[::downsample_factor]['EDA'].to_numpy(),
+            'decimate': lambda: filters.decimate(eda, downsample_factor),
+            'Decimator (streaming)': lambda: stream(eda),
+        }
+        for method, func in methods.items():
+            seconds, y = best_time(func)
+            # Error against the noise-free signal, away from the filter edges
+            error = np.sqrt(np.mean((y - reference)[20:-20] ** 2))
+            rows.append({
+                'hours': h,
+                'method': method,
+                'seconds': round(seconds, 4),
+                'Msamples/s': round(n / seconds / 1e6, 1),
+                'rms error': round(error, 4),
+            })
+
+    print(pd.DataFrame(rows).to_string(index=False))
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# # Benchmark: R-peak detection
+# Compares the Pan-Tompkins detector of pan_tompkins.py with NeuroKit on the ECG
+# recordings of the raw data folder (or on simulated ECG if the folder does not exist):
+# time of nk.ecg_process, of nk.ecg_clean + nk.ecg_peaks, of pan_tompkins.ecg_peaks
+# (02a preprocessing + detection) and of the detection alone on derive_sq_data, and the
+# agreement of the peaks: the share of NeuroKit peaks found (sensitivity) and of our
+# peaks confirmed by NeuroKit (positive predictive value) within a 50 ms tolerance.
+
+import os
+import time
+
+import neurokit2 as nk
+import numpy as np
+import pandas as pd
+
+import filters
+import manifest
+import pan_tompkins
+import signal_store
+
+# Parameters
+raw_data_folder = '/Users/erwin/Documents/ProjectPsychophysiologyData/raw-data/'
+sampling_rate = 1000
+tolerance = 0.050  # Two peaks within this many seconds are the same beat
+repeats = 3
+
+# Simulated recordings used when the raw data folder is not available: (minutes, noise)
+simulated = [(5, 0.05), (5, 0.2), (30, 0.05)]
+
+
+def best_time(func):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def match(reference, peaks, tolerance_samples):
+    """Number of reference peaks with one of peaks within the tolerance, and their offsets."""
+    if len(reference) == 0 or len(peaks) == 0:
+        return 0, np.empty(0)
+    right = np.clip(np.searchsorted(peaks, reference), 1, len(peaks) - 1)
+    nearest = np.where(np.abs(peaks[right] - reference) < np.abs(peaks[right - 1] - reference),
+                       peaks[right], peaks[right - 1])
+    offsets = nearest - reference
+    found = np.abs(offsets) <= tolerance_samples
+    return found.sum(), offsets[found]
+
+
+def recordings():
+    if os.path.isdir(raw_data_folder):
+        for entry in manifest.select(manifest.load(raw_data_folder), modality='ECG'):
+            yield entry["name"], np.asarray(signal_store.open_channel(raw_data_folder, entry["name"], 'ecg'))
+    else:
+        for minutes, noise in simulated:
+            ecg = nk.ecg_simulate(duration=minutes * 60, sampling_rate=sampling_rate, noise=noise, random_state=0)
+            yield f"simulated {minutes} min, noise {noise}", ecg
+
+
+if __name__ == '__main__':
+    b, a = filters.ecg_bandpass(sampling_rate)
+
+    rows = []
+    for name, ecg in recordings():
+        t_process, _ = best_time(lambda: nk.ecg_process(ecg, sampling_rate=sampling_rate))
+        t_nk, (_, info) = best_time(lambda: nk.ecg_peaks(nk.ecg_clean(ecg, sampling_rate=sampling_rate),
+                                                         sampling_rate=sampling_rate))
+        t_pt, peaks = best_time(lambda: pan_tompkins.ecg_peaks(ecg, sampling_rate=sampling_rate))
+        filtered, squared = filters.preprocess_ecg(ecg, b, a)
+        t_detect, _ = best_time(lambda: pan_tompkins.detect(squared, filtered, sampling_rate=sampling_rate))
+
+        reference = np.asarray(info["ECG_R_Peaks"])
+        found, offsets = match(reference, peaks, tolerance * sampling_rate)
+        rows.append({
+            'recording': name,
+            'minutes': round(len(ecg) / sampling_rate / 60, 1),
+            'nk.ecg_process s': round(t_process, 3),
+            'nk clean+peaks s': round(t_nk, 3),
+            'pan_tompkins s': round(t_pt, 3),
+            'detect only s': round(t_detect, 3),
+            'nk peaks': len(reference),
+            'our peaks': len(peaks),
+            'sensitivity': round(found / max(len(reference), 1), 4),
+            'ppv': round(found / max(len(peaks), 1), 4),
+            'median offset ms': np.median(offsets) / sampling_rate * 1000 if len(offsets) else np.nan,
+        })
+
+    print(pd.DataFrame(rows).to_string(index=False))
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# # Benchmark: all stages
+# Times every stage the scripts run, on synthetic ECG and EDA (one simulated minute of
+# nk.ecg_simulate / nk.eda_simulate, repeated to the requested length), for recording
+# lengths from one minute to 24 hours:
+#   loading (the old .csv files vs. the binary signal store), the 02a filter chain, the
+#   02b downsampling and smoothing, the Pan-Tompkins detection, nk.ecg_process,
+#   nk.ecg_intervalrelated and nk.eda_process.
+# Every run is appended to results_file (one JSON line per stage and length, with the
+# commit, machine and package versions), and compared with the previous run on the same
+# machine, so a change that makes a stage slower shows up as a regression.
+
+import datetime
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+
+import neurokit2 as nk
+import numpy as np
+import pandas as pd
+import scipy
+
+import filters
+import pan_tompkins
+import signal_store
+
+# Parameters
+results_file = '/Users/erwin/Documents/ProjectPsychophysiologyData/results/bench_stages.jsonl'
+sampling_rate = 1000
+minutes = [1, 10, 60, 240, 1440]  # One minute to 24 hours
+repeats = 3
+
+# Stages that become impractical on long recordings are skipped above these lengths (minutes)
+max_minutes = {
+    'load csv': 240,
+    'nk.ecg_process': 60,
+    'nk.ecg_intervalrelated': 60,
+    'nk.eda_process': 60,
+}
+
+# A stage counts as a regression when it got slower than this factor since the previous run
+# (stages faster than min_seconds are too noisy to compare)
+regression_factor = 1.2
+min_seconds = 0.01
+
+
+def synthetic(n):
+    # One simulated minute repeated to n samples (simulating 24 hours directly takes too long)
+    minute = 60 * sampling_rate
+    ecg = nk.ecg_simulate(duration=60, sampling_rate=sampling_rate, heart_rate=70, noise=0.05, random_state=0)
+    eda = nk.eda_simulate(duration=60, sampling_rate=sampling_rate, scr_number=4, noise=0.01, random_state=0)
+    repeats_needed = -(-n // minute)
+    return np.tile(ecg, repeats_needed)[:n], np.tile(eda, repeats_needed)[:n]
+
+
+def best_time(func, repeats=repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def stages(ecg, eda, folder):
+    """{stage name: function} for one synthetic recording (files are written to folder)."""
+    name = 'bench'
+    signal_store.write_recording(folder, name, {'ECG': ecg, 'EDA': eda}, sampling_rate=sampling_rate)
+    if len(ecg) <= max_minutes['load csv'] * 60 * sampling_rate:
+        signal_store.export_recording_csv(folder, name)
+    b, a = filters.ecg_bandpass(sampling_rate)
+    filtered, squared = filters.preprocess_ecg(ecg, b, a)
+    if len(ecg) <= max_minutes['nk.ecg_intervalrelated'] * 60 * sampling_rate:
+        ecg_signals, _ = nk.ecg_process(ecg, sampling_rate=sampling_rate)
+
+    def downsample_smooth():
+        downsampled = pd.Series(filters.decimate(eda, 100))
+        return downsampled.rolling(window=10).mean()
+
+    return {
+        'load csv': lambda: pd.read_csv(signal_store.csv_path(folder, name, 'ECG')),
+        'load binary': lambda: np.array(signal_store.open_channel(folder, name, 'ecg')),
+        '02a filter chain': lambda: filters.preprocess_ecg(ecg, b, a),
+        '02b downsample+smooth': downsample_smooth,
+        'pan_tompkins.detect': lambda: pan_tompkins.detect(squared, filtered, sampling_rate=sampling_rate),
+        'nk.ecg_process': lambda: nk.ecg_process(ecg, sampling_rate=sampling_rate),
+        'nk.ecg_intervalrelated': lambda: nk.ecg_intervalrelated(ecg_signals, sampling_rate=sampling_rate),
+        'nk.eda_process': lambda: nk.eda_process(eda, sampling_rate=sampling_rate),
+    }
+
+
+def run_info():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "run": datetime.datetime.now().isoformat(timespec='seconds'),
+        "commit": commit,
+        "machine": platform.node(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "scipy": scipy.__version__,
+        "neurokit2": nk.__version__,
+    }
+
+
+def read_results(filename):
+    if not os.path.exists(filename):
+        return pd.DataFrame()
+    with open(filename) as f:
+        return pd.DataFrame([json.loads(line) for line in f if line.strip()])
+
+
+def compare(current, previous):
+    """Current timings next to those of the previous run, with the slowdown factor."""
+    if previous.empty:
+        return current.assign(previous=np.nan, factor=np.nan)
+    previous = previous.set_index(['stage', 'minutes'])['seconds'].rename('previous')
+    table = current.join(previous, on=['stage', 'minutes'])
+    return table.assign(factor=table['seconds'] / table['previous'])
+
+
+if __name__ == '__main__':
+    info = run_info()
+    history = read_results(results_file)
+
+    rows = []
+    for length in minutes:
+        ecg, eda = synthetic(int(length * 60 * sampling_rate))
+        with tempfile.TemporaryDirectory() as folder:
+            for stage, func in stages(ecg, eda, folder).items():
+                if length > max_minutes.get(stage, np.inf):
+                    continue
+                # Slow stages are timed once on long recordings
+                seconds = best_time(func, repeats if length <= 10 else 1)
+                rows.append(dict(info, stage=stage, minutes=length, seconds=round(seconds, 6),
+                                 msamples_per_s=round(len(ecg) / seconds / 1e6, 2)))
+                print(f"{length:6} min  {stage:24s} {seconds:10.3f} s")
+
+    # Store the run
+    os.makedirs(os.path.dirname(results_file), exist_ok=True)
+    with open(results_file, 'a') as f:
+        for row in rows:
+            f.write(json.dumps(row) + '\n')
+
+    # Compare with the previous run on this machine
+    current = pd.DataFrame(rows)
+    previous = history[history['machine'] == info['machine']] if not history.empty else history
+    if not previous.empty:
+        previous = previous[previous['run'] == previous['run'].max()]
+    table = compare(current[['stage', 'minutes', 'seconds', 'msamples_per_s']], previous)
+    print(table.round(3).to_string(index=False))
+
+    regressions = table[(table['factor'] > regression_factor) & (table['seconds'] >= min_seconds)]
+    if len(regressions):
+        print(f"\nSlower than the previous run ({previous['commit'].iloc[0]}) by more than {regression_factor}x:")
+        print(regressions.round(3).to_string(index=False))
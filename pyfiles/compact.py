@@ -0,0 +1,142 @@
+# # Compact NeuroKit outputs
+# nk.ecg_process / nk.eda_process return a DataFrame with one float64 / int64 column per
+# output at the full sampling rate (~14 MB for 90 s of ECG at 1000 Hz). Most of it is
+# redundant: the event columns (ECG_R_Peaks, ECG_P_Onsets, SCR_Peaks, ...) are 0/1
+# markers that are almost all 0, the cardiac phases are small integer codes and the
+# continuous traces need no more than float32. Signals keeps every column in the
+# smallest form that fits it:
+#   - events: 0/1 markers, as the sorted sample indices of the 1s
+#   - codes:  small integers (NaN allowed), as int8 with CODE_MISSING for NaN
+#   - sparse: columns that are almost all 0 (e.g. SCR_Amplitude), as indices + float32 values
+#   - dense:  everything else, float32 (integer columns keep their type)
+#
+# to_dataframe() gives back the NeuroKit DataFrame (column order and dtypes as produced
+# by NeuroKit, continuous values rounded to float32), and events() returns the indices
+# of an event column in O(events) instead of a scan over every sample. nk_cache.py
+# stores Signals, so cached outputs take 4-8x less disk space.
+
+import json
+
+import numpy as np
+import pandas as pd
+
+# Version of the layout below; part of the nk_cache keys, so a change invalidates old entries
+SCHEMA = 1
+
+FLOAT_DTYPE = np.float32
+CODE_DTYPE = np.int8
+CODE_MISSING = np.iinfo(CODE_DTYPE).min
+
+# A column is stored as events / sparse if at most this fraction of its samples is not 0
+SPARSE_FRACTION = 0.05
+
+
+def _index_dtype(n_samples):
+    return np.int32 if n_samples < 2 ** 31 else np.int64
+
+
+def _role(values):
+    """The storage role of one column (see the table at the top)."""
+    if values.dtype.kind == 'b':
+        values = values.astype(np.int8)
+    if values.dtype.kind not in 'iuf':
+        raise TypeError(f"Cannot store a column of type {values.dtype} compactly")
+
+    missing = np.isnan(values) if values.dtype.kind == 'f' else np.zeros(len(values), dtype=bool)
+    present = values[~missing]
+    sparse = np.count_nonzero(values) <= SPARSE_FRACTION * len(values)  # NaN counts as not 0
+
+    integral = values.dtype.kind in 'iu' or bool(np.all(present == np.round(present)))
+    if integral and not missing.any() and sparse and np.isin(present, (0, 1)).all():
+        return 'events'
+    fits_code = len(present) == 0 or (present.min() > CODE_MISSING and present.max() <= np.iinfo(CODE_DTYPE).max)
+    if integral and fits_code:
+        return 'codes'
+    if sparse:
+        return 'sparse'
+    return 'dense'
+
+
+class Signals:
+    """The output DataFrame of nk.*_process in compact form (see the table at the top)."""
+
+    def __init__(self, n_samples, columns, dtypes, roles, arrays):
+        self.n_samples = n_samples
+        self.columns = list(columns)
+        self.dtypes = dict(dtypes)
+        self.roles = dict(roles)
+        self.arrays = dict(arrays)
+
+    @classmethod
+    def from_dataframe(cls, signals):
+        n_samples = len(signals)
+        index_dtype = _index_dtype(n_samples)
+        dtypes, roles, arrays = {}, {}, {}
+        for column in signals.columns:
+            values = signals[column].to_numpy()
+            role = _role(values)
+            dtypes[column], roles[column] = values.dtype.str, role
+            if role == 'events':
+                arrays[column] = np.flatnonzero(values).astype(index_dtype)
+            elif role == 'codes':
+                codes = np.where(np.isnan(values), CODE_MISSING, values) if values.dtype.kind == 'f' else values
+                arrays[column] = codes.astype(CODE_DTYPE)
+            elif role == 'sparse':
+                indices = np.flatnonzero(values)
+                arrays[f"{column}/indices"] = indices.astype(index_dtype)
+                arrays[f"{column}/values"] = values[indices].astype(FLOAT_DTYPE)
+            else:
+                arrays[column] = values.astype(FLOAT_DTYPE) if values.dtype.kind == 'f' else values
+        return cls(n_samples, signals.columns, dtypes, roles, arrays)
+
+    def __len__(self):
+        return self.n_samples
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in self.arrays.values())
+
+    def events(self, column):
+        """Sorted sample indices where an event column is 1 (or a sparse column is not 0)."""
+        role = self.roles[column]
+        if role == 'events':
+            return self.arrays[column]
+        if role == 'sparse':
+            return self.arrays[f"{column}/indices"]
+        return np.flatnonzero(self.column(column) == 1)
+
+    def column(self, column):
+        """One column at full length, in the dtype NeuroKit gave it."""
+        role, dtype = self.roles[column], np.dtype(self.dtypes[column])
+        if role == 'events':
+            values = np.zeros(self.n_samples, dtype=dtype)
+            values[self.arrays[column]] = 1
+            return values
+        if role == 'codes':
+            codes = self.arrays[column]
+            if dtype.kind == 'f':
+                return np.where(codes == CODE_MISSING, np.nan, codes).astype(dtype)
+            return codes.astype(dtype)
+        if role == 'sparse':
+            values = np.zeros(self.n_samples, dtype=dtype)
+            values[self.arrays[f"{column}/indices"]] = self.arrays[f"{column}/values"]
+            return values
+        return self.arrays[column].astype(dtype)
+
+    def to_dataframe(self, columns=None):
+        """The NeuroKit DataFrame (or some of its columns)."""
+        columns = self.columns if columns is None else columns
+        return pd.DataFrame({column: self.column(column) for column in columns})
+
+    def to_arrays(self):
+        """A dict of arrays for np.savez (see from_arrays)."""
+        layout = {"n_samples": self.n_samples, "columns": self.columns, "dtypes": self.dtypes,
+                  "roles": self.roles, "schema": SCHEMA}
+        return dict(self.arrays, layout=np.array(json.dumps(layout)))
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        layout = json.loads(str(arrays["layout"]))
+        return cls(layout["n_samples"], layout["columns"], layout["dtypes"], layout["roles"],
+                   {name: np.asarray(array) for name, array in arrays.items() if name != 'layout'})
+
@@ -0,0 +1,172 @@
+# # Causal EDA decomposition
+# 03b_parameter-edaFAIL.py splits EDA into a tonic (SCL) and a phasic (SCR) component
+# with a zero-phase low-pass (filtfilt), which needs the whole recording. Here the
+# low-pass runs forward only (second-order sections with their state carried between
+# blocks), so the decomposition and the SCR peak detection can follow a live recording.
+#
+# A causal low-pass lags behind the signal. With align=True the raw signal is delayed by
+# the filter's group delay before the tonic component is subtracted, which removes most of
+# that error at the cost of the same delay in the output. compare() measures the
+# difference to the offline filtfilt + find_peaks result for a given setting.
+
+import numpy as np
+import scipy.signal as signal
+from scipy.ndimage import maximum_filter1d
+
+
+def tonic_filter(cutoff, fs, order=2):
+    """Butterworth low-pass for the tonic component, as second-order sections."""
+    return signal.butter(order, cutoff / (0.5 * fs), btype='low', output='sos')
+
+
+def group_delay(sos):
+    """Group delay of the filter at 0 Hz, in samples."""
+    return sum(signal.group_delay((section[:3], section[3:]), w=[1e-6])[1][0] for section in sos)
+
+
+class OnlinePeaks:
+    """scipy.signal.find_peaks(x, height, distance) for a signal that arrives block by block.
+
+    A peak is reported once distance samples after it have arrived: it must be a local
+    maximum of at least height and the highest peak within distance - 1 samples on both
+    sides. Unlike find_peaks, a peak is also dropped if that higher neighbour was itself
+    dropped for an even higher one; for sparse peaks such as SCRs both give the same result.
+    """
+
+    def __init__(self, height, distance):
+        self.height = height
+        # find_peaks keeps peaks at least distance samples apart, also for a float distance
+        self.distance = max(int(np.ceil(distance)), 1)
+        self._tail = np.empty(0)
+        self._offset = 0  # Sample index of self._tail[0]
+        self._next = 0  # First position not yet decided
+        self._last = None
+
+    def process(self, block):
+        """Append a block; returns the indices of the peaks it confirms."""
+        segment = np.concatenate([self._tail, np.asarray(block, dtype=np.float64)])
+        stop = self._offset + len(segment) - self.distance
+        peaks = []
+        if stop > self._next:
+            # Local maxima of at least height (the last sample has no right neighbour yet)
+            left = np.concatenate([[-np.inf] if self._offset == 0 else [np.inf], segment[:-1]])
+            right = np.concatenate([segment[1:], [np.inf]])
+            is_peak = (segment > left) & (segment >= right) & (segment >= self.height)
+            if self._offset > 0:
+                is_peak[0] = False
+
+            # Only peaks compete for the distance, as in find_peaks
+            heights = np.where(is_peak, segment, -np.inf)
+            maxima = maximum_filter1d(heights, size=2 * self.distance - 1, mode='constant', cval=-np.inf)
+            positions = np.arange(self._next, stop)
+            i = positions - self._offset
+            is_peak = is_peak[i] & (segment[i] == maxima[i])
+            for position in positions[is_peak]:
+                if self._last is None or position - self._last >= self.distance:
+                    peaks.append(position)
+                    self._last = position
+            self._next = stop
+
+        # Keep what the next positions need on their left side
+        keep = max(self._next - self.distance - self._offset, 0)
+        self._tail = segment[keep:]
+        self._offset += keep
+        return peaks
+
+
+class EdaDecomposer:
+    """Tonic / phasic decomposition and SCR peak detection, block by block.
+
+    process() returns tonic, phasic and the SCR peaks confirmed by the block. Output
+    sample k belongs to input sample k - self.delay (0 without align); peaks are given
+    as input sample indices. The filter starts in its steady state for the first sample.
+    """
+
+    def __init__(self, fs, cutoff=0.05, order=2, align=True, peak_height=0.02, peak_distance=None):
+        self.fs = fs
+        self.sos = tonic_filter(cutoff, fs, order)
+        self.delay = int(round(group_delay(self.sos))) if align else 0
+        self.peaks = OnlinePeaks(peak_height, fs if peak_distance is None else peak_distance)
+        self._zi = None
+        self._history = None  # Last self.delay input samples
+
+    def process(self, block):
+        block = np.asarray(block, dtype=np.float64)
+        if len(block) == 0:
+            return np.empty(0), np.empty(0), []
+        if self._zi is None:
+            self._zi = signal.sosfilt_zi(self.sos) * block[0]
+            self._history = np.full(self.delay, block[0])
+
+        tonic, self._zi = signal.sosfilt(self.sos, block, zi=self._zi)
+
+        # Raw signal delayed to match the lag of the tonic component
+        delayed = np.concatenate([self._history, block])
+        self._history = delayed[len(block):]
+        phasic = delayed[:len(block)] - tonic
+
+        peaks = [peak - self.delay for peak in self.peaks.process(phasic)]
+        return tonic, phasic, peaks
+
+
+def decompose_offline(eda, fs, cutoff=0.05, order=4, peak_height=0.02):
+    """The zero-phase decomposition and peak detection of 03b_parameter-edaFAIL.py."""
+    b, a = signal.butter(order, cutoff / (0.5 * fs), btype='low')
+    tonic = signal.filtfilt(b, a, eda)
+    phasic = eda - tonic
+    peaks, _ = signal.find_peaks(phasic, height=peak_height, distance=fs)
+    return tonic, phasic, peaks
+
+
+def decompose_online(eda, fs, block_size=None, **options):
+    """Run an EdaDecomposer over a whole signal; tonic / phasic are aligned with the input.
+
+    The last self.delay samples cannot be computed causally and are NaN.
+    """
+    decomposer = EdaDecomposer(fs, **options)
+    block_size = block_size or max(int(round(fs)), 1)
+    tonic, phasic, peaks = [], [], []
+    for start in range(0, len(eda), block_size):
+        t, p, k = decomposer.process(eda[start:start + block_size])
+        tonic.append(t)
+        phasic.append(p)
+        peaks.extend(k)
+
+    padding = np.full(decomposer.delay, np.nan)
+    tonic = np.concatenate(tonic + [padding])[decomposer.delay:]
+    phasic = np.concatenate(phasic + [padding])[decomposer.delay:]
+    return tonic, phasic, np.array(peaks, dtype=int), decomposer
+
+
+def compare(eda, fs, tolerance=1.0, offline_order=4, **options):
+    """Accuracy and latency of the online decomposition against the offline one.
+
+    options go to EdaDecomposer (cutoff, order, align, peak_height, ...). Peaks within
+    tolerance seconds of each other count as the same SCR.
+    """
+    eda = np.asarray(eda, dtype=np.float64)
+    cutoff = options.get('cutoff', 0.05)
+    peak_height = options.get('peak_height', 0.02)
+    offline_tonic, offline_phasic, offline_peaks = decompose_offline(eda, fs, cutoff, offline_order, peak_height)
+    tonic, phasic, peaks, decomposer = decompose_online(eda, fs, **options)
+
+    matched, offsets = 0, []
+    for peak in offline_peaks:
+        if len(peaks):
+            nearest = peaks[np.abs(peaks - peak).argmin()]
+            if abs(nearest - peak) <= tolerance * fs:
+                matched += 1
+                offsets.append((nearest - peak) / fs)
+
+    valid = ~np.isnan(tonic)
+    return {
+        "delay s": decomposer.delay / fs,
+        "peak latency s": (decomposer.delay + decomposer.peaks.distance) / fs,
+        "tonic rms error": float(np.sqrt(np.mean((tonic - offline_tonic)[valid] ** 2))),
+        "phasic rms error": float(np.sqrt(np.mean((phasic - offline_phasic)[valid] ** 2))),
+        "offline peaks": len(offline_peaks),
+        "online peaks": len(peaks),
+        "sensitivity": matched / len(offline_peaks) if len(offline_peaks) else np.nan,
+        "ppv": matched / len(peaks) if len(peaks) else np.nan,
+        "median peak offset s": float(np.median(offsets)) if offsets else np.nan,
+    }
@@ -0,0 +1,214 @@
+# # Filters
+# Filtering steps of the preprocessing scripts, written so they can run on a whole
+# recording at once or block by block with the filter state carried between blocks.
+
+from fractions import Fraction
+
+import numpy as np
+import scipy.signal as signal
+
+# Taps of the decimation filter per output sample on each side of its centre
+DECIMATION_HALF_TAPS = 10
+
+
+def decimation_filter(factor, half_taps=DECIMATION_HALF_TAPS):
+    """Linear-phase anti-aliasing low-pass FIR (cutoff at the new Nyquist frequency).
+
+    Same design as scipy.signal.resample_poly. The filter has 2 * factor * half_taps + 1
+    taps, so its delay is exactly half_taps samples of the decimated signal.
+    """
+    return signal.firwin(2 * factor * half_taps + 1, 1.0 / factor, window=('kaiser', 5.0))
+
+
+class Decimator:
+    """Anti-aliased downsampling by an integer factor, block by block.
+
+    process() can be called with blocks of any length; the concatenated output equals
+    the output for the whole signal at once. Only every factor-th filter output is
+    computed (polyphase, via scipy.signal.upfirdn). The output lags the input by
+    self.delay decimated samples; flush() returns the outputs still held back.
+
+    The signal is taken to continue with its first sample before the start and its last
+    sample after the end, so a constant input gives a constant output (zero padding pulls
+    both ends towards zero, which shows up as spurious SCRs).
+    """
+
+    def __init__(self, factor, taps=None):
+        self.factor = factor
+        self.taps = decimation_filter(factor) if taps is None else np.asarray(taps)
+        if (len(self.taps) - 1) % factor:
+            raise ValueError("The number of filter taps minus one must be a multiple of the factor")
+        self.delay = (len(self.taps) - 1) // (2 * factor)
+
+        # Last len(taps) - 1 input samples and the position of the next output in the next block
+        self._history = None
+        self._phase = 0
+
+    def process(self, block):
+        block = np.asarray(block, dtype=np.float64)
+        if self._history is None:
+            if len(block) == 0:
+                return np.empty(0)
+            self._history = np.full(len(self.taps) - 1, block[0])
+        n_outputs = max(0, -(-(len(block) - self._phase) // self.factor))
+
+        # Outputs are taken at input positions phase, phase + factor, ...; filtering the
+        # buffer from phase onwards puts the first of them at a multiple of factor
+        buffer = np.concatenate([self._history, block])
+        first = (len(self.taps) - 1) // self.factor
+        y = signal.upfirdn(self.taps, buffer[self._phase:], down=self.factor)[first:first + n_outputs]
+
+        self._history = buffer[len(buffer) - len(self._history):]
+        self._phase += n_outputs * self.factor - len(block)
+        return y
+
+    def flush(self):
+        """Outputs still held back by the filter delay (the input is padded with its last sample)."""
+        if self._history is None:
+            return np.empty(0)
+        return self.process(np.full(self.delay * self.factor, self._history[-1]))
+
+
+def decimate(x, factor):
+    """Anti-aliased downsampling of a whole signal, aligned with the input (no delay).
+
+    Returns ceil(len(x) / factor) samples, i.e. as many as x[::factor].
+    """
+    decimator = Decimator(factor)
+    y = np.concatenate([decimator.process(x), decimator.flush()])
+    return y[decimator.delay:]
+
+
+def resample(x, fs, target_fs=None):
+    """Anti-aliased downsampling to target_fs; returns (samples, new sampling rate).
+
+    Integer factors use decimate(); other ratios scipy.signal.resample_poly, with the
+    new rate as close to target_fs as a ratio of small integers allows. Both ends are
+    extended with the first / last sample, so the anti-aliasing filter does not pull the
+    ends towards zero. Signals at or below target_fs (or target_fs None) are returned unchanged.
+    """
+    if target_fs is None or target_fs >= fs:
+        return x, fs
+    x = np.asarray(x, dtype=np.float64)
+    if fs % target_fs == 0:
+        factor = int(fs // target_fs)
+        y = decimate(x, factor)
+        new_fs = fs / factor
+    else:
+        ratio = Fraction(target_fs / fs).limit_denominator(1000)
+        y = signal.resample_poly(x, ratio.numerator, ratio.denominator, padtype='edge')
+        new_fs = fs * ratio.numerator / ratio.denominator
+    return y, int(new_fs) if float(new_fs).is_integer() else new_fs
+
+
+def ecg_bandpass(fs, lowcut=0.5, highcut=30.0, order=1):
+    """Butterworth band-pass of the Pan-Tompkins preprocessing in 02a_preprocess-ecg.py."""
+    return signal.butter(order, [lowcut / (0.5 * fs), highcut / (0.5 * fs)], btype='band')
+
+
+class EcgPreprocessor:
+    """Band-pass, derivative and squaring of 02a_preprocess-ecg.py, block by block.
+
+    The filter state (zi) and the last filtered sample are carried between blocks, so
+    the concatenated outputs equal signal.lfilter(b, a, x), np.square(np.diff(...)) of
+    the whole signal. The squared derivative of the first block is one sample shorter.
+    """
+
+    def __init__(self, b, a):
+        self.b = b
+        self.a = a
+        self._zi = np.zeros(max(len(a), len(b)) - 1)
+        self._last = None
+
+    def process(self, block):
+        block = np.asarray(block, dtype=np.float64)
+        if len(block) == 0:
+            return np.empty(0), np.empty(0)
+
+        filtered, self._zi = signal.lfilter(self.b, self.a, block, zi=self._zi)
+
+        # Derivative across the block boundary uses the carried last sample; squared in place
+        if self._last is None:
+            derivative = np.diff(filtered)
+        else:
+            derivative = np.empty(len(filtered))
+            derivative[0] = filtered[0] - self._last
+            np.subtract(filtered[1:], filtered[:-1], out=derivative[1:])
+        self._last = filtered[-1]
+
+        return filtered, np.square(derivative, out=derivative)
+
+
+def iter_blocks(x, block_size):
+    # Slices of a memmap are views, so only one block at a time is read into memory
+    for start in range(0, len(x), block_size):
+        yield x[start:start + block_size]
+
+
+def preprocess_ecg_stream(blocks, b, a):
+    """Yield (filtered, squared derivative) for every block of an ECG signal."""
+    preprocessor = EcgPreprocessor(b, a)
+    for block in blocks:
+        yield preprocessor.process(block)
+
+
+def preprocess_ecg(ecg, b, a, block_size=1000000, filtered=None, squared=None):
+    """Filtered ECG and squared derivative of a whole recording, computed block by block.
+
+    Only the two outputs are allocated in full; no full-length intermediates are created.
+    Pass memory-mapped output arrays as filtered / squared to run in constant memory.
+    """
+    if filtered is None:
+        filtered = np.empty(len(ecg))
+    if squared is None:
+        squared = np.empty(max(len(ecg) - 1, 0))
+
+    position = 0
+    for filtered_block, squared_block in preprocess_ecg_stream(iter_blocks(ecg, block_size), b, a):
+        filtered[position:position + len(filtered_block)] = filtered_block
+        start = max(position - 1, 0)
+        squared[start:start + len(squared_block)] = squared_block
+        position += len(filtered_block)
+
+    return filtered, squared
+
+
+class PackedBatch:
+    """Recordings of different length packed into one zero-padded 2-D array.
+
+    Row i holds recording i in its first lengths[i] samples. batch[i] returns that
+    part as a view, so recordings are only unpacked when they are used.
+    """
+
+    def __init__(self, data, lengths):
+        self.data = data
+        self.lengths = np.asarray(lengths)
+
+    @classmethod
+    def pack(cls, recordings):
+        lengths = np.array([len(x) for x in recordings])
+        data = np.zeros((len(recordings), lengths.max() if len(recordings) else 0))
+        for row, x in zip(data, recordings):
+            row[:len(x)] = x
+        return cls(data, lengths)
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def __getitem__(self, i):
+        return self.data[i, :self.lengths[i]]
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+
+def preprocess_ecg_batch(batch, b, a):
+    """Band-pass, derivative and squaring of all recordings of a PackedBatch in one call each.
+
+    The filter is causal, so the zero padding after a recording never changes its samples:
+    every recording comes out exactly as with preprocess_ecg.
+    """
+    filtered = signal.lfilter(b, a, batch.data, axis=1)
+    squared = np.diff(filtered, axis=1)
+    np.square(squared, out=squared)
+    return PackedBatch(filtered, batch.lengths), PackedBatch(squared, np.maximum(batch.lengths - 1, 0))
@@ -0,0 +1,87 @@
+# # Windowed HRV
+# HRV time-courses (e.g. 60 s windows every 5 s) from R-peaks that were detected once
+# for the whole recording. Every window metric is a difference of prefix sums over the
+# RR series (sum, sum of squares, successive differences, ...), so all windows together
+# cost O(number of beats + number of windows) instead of one nk.hrv_time call per window.
+#
+# An RR interval belongs to a window if both of its R-peaks lie within it. The metrics
+# follow the definitions of nk.hrv_time (SDNN and SDSD with ddof=1, pNN50 relative to the
+# number of RR intervals); HR_Mean is the mean instantaneous heart rate (60000 / RR).
+
+import numpy as np
+import pandas as pd
+
+METRICS = ['HR_Mean', 'HRV_MeanNN', 'HRV_SDNN', 'HRV_RMSSD', 'HRV_SDSD', 'HRV_pNN50', 'HRV_pNN20']
+
+
+def _prefix(values):
+    # Prefix sums with a leading 0, so the sum of values[i:j] is prefix[j] - prefix[i]
+    return np.concatenate([[0.0], np.cumsum(values, dtype=np.float64)])
+
+
+def window_starts(duration, window=60, step=5):
+    """Start times (s) of all complete windows of a recording of the given duration (s)."""
+    if duration < window:
+        return np.empty(0)
+    return np.arange(0, duration - window + 1e-9, step)
+
+
+def windowed_hrv(peaks, sampling_rate=1000, window=60, step=5, duration=None, min_beats=3):
+    """HRV metrics of sliding windows over a recording.
+
+    peaks are R-peak sample indices, window and step in seconds; duration (s) defaults
+    to the last R-peak. Returns one row per window with its start and end time (s), the
+    number of RR intervals and METRICS (NaN where a window has fewer than min_beats
+    intervals).
+    """
+    peaks = np.sort(np.asarray(peaks))
+    times = peaks / sampling_rate
+    if duration is None:
+        duration = times[-1] if len(times) else 0.0
+    starts = window_starts(duration, window, step)
+    ends = starts + window
+
+    rr = np.diff(peaks) / sampling_rate * 1000  # ms, computed as in nk.hrv_time
+    diff = np.diff(rr)
+
+    # Centred on the overall mean, so the sums of squares do not lose precision
+    offset = rr.mean() if len(rr) else 0.0
+    centred = rr - offset
+    sum_rr, sum_rr2 = _prefix(centred), _prefix(centred ** 2)
+    sum_hr = _prefix(60000 / rr)
+    sum_diff, sum_diff2 = _prefix(diff), _prefix(diff ** 2)
+    sum_nn50, sum_nn20 = _prefix(np.abs(diff) > 50), _prefix(np.abs(diff) > 20)
+
+    # Intervals first .. last - 1 (and their successive differences first .. last - 2) lie in the window
+    first = np.searchsorted(times, starts, side='left')
+    last = np.maximum(np.searchsorted(times, ends, side='right') - 1, first)
+    n = last - first
+    n_diff = np.maximum(n - 1, 0)
+
+    # Windows after the last R-peak have no intervals (n = 0, NaN below); clamp their
+    # indices into the prefix sums, which is a no-op for every other window
+    first, last = np.minimum(first, len(rr)), np.minimum(last, len(rr))
+    first_diff = np.minimum(first, len(diff))
+    last_diff = first_diff + np.minimum(n_diff, len(diff) - first_diff)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = (sum_rr[last] - sum_rr[first]) / n
+        sdnn = np.sqrt(np.maximum((sum_rr2[last] - sum_rr2[first] - n * mean ** 2) / (n - 1), 0))
+        mean_diff = (sum_diff[last_diff] - sum_diff[first_diff]) / n_diff
+        squares_diff = sum_diff2[last_diff] - sum_diff2[first_diff]
+        sdsd = np.sqrt(np.maximum((squares_diff - n_diff * mean_diff ** 2) / (n_diff - 1), 0))
+
+        results = pd.DataFrame({
+            "Window_Start": starts,
+            "Window_End": ends,
+            "N_Intervals": n,
+            "HR_Mean": (sum_hr[last] - sum_hr[first]) / n,
+            "HRV_MeanNN": mean + offset,
+            "HRV_SDNN": sdnn,
+            "HRV_RMSSD": np.sqrt(squares_diff / n_diff),
+            "HRV_SDSD": sdsd,
+            "HRV_pNN50": (sum_nn50[last_diff] - sum_nn50[first_diff]) / n * 100,
+            "HRV_pNN20": (sum_nn20[last_diff] - sum_nn20[first_diff]) / n * 100,
+        })
+    results.loc[n < min_beats, METRICS] = np.nan
+    return results
@@ -0,0 +1,140 @@
+# # Intraclass correlations
+# ICC(1), ICC(2,1) and ICC(3,1) (Shrout & Fleiss) of every metric of a results table,
+# with participants as targets and conditions as raters. 05a_ICC-ecg.ipynb fitted an
+# OLS model and an ANOVA table per metric; the mean squares of that two-way ANOVA are
+# sums over the participant x condition matrix, so here they are computed directly for
+# all metrics at once (values[participant, condition, metric], see summary.py).
+#
+# Bootstrap confidence intervals resample participants. A resample only changes how often
+# every participant is counted, so the mean squares of a whole batch of resamples are a
+# few matrix products of the resample counts with per-participant sums. Batches can run
+# on several cores with parallel.run_jobs.
+#
+# Per metric only participants with a value in every condition are used.
+
+import warnings
+
+import numpy as np
+import pandas as pd
+
+import parallel
+
+FORMS = ['ICC1', 'ICC2_1', 'ICC3_1']
+
+
+def _mean_squares(y, counts):
+    """Two-way ANOVA mean squares of y[participant, condition, metric] (no NaN).
+
+    counts[resample, participant] says how often each participant is counted; returns
+    n and MSR (participants), MSC (conditions), MSE (error), MSW (within participants),
+    each as a [resample, metric] array.
+    """
+    n_participants, k, n_metrics = y.shape
+    n = counts.sum(axis=1)[:, None]
+
+    rows = y.mean(axis=1)
+    grand = counts @ rows / n
+    columns = (counts @ y.reshape(n_participants, -1)).reshape(len(counts), k, n_metrics) / n[:, :, None]
+
+    ss_rows = k * (counts @ rows ** 2 - n * grand ** 2)
+    ss_columns = n * ((columns - grand[:, None, :]) ** 2).sum(axis=1)
+    ss_total = counts @ (y ** 2).sum(axis=1) - n * k * grand ** 2
+    ss_error = ss_total - ss_rows - ss_columns
+    ss_within = ss_total - ss_rows
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return {
+            "n": n,
+            "MSR": ss_rows / (n - 1),
+            "MSC": ss_columns / (k - 1),
+            "MSE": ss_error / ((n - 1) * (k - 1)),
+            "MSW": ss_within / (n * (k - 1)),
+        }
+
+
+def _forms(ms, k):
+    n, msr, msc, mse, msw = ms["n"], ms["MSR"], ms["MSC"], ms["MSE"], ms["MSW"]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return {
+            "ICC1": (msr - msw) / (msr + (k - 1) * msw),
+            "ICC2_1": (msr - mse) / (msr + (k - 1) * mse + k * (msc - mse) / n),
+            "ICC3_1": (msr - mse) / (msr + (k - 1) * mse),
+        }
+
+
+def _groups(values):
+    """Metrics grouped by their complete participants: [(participant mask, metric indices)]."""
+    complete = ~np.isnan(values).any(axis=1)  # [participant, metric]
+    patterns, inverse = np.unique(complete.T, axis=0, return_inverse=True)
+    return [(pattern, np.flatnonzero(inverse.ravel() == i)) for i, pattern in enumerate(patterns)]
+
+
+def _centred(values, participants, metrics):
+    # Centring per metric keeps the sums of squares precise; the ICCs do not change
+    y = values[participants][:, :, metrics]
+    return y - y.mean(axis=(0, 1))
+
+
+def icc(values):
+    """ICC forms of values[participant, condition, metric]: {form: [metric] array, 'n': [metric] array}."""
+    k, n_metrics = values.shape[1], values.shape[2]
+    results = {form: np.full(n_metrics, np.nan) for form in FORMS}
+    results["n"] = np.zeros(n_metrics, dtype=int)
+    for participants, metrics in _groups(values):
+        if participants.sum() < 2:
+            continue
+        y = _centred(values, participants, metrics)
+        forms = _forms(_mean_squares(y, np.ones((1, len(y)))), k)
+        for form in FORMS:
+            results[form][metrics] = forms[form][0]
+        results["n"][metrics] = len(y)
+    return results
+
+
+def _bootstrap_chunk(values, n_resamples, seed):
+    """ICC forms of n_resamples participant resamples: {form: [resample, metric] array}."""
+    rng = np.random.default_rng(seed)
+    k, n_metrics = values.shape[1], values.shape[2]
+    results = {form: np.full((n_resamples, n_metrics), np.nan) for form in FORMS}
+    for participants, metrics in _groups(values):
+        n = participants.sum()
+        if n < 2:
+            continue
+        y = _centred(values, participants, metrics)
+        counts = rng.multinomial(n, np.full(n, 1 / n), size=n_resamples).astype(np.float64)
+        forms = _forms(_mean_squares(y, counts), k)
+        for form in FORMS:
+            results[form][:, metrics] = forms[form]
+    return results
+
+
+def bootstrap(values, n_resamples=2000, seed=0, n_workers=1, chunk_size=500):
+    """ICC forms of participant resamples: {form: [resample, metric] array}.
+
+    The resamples are drawn in chunks of chunk_size with their own seeds (derived from
+    seed), so the result does not depend on n_workers.
+    """
+    sizes = [min(chunk_size, n_resamples - start) for start in range(0, n_resamples, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    jobs = [{"values": values, "n_resamples": size, "seed": chunk_seed} for size, chunk_seed in zip(sizes, seeds)]
+    chunks = parallel.run_jobs(_bootstrap_chunk, jobs, n_workers=n_workers)
+    return {form: np.concatenate([chunk[form] for chunk in chunks]) for form in FORMS}
+
+
+def icc_table(values, metrics, n_resamples=2000, confidence=0.95, seed=0, n_workers=1):
+    """ICCs with percentile bootstrap confidence intervals, one row per metric."""
+    estimates = icc(values)
+    table = pd.DataFrame({"n": estimates["n"]}, index=pd.Index(metrics, name='Metric'))
+    samples = bootstrap(values, n_resamples, seed, n_workers) if n_resamples else None
+
+    tail = (1 - confidence) / 2 * 100
+    for form in FORMS:
+        table[form] = estimates[form]
+        if samples is not None:
+            with warnings.catch_warnings():
+                # Metrics without enough participants have no resamples (NaN)
+                warnings.simplefilter('ignore', RuntimeWarning)
+                low, high = np.nanpercentile(samples[form], [tail, 100 - tail], axis=0)
+            table[f"{form}_CI_Low"] = low
+            table[f"{form}_CI_High"] = high
+    return table
@@ -0,0 +1,74 @@
+# # Import OpenSignals recordings
+# Converts one OpenSignals .txt file into the binary signal store, either with the
+# streaming reader in opensignals.py (default) or with OpenSignalsReader, which reads
+# the whole file at once but can show its plots. import_all runs
+# the conversion for a list of recordings, either one after the other or on a
+# process pool. Both paths call the same function, so their output is identical.
+# Every imported recording is screened for signal quality right away (see qc.py).
+
+import os
+import time
+
+from opensignalsreader import OpenSignalsReader
+
+import opensignals
+import parallel
+import qc
+import signal_store
+
+
+def import_recording(source_folder, raw_folder, participant, task, session=None, channels=None,
+                     show=False, export_csv=False, parser='stream'):
+    """Convert one recording; channels maps output channel names to OpenSignals channels/labels."""
+    start = time.perf_counter()
+
+    name = signal_store.recording_name(participant, task, session)
+    filename = os.path.join(source_folder, name + '.txt')
+
+    if parser == 'stream':
+        meta = opensignals.convert_to_store(filename, raw_folder, name, channels, participant=participant,
+                                            task=task, session=session)
+        if export_csv:
+            signal_store.export_recording_csv(raw_folder, name)
+    elif parser == 'opensignalsreader':
+        acq = OpenSignalsReader(filename, show=show)
+        signals = {label: acq.signal(selector) for label, selector in channels.items()}
+        meta = signal_store.write_recording(raw_folder, name, signals, sampling_rate=acq.sampling_rate,
+                                            participant=participant, task=task, session=session,
+                                            export_csv=export_csv)
+    else:
+        raise ValueError(f"Unknown parser '{parser}', use 'stream' or 'opensignalsreader'.")
+
+    # Quality records of every channel, stored in the sidecar
+    quality = qc.check_recording(raw_folder, name)
+
+    return {
+        "name": name,
+        "source": filename,
+        "n_samples": meta["n_samples"],
+        "qc": {channel: record["status"] for channel, record in quality.items()},
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def _report(job, result):
+    quality = ', '.join(f"{channel} {status}" for channel, status in result['qc'].items())
+    print(f"Wrote recording {result['name']} ({result['n_samples']} samples, QC: {quality}) "
+          f"in {result['seconds']:.2f} s")
+
+
+def import_all(jobs, n_workers=1):
+    """Import all recordings; with n_workers > 1 they are spread over a process pool."""
+    jobs = list(jobs)
+
+    # Plots cannot be shown from worker processes
+    if n_workers > 1:
+        jobs = [dict(job, show=False) for job in jobs]
+
+    start = time.perf_counter()
+    results = parallel.run_jobs(import_recording, jobs, n_workers=n_workers, callback=_report)
+
+    busy = sum(result["seconds"] for result in results)
+    print(f"Imported {len(results)} recordings in {time.perf_counter() - start:.2f} s "
+          f"({busy:.2f} s of conversion, {n_workers} worker(s))")
+    return results
@@ -0,0 +1,207 @@
+# # Run instrumentation
+# Opt-in measurements of where a batch spends its time and memory. Code marks its
+# stages with `with instrument.stage('nk.ecg_process'):`; when instrumentation is off
+# (the default) that does nothing. Once enable() was called, every stage records its
+# wall time, CPU time, the peak resident memory (RSS) of the process so far and,
+# with trace_memory=True, the peak of the memory allocated by Python and NumPy within
+# the stage (tracemalloc, slower).
+#
+# instrument.run_jobs works like parallel.run_jobs but measures every job as one
+# 'recording' and sends the measurements from the worker processes back to the main
+# process, which writes them as a JSON run report and prints a short summary.
+
+import datetime
+import functools
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import parallel
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_recorder = None
+
+
+class Recorder:
+    """Collects one record (a dict) per finished stage."""
+
+    def __init__(self, trace_memory=False, labels=None):
+        self.trace_memory = trace_memory
+        self.labels = labels or {}
+        self.records = []
+        self._stack = []  # Names and traced peaks of the running stages
+
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+
+def enable(trace_memory=False):
+    """Switch instrumentation on for this process; returns the Recorder."""
+    global _recorder
+    _recorder = Recorder(trace_memory)
+    return _recorder
+
+
+def disable():
+    global _recorder
+    _recorder = None
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def is_enabled():
+    return _recorder is not None
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process so far (None where it cannot be measured)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes on Linux
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+
+@contextmanager
+def stage(name, **labels):
+    """Measure the enclosed code as one stage (no-op unless instrumentation is enabled)."""
+    recorder = _recorder
+    if recorder is None:
+        yield
+        return
+
+    # A nested stage resets the tracemalloc peak, so the enclosing stage keeps its peak so far
+    if recorder.trace_memory:
+        if recorder._stack:
+            recorder._stack[-1][1] = max(recorder._stack[-1][1], tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+    recorder._stack.append([name, 0])
+
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        yield
+    finally:
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+        path = '/'.join(frame[0] for frame in recorder._stack)
+        traced = None
+        if recorder.trace_memory:
+            traced = max(recorder._stack[-1][1], tracemalloc.get_traced_memory()[1])
+        recorder._stack.pop()
+        if recorder.trace_memory:
+            if recorder._stack:
+                recorder._stack[-1][1] = max(recorder._stack[-1][1], traced)
+            tracemalloc.reset_peak()
+
+        recorder.records.append(dict(recorder.labels, **labels, stage=path, wall_s=wall, cpu_s=cpu,
+                                     peak_rss_mb=peak_rss_mb(),
+                                     traced_peak_mb=None if traced is None else traced / 1024 ** 2))
+
+
+def call(func, trace_memory=False, group=None, **job):
+    """Run func(**job) as one measured 'recording'; returns (result, records).
+
+    Used by run_jobs, in the worker process, with its own Recorder.
+    """
+    global _recorder
+    outer = _recorder
+    labels = {key: job[key] for key in ('participant', 'task') if key in job}
+    if group is not None:
+        labels['group'] = group
+    _recorder = Recorder(trace_memory, labels)
+    try:
+        with stage('recording'):
+            result = func(**job)
+        return result, _recorder.records
+    finally:
+        _recorder = outer
+
+
+def run_jobs(func, jobs, n_workers=1, callback=None, capture_errors=False, group=None):
+    """parallel.run_jobs, with every job measured when instrumentation is enabled.
+
+    The measurements of the jobs are added to this process's records (those of jobs
+    that raise are lost with the job); the results are returned as by parallel.run_jobs.
+    """
+    if _recorder is None:
+        return parallel.run_jobs(func, jobs, n_workers=n_workers, callback=callback, capture_errors=capture_errors)
+
+    def unwrap(output):
+        if isinstance(output, parallel.JobError):
+            return output
+        result, records = output
+        return result
+
+    measured = functools.partial(call, func, _recorder.trace_memory, group)
+    outputs = parallel.run_jobs(measured, jobs, n_workers=n_workers, capture_errors=capture_errors,
+                                callback=None if callback is None else lambda job, output: callback(job, unwrap(output)))
+    for output in outputs:
+        if not isinstance(output, parallel.JobError):
+            _recorder.records.extend(output[1])
+    return [unwrap(output) for output in outputs]
+
+
+def summarize(records):
+    """Totals per stage (prefixed with the group of run_jobs), slowest first."""
+    stages = {}
+    for record in records:
+        name = '/'.join(filter(None, [record.get("group"), record["stage"]]))
+        total = stages.setdefault(name, {"stage": name, "count": 0, "wall_s": 0.0, "cpu_s": 0.0,
+                                         "max_wall_s": 0.0, "peak_rss_mb": None, "traced_peak_mb": None})
+        total["count"] += 1
+        total["wall_s"] += record["wall_s"]
+        total["cpu_s"] += record["cpu_s"]
+        total["max_wall_s"] = max(total["max_wall_s"], record["wall_s"])
+        for key in ("peak_rss_mb", "traced_peak_mb"):
+            if record[key] is not None:
+                total[key] = max(total[key] or 0, record[key])
+    return sorted(stages.values(), key=lambda total: -total["wall_s"])
+
+
+def report(extra=None):
+    """The run report: run information, all records and the totals per stage."""
+    records = _recorder.records if _recorder is not None else []
+    return {
+        "run": dict({
+            "finished": datetime.datetime.now().isoformat(timespec='seconds'),
+            "machine": platform.node(),
+            "python": platform.python_version(),
+            "argv": sys.argv,
+        }, **(extra or {})),
+        "stages": summarize(records),
+        "records": records,
+    }
+
+
+def write_report(filename, extra=None):
+    with open(filename + '.tmp', 'w') as f:
+        json.dump(report(extra), f, indent=1)
+    # Replace an older report only once the new one is complete
+    os.replace(filename + '.tmp', filename)
+    return filename
+
+
+def print_summary(n=5):
+    """Print the slowest recordings and the stages that took the most time in total."""
+    records = _recorder.records if _recorder is not None else []
+    recordings = sorted((record for record in records if record["stage"] == 'recording'),
+                        key=lambda record: -record["wall_s"])
+    if recordings:
+        print("Slowest recordings:")
+        for record in recordings[:n]:
+            print(f"  {record.get('group', ''):16s} {record.get('participant', '')} {record.get('task', '')}: "
+                  f"{record['wall_s']:.2f} s wall, {record['cpu_s']:.2f} s CPU, "
+                  f"peak RSS {record['peak_rss_mb'] or float('nan'):.0f} MB")
+
+    print("Time per stage:")
+    for total in summarize(records)[:2 * n]:
+        traced = '' if total["traced_peak_mb"] is None else f", traced peak {total['traced_peak_mb']:.0f} MB"
+        print(f"  {total['stage']:50s} {total['count']:4d}x  {total['wall_s']:8.2f} s wall "
+              f"{total['cpu_s']:8.2f} s CPU (max {total['max_wall_s']:.2f} s){traced}")
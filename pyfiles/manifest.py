@@ -0,0 +1,151 @@
+# # Dataset manifest
+# One scan of the source folder (OpenSignals .txt files) and / or the raw data folder
+# (signal store sidecars) lists every recording with its participant, task, session,
+# channels (modalities), path, size on disk, sample count and signal quality (see qc.py,
+# raw data folder only). The scripts iterate over
+# the manifest instead of hard-coded participant / task lists, so recordings that are
+# missing are simply not listed and new ones are picked up without code changes.
+#
+# The manifest of the raw data folder is kept in <raw_folder>/manifest.json and is
+# rebuilt when the folder changed since it was written.
+
+import json
+import os
+import re
+
+import opensignals
+import signal_store
+
+MANIFEST_FILE = 'manifest.json'
+
+
+def parse_name(name):
+    """Split a recording name (sub-1_baseline, sub-01_base-ground) into participant, task, session."""
+    participant, _, rest = name.partition('_')
+    if not rest:
+        raise ValueError(f"'{name}' is not a recording name of the form participant_task[-session]")
+    task, _, session = rest.partition('-')
+    return participant, task, session or None
+
+
+def sort_key(entry):
+    # Natural order, so sub-2 comes before sub-10
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', entry["name"])]
+
+
+def scan_source(source_folder):
+    """List the OpenSignals recordings of the source folder (header only, samples are not counted)."""
+    entries = []
+    for filename in os.listdir(source_folder):
+        if not filename.endswith('.txt'):
+            continue
+        name = filename[:-len('.txt')]
+        path = os.path.join(source_folder, filename)
+        try:
+            participant, task, session = parse_name(name)
+            with open(path) as f:
+                header = opensignals.read_header(f)
+        except (ValueError, TypeError) as error:
+            print(f"Skipping {path}: {error}")
+            continue
+
+        entries.append({
+            "name": name,
+            "participant": participant,
+            "task": task,
+            "session": session,
+            "channels": header["sensors"],
+            "sampling_rate": header["sampling_rate"],
+            "n_samples": None,
+            "path": path,
+            "size": os.path.getsize(path),
+        })
+    return sorted(entries, key=sort_key)
+
+
+def scan_raw(raw_folder):
+    """List the recordings of the signal store in raw_folder from their sidecars."""
+    entries = []
+    for filename in os.listdir(raw_folder):
+        if not filename.endswith('.json') or filename == MANIFEST_FILE:
+            continue
+        name = filename[:-len('.json')]
+        meta = signal_store.read_sidecar(raw_folder, name)
+
+        # Sidecars written by the importer carry participant / task / session
+        if meta.get("participant") is None:
+            meta["participant"], meta["task"], meta["session"] = parse_name(name)
+
+        entries.append({
+            "name": name,
+            "participant": meta["participant"],
+            "task": meta["task"],
+            "session": meta["session"],
+            "channels": [channel.upper() for channel in meta["channels"]],
+            "sampling_rate": meta["sampling_rate"],
+            "n_samples": meta["n_samples"],
+            "path": signal_store.sidecar_path(raw_folder, name),
+            "size": sum(os.path.getsize(signal_store.channel_path(raw_folder, name, channel))
+                        for channel in meta["channels"]),
+            "qc": meta.get("qc"),
+        })
+    return sorted(entries, key=sort_key)
+
+
+def build(raw_folder):
+    """Scan raw_folder and write its manifest.json; returns the entries."""
+    entries = scan_raw(raw_folder)
+    filename = os.path.join(raw_folder, MANIFEST_FILE)
+    with open(filename + '.tmp', 'w') as f:
+        json.dump(entries, f, indent=1)
+    os.replace(filename + '.tmp', filename)
+
+    # Writing the manifest changed the folder itself; date the manifest to that change
+    folder_mtime = os.stat(raw_folder).st_mtime_ns
+    os.utime(filename, ns=(folder_mtime, folder_mtime))
+    return entries
+
+
+def load(raw_folder):
+    """Entries of the manifest of raw_folder, rebuilt if recordings were added or removed since."""
+    filename = os.path.join(raw_folder, MANIFEST_FILE)
+
+    # Adding, removing or replacing a file (sidecars are replaced atomically) updates the folder's mtime
+    if os.path.exists(filename) and os.stat(filename).st_mtime_ns >= os.stat(raw_folder).st_mtime_ns:
+        with open(filename) as f:
+            return json.load(f)
+    return build(raw_folder)
+
+
+def select(entries, participants=None, tasks=None, sessions=None, modality=None):
+    """Entries restricted to the given participants / tasks / sessions and having a channel."""
+    return [entry for entry in entries
+            if (participants is None or entry["participant"] in participants)
+            and (tasks is None or entry["task"] in tasks)
+            and (sessions is None or entry["session"] in sessions)
+            and (modality is None or modality.upper() in entry["channels"])]
+
+
+def shard(entries, n_shards, index):
+    """Part index (0 .. n_shards - 1) of the entries, with shards balanced by size on disk.
+
+    Largest recordings are assigned first, each to the shard with the least data so far;
+    the result is deterministic, so independent workers can each pick their own shard.
+    """
+    if not 0 <= index < n_shards:
+        raise ValueError(f"Shard index {index} out of range for {n_shards} shards")
+
+    loads = [0] * n_shards
+    assigned = [[] for _ in range(n_shards)]
+    for entry in sorted(entries, key=lambda entry: (-entry["size"], sort_key(entry))):
+        target = loads.index(min(loads))
+        assigned[target].append(entry)
+        loads[target] += entry["size"]
+    return sorted(assigned[index], key=sort_key)
+
+
+if __name__ == '__main__':
+    import sys
+    for entry in load(sys.argv[1]):
+        print(f"{entry['name']:30s} {','.join(entry['channels']):12s} {entry['n_samples']:>12} samples "
+              f"{entry['size'] / 1e6:10.1f} MB")
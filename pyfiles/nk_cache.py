@@ -0,0 +1,145 @@
+# # Cache for nk.ecg_process / nk.eda_process
+# The processing outputs (signals_full and info) are stored on disk under a key
+# computed from the input signal and the processing parameters (kind, sampling rate,
+# method, neurokit2 version). Re-running a script only recomputes recordings whose
+# input or parameters changed. Entries are .npz files with the signals in compact form
+# (float32 traces, event index arrays, see compact.py) and the info arrays; the least
+# recently used entries are removed once the cache grows beyond max_bytes.
+#
+# process_compact returns the compact signals, process the NeuroKit DataFrame. Both go
+# through the compact form, also without a cache, so results never depend on whether an
+# entry was found.
+
+import hashlib
+import io
+import json
+import os
+
+import neurokit2 as nk
+import numpy as np
+
+import compact
+
+# Default size limit of the cache folder
+MAX_BYTES = 2 * 1024 ** 3
+
+PROCESS_FUNCTIONS = {
+    'ecg': nk.ecg_process,
+    'eda': nk.eda_process,
+}
+
+
+def cache_key(kind, signal, sampling_rate, method):
+    """Content hash of the input signal plus the processing parameters."""
+    h = hashlib.sha256()
+    h.update(memoryview(np.ascontiguousarray(signal, dtype='<f8')).cast('B'))
+    params = {"kind": kind, "sampling_rate": sampling_rate, "method": method, "neurokit2": nk.__version__,
+              "schema": compact.SCHEMA}
+    h.update(json.dumps(params, sort_keys=True).encode())
+    return h.hexdigest()
+
+
+def entry_path(cache_folder, key):
+    return os.path.join(cache_folder, key + '.npz')
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"Cannot store {type(value)} in the cache")
+
+
+def save(cache_folder, key, signals, info):
+    """Store compact signals (compact.Signals) and their info under a key."""
+    os.makedirs(cache_folder, exist_ok=True)
+
+    # Array-like info entries become arrays, everything else goes into a JSON string
+    arrays = {f"signals/{name}": array for name, array in signals.to_arrays().items()}
+    scalars = {}
+    for name, value in info.items():
+        if isinstance(value, (np.ndarray, list)) and np.asarray(value).dtype != object:
+            arrays[f"info/{name}"] = np.asarray(value)
+        else:
+            scalars[name] = value
+    arrays["info"] = np.array(json.dumps(scalars, default=_json_default))
+
+    # Write to a temporary file first so an interrupted run never leaves a broken entry
+    buffer = io.BytesIO()
+    np.savez(buffer, **arrays)
+    filename = entry_path(cache_folder, key)
+    with open(filename + '.tmp', 'wb') as f:
+        f.write(buffer.getbuffer())
+    os.replace(filename + '.tmp', filename)
+
+
+def load(cache_folder, key):
+    """Return (compact signals, info) for a key, or None if it is not cached."""
+    filename = entry_path(cache_folder, key)
+    # Parallel workers share the cache, so an entry can be evicted by another one at any time
+    # (once opened it stays readable)
+    try:
+        data = np.load(filename, allow_pickle=False)
+    except FileNotFoundError:
+        return None
+
+    with data:
+        signals = compact.Signals.from_arrays({name[len("signals/"):]: data[name] for name in data.files
+                                               if name.startswith("signals/")})
+        info = json.loads(str(data["info"]))
+        for name in data.files:
+            if name.startswith("info/"):
+                info[name[len("info/"):]] = data[name]
+
+    # Mark the entry as recently used
+    try:
+        os.utime(filename)
+    except FileNotFoundError:
+        pass
+    return signals, info
+
+
+def evict(cache_folder, max_bytes=MAX_BYTES):
+    """Remove the least recently used entries until the cache is smaller than max_bytes."""
+    # Other workers may evict the same entries at the same time: ones that are gone are skipped
+    entries = []
+    for name in os.listdir(cache_folder):
+        if name.endswith('.npz'):
+            try:
+                stat = os.stat(os.path.join(cache_folder, name))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, name in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(os.path.join(cache_folder, name))
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def process_compact(kind, signal, sampling_rate=1000, method='neurokit', cache_folder=None, max_bytes=MAX_BYTES):
+    """Cached nk.ecg_process (kind='ecg') or nk.eda_process (kind='eda'); returns (compact.Signals, info)."""
+    key = cache_key(kind, signal, sampling_rate, method) if cache_folder is not None else None
+    if key is not None:
+        cached = load(cache_folder, key)
+        if cached is not None:
+            return cached
+
+    signals, info = PROCESS_FUNCTIONS[kind](signal, sampling_rate=sampling_rate, method=method)
+    signals = compact.Signals.from_dataframe(signals)
+    if key is not None:
+        save(cache_folder, key, signals, info)
+        evict(cache_folder, max_bytes)
+    return signals, info
+
+
+def process(kind, signal, sampling_rate=1000, method='neurokit', cache_folder=None, max_bytes=MAX_BYTES):
+    """As process_compact, with the signals as the NeuroKit DataFrame."""
+    signals, info = process_compact(kind, signal, sampling_rate, method, cache_folder, max_bytes)
+    return signals.to_dataframe(), info
@@ -0,0 +1,130 @@
+# # Streaming OpenSignals reader
+# OpenSignalsReader parses the whole .txt file into memory before a single channel
+# can be accessed. This reader parses the header once, then reads the sample block
+# in fixed-size chunks and converts every channel of a chunk at the same time, so
+# memory use stays flat no matter how long the session is.
+
+import json
+
+import numpy as np
+
+import signal_store
+
+# Samples (lines) per chunk; ~100 s at 1000 Hz
+CHUNK_SIZE = 100000
+
+# BITalino (r)evolution transfer functions (raw ADC value -> original unit),
+# same formulas as opensignalsreader.transfer_functions.bit
+VCC = 3.3
+TRANSFER_FUNCTIONS = {
+    'ECG': lambda adc, n: (((adc / 2 ** n) - 0.5) * VCC) / 1100 * 1000,  # mV
+    'EMG': lambda adc, n: (((adc / 2 ** n) - 0.5) * VCC) / 1009 * 1000,  # mV
+    'EDA': lambda adc, n: ((adc / 2 ** n) * VCC) / 0.132,  # µS
+}
+
+
+def read_header(f):
+    """Read the header of an open OpenSignals file and leave f at the first sample line."""
+    if 'OpenSignals' not in f.readline():
+        raise TypeError("Provided file does not seem to be an OpenSignals (r)evolution file.")
+
+    metadata = json.loads(f.readline().replace('#', '', 1))
+    device = metadata[list(metadata)[0]]
+    if device['device'] == 'biosignalsplux':
+        raise ValueError("Expected acquisition data from 'BITalino' device, but received from 'biosignalsplux'.")
+
+    # Skip the remaining header lines (e.g. '# EndOfHeader')
+    position = f.tell()
+    line = f.readline()
+    while line.startswith('#'):
+        position = f.tell()
+        line = f.readline()
+    f.seek(position)
+
+    # Sensor names without the BIT / BITREV suffix, duplicates numbered like OpenSignalsReader does
+    sensors = []
+    for sensor in device['sensor']:
+        sensor = str(sensor).replace('BITREV', '').replace('BIT', '')
+        name, inc = sensor, 1
+        while name in sensors:
+            name = sensor + str(inc)
+            inc += 1
+        sensors.append(name)
+
+    # The analog channels are the last columns, in the order of the sensors
+    n_columns = len(device['column'])
+    n_sensors = len(sensors)
+    return {
+        "sampling_rate": device['sampling rate'],
+        "sensors": sensors,
+        "channels": list(device['channels']),
+        "labels": [str(x) for x in device['label']],
+        "columns": {sensor: n_columns - n_sensors + i for i, sensor in enumerate(sensors)},
+        "resolutions": {sensor: int(device['resolution'][n_columns - n_sensors + i])
+                        for i, sensor in enumerate(sensors)},
+        "n_columns": n_columns,
+    }
+
+
+def resolve_sensor(header, selector):
+    """Map an OpenSignals channel number (int) or sensor label (str) to a sensor name."""
+    if isinstance(selector, int):
+        if selector not in header["channels"]:
+            raise ValueError(f"Could not find channel {selector} in available channels.")
+        return header["sensors"][header["channels"].index(selector)]
+    if selector not in header["sensors"]:
+        raise ValueError(f"Could not find '{selector}' in available sensor data.")
+    return selector
+
+
+def convert(sensor, samples, resolution):
+    """Convert raw ADC samples to the sensor's original unit (unknown sensors stay raw)."""
+    kind = ''.join(x for x in sensor if not x.isdigit())
+    if kind in TRANSFER_FUNCTIONS:
+        return TRANSFER_FUNCTIONS[kind](samples, resolution)
+    return samples
+
+
+def iter_blocks(f, header, chunk_size=CHUNK_SIZE):
+    """Yield the sample block as (n, n_columns) arrays of at most chunk_size lines."""
+    # ~ 6 characters per value and line is a generous estimate of the line length
+    chunk_chars = chunk_size * header["n_columns"] * 6
+    rest = ''
+    while True:
+        text = f.read(chunk_chars)
+        if not text:
+            break
+
+        # Only parse complete lines, the incomplete last one goes into the next chunk
+        text = rest + text
+        end = text.rfind('\n') + 1
+        text, rest = text[:end], text[end:]
+        if text:
+            yield np.fromstring(text, dtype=np.float64, sep=' ').reshape(-1, header["n_columns"])
+
+    if rest.strip():
+        yield np.fromstring(rest, dtype=np.float64, sep=' ').reshape(-1, header["n_columns"])
+
+
+def convert_to_store(filename, raw_folder, name, channels, participant=None, task=None, session=None,
+                     chunk_size=CHUNK_SIZE):
+    """Stream an OpenSignals file into the signal store in one pass.
+
+    channels maps output channel names to OpenSignals channel numbers or sensor labels,
+    e.g. {'ECG': 1, 'EDA': 2}.
+    """
+    with open(filename, 'r') as f:
+        header = read_header(f)
+        sensors = {label: resolve_sensor(header, selector) for label, selector in channels.items()}
+
+        with signal_store.RecordingWriter(raw_folder, name, channels, header["sampling_rate"],
+                                          participant, task, session) as writer:
+            for block in iter_blocks(f, header, chunk_size):
+                writer.append({
+                    label: convert(sensor, block[:, header["columns"][sensor]], header["resolutions"][sensor])
+                    for label, sensor in sensors.items()
+                })
+            # ADC resolutions go into the sidecar, for the saturation check of qc.py
+            writer.meta["resolutions"] = {label: header["resolutions"][sensor] for label, sensor in sensors.items()}
+
+    return writer.meta
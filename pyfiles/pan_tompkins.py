@@ -0,0 +1,165 @@
+# # Pan-Tompkins R-peak detection
+# Completes the preprocessing of 02a_preprocess-ecg.py (band-pass, derivative, squaring)
+# with the last steps of the Pan-Tompkins algorithm: moving-window integration and
+# adaptive dual thresholds with search-back. The heavy parts are vectorized (the
+# integration is one cumulative sum, candidate peaks and the R-peak positions are found
+# for all beats at once); only the threshold update runs per candidate peak.
+#
+# Pan, J., & Tompkins, W. J. (1985). A real-time QRS detection algorithm.
+# IEEE Transactions on Biomedical Engineering, 32(3), 230-236.
+
+import numpy as np
+import scipy.signal as signal
+
+import filters
+
+# Integration window and refractory period (seconds)
+WINDOW = 0.150
+REFRACTORY = 0.200
+
+# A beat later than this many average RR intervals triggers a search-back
+SEARCH_BACK_RR = 1.66
+
+# Beats within this time of the previous one need a comparable slope (T-wave check)
+T_WAVE_WINDOW = 0.360
+
+
+def moving_window_integration(x, width):
+    """Mean of the last width samples at every sample (a causal moving average).
+
+    Computed from one cumulative sum instead of a convolution; the first width - 1
+    outputs average over fewer samples, as if x were preceded by zeros.
+    """
+    integrated = np.cumsum(x, dtype=np.float64)
+    integrated[width:] -= integrated[:-width].copy()
+    integrated /= width
+    return integrated
+
+
+class AdaptiveThresholds:
+    """Classify candidate peaks of the integrated signal into QRS complexes and noise.
+
+    Running estimates of the signal (SPKI) and noise (NPKI) peak levels set the
+    threshold NPKI + 0.25 (SPKI - NPKI). When no beat was found for 1.66 average RR
+    intervals, the largest skipped candidate above half the threshold is accepted.
+    Candidates are passed one at a time, in order, so the same state serves the offline
+    detector and the online one in realtime_hr.py.
+    """
+
+    def __init__(self, spki, npki, sampling_rate, refractory):
+        self.spki = spki
+        self.npki = npki
+        self.sampling_rate = sampling_rate
+        self.refractory = refractory
+        self.rr = []
+        self._skipped = []  # (position, height, slope) since the last beat
+        self._last = None  # (position, slope) of the last beat
+
+    @property
+    def threshold(self):
+        return self.npki + 0.25 * (self.spki - self.npki)
+
+    def _accept(self, position, slope):
+        if self._last is not None:
+            self.rr.append(position - self._last[0])
+        self._last = (position, slope)
+
+    def update(self, position, height, slope=None):
+        """Process the next candidate; returns the positions of the beats it confirms.
+
+        That is the candidate itself and / or a beat found by the search-back before it.
+        slope (the maximum slope of the candidate) enables the T-wave check.
+        """
+        beats = []
+
+        # Search back for a missed beat among the candidates skipped since the last one
+        last = self._last
+        if last is not None and len(self.rr) and position - last[0] > SEARCH_BACK_RR * np.mean(self.rr[-8:]):
+            found = [skipped for skipped in self._skipped if skipped[1] > 0.5 * self.threshold
+                     and skipped[0] - last[0] > self.refractory]
+            if found:
+                found_position, found_height, found_slope = max(found, key=lambda skipped: skipped[1])
+                self.spki = 0.25 * found_height + 0.75 * self.spki
+                self._accept(found_position, found_slope)
+                self._skipped = [skipped for skipped in self._skipped if skipped[0] > found_position]
+                beats.append(found_position)
+
+        last = self._last
+        is_qrs = height > self.threshold and (last is None or position - last[0] > self.refractory)
+
+        # A steep enough slope distinguishes a QRS complex from a T wave just after a beat
+        if is_qrs and slope is not None and last is not None \
+                and position - last[0] < T_WAVE_WINDOW * self.sampling_rate \
+                and slope < 0.5 * last[1]:
+            is_qrs = False
+
+        if is_qrs:
+            self.spki = 0.125 * height + 0.875 * self.spki
+            self._accept(position, slope)
+            self._skipped = []
+            beats.append(position)
+        else:
+            self.npki = 0.125 * height + 0.875 * self.npki
+            self._skipped.append((position, height, slope))
+
+        return beats
+
+
+def initial_levels(integrated):
+    """Initial signal and noise peak levels (SPKI, NPKI) from a learning period."""
+    if len(integrated) == 0:
+        return 0.0, 0.0
+    return 0.25 * integrated.max(), 0.5 * integrated.mean()
+
+
+def adaptive_thresholds(integrated, candidates, sampling_rate, refractory, slopes=None):
+    """Positions of the candidates that are QRS complexes (see AdaptiveThresholds)."""
+    # Initial levels from the first two seconds (the rate need not be an integer)
+    start = integrated[candidates[0] if len(candidates) else 0:][:int(round(2 * sampling_rate))]
+    thresholds = AdaptiveThresholds(*initial_levels(start), sampling_rate, refractory)
+
+    qrs = []
+    for i, position in enumerate(candidates):
+        qrs.extend(thresholds.update(position, integrated[position], None if slopes is None else slopes[i]))
+    return np.array(qrs, dtype=int)
+
+
+def detect(squared, filtered=None, sampling_rate=1000, window=WINDOW, refractory=REFRACTORY):
+    """R-peak sample indices from the squared derivative (derive_sq_data) of 02a_preprocess-ecg.py.
+
+    With the filtered ECG (filtered_data) each peak is placed on the maximum of the
+    filtered signal within the integration window, otherwise on the steepest slope.
+    """
+    squared = np.asarray(squared)
+    width = max(int(round(window * sampling_rate)), 1)
+    refractory = int(round(refractory * sampling_rate))
+    if len(squared) < width:
+        return np.empty(0, dtype=int)
+
+    integrated = moving_window_integration(squared, width)
+    candidates, _ = signal.find_peaks(integrated, distance=max(refractory, 1))
+
+    # The first integration window holds the start-up transient of the band-pass filter
+    candidates = candidates[candidates >= width]
+
+    # Maximum slope in the window before every candidate, for all candidates at once
+    windows = np.lib.stride_tricks.sliding_window_view(squared, width)
+    starts = np.clip(candidates - width + 1, 0, len(squared) - width)
+    slopes = windows[starts].max(axis=1)
+
+    qrs = adaptive_thresholds(integrated, candidates, sampling_rate, refractory, slopes)
+    starts = np.clip(qrs - width + 1, 0, len(squared) - width)
+
+    # squared[i] is the slope between samples i and i + 1 of the filtered signal
+    if filtered is None:
+        return starts + windows[starts].argmax(axis=1) + 1
+    windows = np.lib.stride_tricks.sliding_window_view(np.asarray(filtered), width)
+    starts = np.clip(starts + 1, 0, len(filtered) - width)
+    return starts + windows[starts].argmax(axis=1)
+
+
+def ecg_peaks(ecg, sampling_rate=1000, block_size=1000000):
+    """R-peaks of a raw ECG: the 02a preprocessing followed by detect()."""
+    b, a = filters.ecg_bandpass(sampling_rate)
+    filtered, squared = filters.preprocess_ecg(ecg, b, a, block_size=block_size)
+    return detect(squared, filtered, sampling_rate=sampling_rate)
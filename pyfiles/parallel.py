@@ -0,0 +1,73 @@
+# # Process pool helpers
+# Recordings are independent of each other, so every stage that loops over
+# participants and tasks can hand its per-recording function to run_jobs.
+# Each job is a dict of keyword arguments; results always come back in job order.
+
+import os
+import sys
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+
+def default_workers():
+    return os.cpu_count() or 1
+
+
+class JobError:
+    """Stands in for the result of a job that raised, so one bad recording does not abort a batch."""
+
+    def __init__(self, job, error, traceback_text):
+        self.job = job
+        self.error = error
+        self.traceback = traceback_text
+
+    def __repr__(self):
+        return f"JobError({self.error})"
+
+
+def _call(func, job, capture_errors):
+    if not capture_errors:
+        return func(**job)
+    try:
+        return func(**job)
+    except Exception as e:
+        return JobError(job, f"{type(e).__name__}: {e}", traceback.format_exc())
+
+
+def _init_worker():
+    # Workers only ever save figures to files
+    os.environ['MPLBACKEND'] = 'Agg'
+    if 'matplotlib' in sys.modules:
+        sys.modules['matplotlib'].use('Agg')
+
+
+def run_jobs(func, jobs, n_workers=1, callback=None, capture_errors=False):
+    """Call func(**job) for every job, in a process pool if n_workers > 1.
+
+    callback(job, result) is called in the main process as soon as a job is done.
+    With capture_errors=True a job that raises returns a JobError instead.
+    """
+    jobs = list(jobs)
+    results = [None] * len(jobs)
+
+    # Serial path: no pool, no pickling
+    if n_workers is None or n_workers <= 1 or len(jobs) <= 1:
+        for i, job in enumerate(jobs):
+            results[i] = _call(func, job, capture_errors)
+            if callback is not None:
+                callback(job, results[i])
+        return results
+
+    with ProcessPoolExecutor(max_workers=min(n_workers, len(jobs)), initializer=_init_worker) as pool:
+        futures = {pool.submit(_call, func, job, capture_errors): i for i, job in enumerate(jobs)}
+        for future in as_completed(futures):
+            i = futures[future]
+            results[i] = future.result()
+            if callback is not None:
+                callback(jobs[i], results[i])
+    return results
+
+
+def failed(results):
+    """The JobErrors among the results of run_jobs."""
+    return [result for result in results if isinstance(result, JobError)]
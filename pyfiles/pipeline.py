@@ -0,0 +1,409 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# # Incremental pipeline runner
+# Runs the stages of the numbered scripts (01 import, 02a/02b preprocessing,
+# 03a/03b NeuroKit analysis, 04a/04b summaries, 05a/05b ICCs) for every recording, but only where
+# something changed. Every stage declares its input and output files per recording;
+# a recording is re-run when the fingerprint of its inputs (content hash of every input
+# file + the stage parameters) differs from the last successful run, or when one of its
+# outputs is missing. Adding one participant therefore only processes that participant
+# (plus the cohort-level summaries). A failing recording or cohort stage is reported and
+# run again next time, without stopping the other ones.
+#
+# Fingerprints are kept in <derivative_folder>/pipeline_state.json.
+
+import hashlib
+import importlib
+import json
+import os
+
+import neurokit2 as nk
+import pandas as pd
+
+import analysis
+import filters
+import importer
+import instrument
+import manifest
+import pan_tompkins
+import parallel
+import qc
+import results_store
+import signal_store
+
+# Paths to folders
+source_data_folder = '/Users/erwin/Documents/ProjectPsychophysiologyData/source-data'
+raw_data_folder = '/Users/erwin/Documents/ProjectPsychophysiologyData/raw-data/'
+derivative_folder = '/Users/erwin/Documents/ProjectPsychophysiologyData/preprocessed-data/'
+results_folder = '/Users/erwin/Documents/ProjectPsychophysiologyData/results/'
+cache_folder = '/Users/erwin/Documents/ProjectPsychophysiologyData/cache/'
+
+# Parameters: the recordings of the source folder (see manifest.py), restricted to these
+# participants / tasks (None keeps all)
+participants = None
+tasks = None
+n_workers = 1
+
+# Split the per-recording work over several machines: each runs its own shard_index
+# (0 .. n_shards - 1); the cohort stages run afterwards with n_shards = 1
+n_shards = 1
+shard_index = 0
+
+# Measure the time and peak memory of every stage and recording (see instrument.py) and
+# write them to pipeline_run_report.json in the results folder
+instrument_run = False
+
+# Delete the stored results of recordings that are no longer in the raw data folder
+# (they are left out of the results either way, see results_store.py)
+prune_stale_results = False
+
+# Stage parameters (part of the fingerprints: changing one re-runs the stage)
+IMPORT_PARAMS = {"channels": {'ECG': 1, 'EDA': 2}}
+# (sampling rates come from the sidecar of every recording, which is an input of every stage;
+# target_rate downsamples a modality before the NeuroKit analysis, None keeps the recording's rate;
+# quality_gate is that of 03a / 03b, applied to the QC records in the sidecars, see qc.py)
+ECG_PARAMS = {"lowcut": 0.5, "highcut": 30.0}
+EDA_PARAMS = {"sampling_rate": 10, "window_size": 10}
+ANALYSIS_PARAMS = {"neurokit2": nk.__version__}
+ECG_ANALYSIS_PARAMS = dict(ANALYSIS_PARAMS, peak_method='neurokit', target_rate=None, quality_gate='segment')
+EDA_ANALYSIS_PARAMS = dict(ANALYSIS_PARAMS, target_rate=None, quality_gate='segment')
+ICC_PARAMS = {"n_resamples": 2000, "confidence": 0.95, "seed": 0}
+
+PYFILES_FOLDER = os.path.dirname(os.path.abspath(__file__))
+
+
+# ## Stages
+# run functions take participant / task / session keyword arguments so they can be sent
+# to parallel.run_jobs; cohort-level stages take no arguments.
+
+def _name(participant, task, session=None):
+    return signal_store.recording_name(participant, task, session)
+
+
+def find_recordings():
+    # Without source data (e.g. imported elsewhere) the raw data folder is the reference
+    if os.path.isdir(source_data_folder):
+        entries = manifest.scan_source(source_data_folder)
+    else:
+        entries = manifest.load(raw_data_folder)
+    return manifest.select(entries, participants=participants, tasks=tasks)
+
+
+def run_import(participant, task, session=None):
+    importer.import_recording(source_data_folder, raw_data_folder, participant, task, session,
+                              channels=IMPORT_PARAMS["channels"])
+
+
+def run_preprocess_ecg(participant, task, session=None):
+    meta = signal_store.read_sidecar(raw_data_folder, _name(participant, task, session))
+    ecg_data = signal_store.open_channel(raw_data_folder, _name(participant, task, session), 'ecg', meta)
+    b, a = filters.ecg_bandpass(meta["sampling_rate"], ECG_PARAMS["lowcut"], ECG_PARAMS["highcut"])
+    # Filter straight into the stage files, in constant memory
+    filtered_ecg = signal_store.open_stage_field(derivative_folder, 'preprocessed_ecg', participant, task,
+                                                 'filtered_data', (len(ecg_data),), session=session)
+    squared_ecg = signal_store.open_stage_field(derivative_folder, 'preprocessed_ecg', participant, task,
+                                                'derive_sq_data', (max(len(ecg_data) - 1, 0),), session=session)
+    filters.preprocess_ecg(ecg_data, b, a, filtered=filtered_ecg, squared=squared_ecg)
+    r_peaks = pan_tompkins.detect(squared_ecg, filtered_ecg, sampling_rate=meta["sampling_rate"])
+    signal_store.write_stage_record(derivative_folder, 'preprocessed_ecg', participant, task,
+                                    {"filtered_data": filtered_ecg, "derive_sq_data": squared_ecg,
+                                     "r_peaks": r_peaks}, session)
+
+
+def run_preprocess_eda(participant, task, session=None):
+    meta = signal_store.read_sidecar(raw_data_folder, _name(participant, task, session))
+    eda_data = signal_store.open_channel(raw_data_folder, _name(participant, task, session), 'eda', meta)
+    downsampled = filters.decimate(eda_data, int(meta["sampling_rate"] // EDA_PARAMS["sampling_rate"]))
+    smoothed = pd.Series(downsampled).rolling(window=EDA_PARAMS["window_size"]).mean().values
+    signal_store.write_stage_record(derivative_folder, 'preprocessed_eda', participant, task,
+                                    {"downsampled_data": downsampled, "smoothed_data": smoothed}, session)
+
+
+def _row_path(kind, participant, task, session=None):
+    return results_store.partition_path(results_folder, kind, participant, task, session)
+
+
+def _run_analysis(kind, analyze, participant, task, session=None, quality_gate=None, **kwargs):
+    # Recordings imported before qc.py are checked first
+    meta = signal_store.read_sidecar(raw_data_folder, _name(participant, task, session))
+    quality = meta.get("qc") or qc.check_recording(raw_data_folder, _name(participant, task, session))
+    analyse, segment = qc.gate(quality, kind, quality_gate)
+    if not analyse:
+        # No results for a recording that failed the quality check (its output stays missing,
+        # so it is checked again on every run, which only reads the sidecar)
+        print(f"Skipping {_name(participant, task, session)}: {kind.upper()} failed the quality check")
+        results_store.remove(results_folder, kind, participant, task, session)
+        return
+
+    results = analyze(raw_data_folder, participant, task, cache_folder=cache_folder, segment=segment,
+                      session=session, **kwargs)
+    if results is None:
+        raise ValueError(f"No valid {kind.upper()} results for {_name(participant, task, session)}")
+    results_store.write(results_folder, kind, participant, task, results, session)
+
+
+def run_analysis_ecg(participant, task, session=None):
+    _run_analysis('ecg', analysis.analyze_ecg, participant, task, session,
+                  quality_gate=ECG_ANALYSIS_PARAMS["quality_gate"], peak_method=ECG_ANALYSIS_PARAMS["peak_method"],
+                  target_rate=ECG_ANALYSIS_PARAMS["target_rate"])
+
+
+def run_analysis_eda(participant, task, session=None):
+    _run_analysis('eda', analysis.analyze_eda, participant, task, session,
+                  quality_gate=EDA_ANALYSIS_PARAMS["quality_gate"], target_rate=EDA_ANALYSIS_PARAMS["target_rate"])
+
+
+def _run_collect(kind):
+    # Concatenate the per-recording rows of all recordings in the raw data folder
+    if prune_stale_results:
+        results_store.prune(results_folder, kind, raw_data_folder)
+    results_store.export_csv(results_folder, kind, raw_data_folder)
+
+
+def run_collect_ecg():
+    _run_collect('ecg')
+
+
+def run_collect_eda():
+    _run_collect('eda')
+
+
+def _script(name):
+    # A numbered script as a module (its top level only sets its parameters)
+    return importlib.import_module(name)
+
+
+def run_summary_ecg():
+    _script('04a_summary-ecg').summarize(results_folder, raw_data_folder, show=False)
+
+
+def run_summary_eda():
+    _script('04b_summary-eda').summarize(results_folder, raw_data_folder, show=False)
+
+
+def run_icc_ecg():
+    _script('05a_ICC-ecg').compute_icc(results_folder, raw_data_folder, n_workers=n_workers, **ICC_PARAMS)
+
+
+def run_icc_eda():
+    _script('05b_ICC-eda').compute_icc(results_folder, raw_data_folder, n_workers=n_workers, **ICC_PARAMS)
+
+
+class Stage:
+    """A pipeline stage: a run function plus its input and output files.
+
+    For per-recording stages inputs / outputs are functions of (participant, task, session);
+    for cohort stages (per_recording=False) they are functions without arguments.
+    """
+
+    def __init__(self, name, run, inputs, outputs, params=None, per_recording=True):
+        self.name = name
+        self.run = run
+        self.inputs = inputs
+        self.outputs = outputs
+        self.params = params or {}
+        self.per_recording = per_recording
+
+
+def _raw_files(participant, task, session, channel):
+    name = _name(participant, task, session)
+    return [signal_store.sidecar_path(raw_data_folder, name),
+            signal_store.channel_path(raw_data_folder, name, channel)]
+
+
+def _stage_files(stage, participant, task, session, fields):
+    folder = signal_store.stage_folder(derivative_folder, stage)
+    return [signal_store.stage_record_path(derivative_folder, stage, participant, task, session)] + \
+        [os.path.join(folder, f"{_name(participant, task, session)}_{field}.npy") for field in fields]
+
+
+def _script_files(*names):
+    return [os.path.join(PYFILES_FOLDER, name) for name in names]
+
+
+def _all_rows(kind):
+    # The stored results of the recordings in the raw data folder, whichever run wrote them
+    return results_store.current(results_folder, kind, raw_data_folder)[0]
+
+
+STAGES = [
+    Stage('01_import', run_import,
+          inputs=lambda pi, ti, si: [os.path.join(source_data_folder, _name(pi, ti, si) + '.txt')],
+          outputs=lambda pi, ti, si: _raw_files(pi, ti, si, 'ecg') + _raw_files(pi, ti, si, 'eda'),
+          params=IMPORT_PARAMS),
+    Stage('02a_preprocess-ecg', run_preprocess_ecg,
+          inputs=lambda pi, ti, si: _raw_files(pi, ti, si, 'ecg') + _script_files('filters.py', 'pan_tompkins.py'),
+          outputs=lambda pi, ti, si: _stage_files('preprocessed_ecg', pi, ti, si,
+                                                  ['filtered_data', 'derive_sq_data', 'r_peaks']),
+          params=ECG_PARAMS),
+    Stage('02b_preprocess-eda', run_preprocess_eda,
+          inputs=lambda pi, ti, si: _raw_files(pi, ti, si, 'eda') + _script_files('filters.py'),
+          outputs=lambda pi, ti, si: _stage_files('preprocessed_eda', pi, ti, si,
+                                                  ['downsampled_data', 'smoothed_data']),
+          params=EDA_PARAMS),
+    Stage('03a_neurokit-ecg', run_analysis_ecg,
+          inputs=lambda pi, ti, si: _raw_files(pi, ti, si, 'ecg'),
+          outputs=lambda pi, ti, si: [_row_path('ecg', pi, ti, si)],
+          params=ECG_ANALYSIS_PARAMS),
+    Stage('03b_neurokit-eda', run_analysis_eda,
+          inputs=lambda pi, ti, si: _raw_files(pi, ti, si, 'eda'),
+          outputs=lambda pi, ti, si: [_row_path('eda', pi, ti, si)],
+          params=EDA_ANALYSIS_PARAMS),
+    Stage('03a_collect-ecg', run_collect_ecg,
+          inputs=lambda: _all_rows('ecg'),
+          outputs=lambda: [results_folder + 'ecg_results.csv'],
+          per_recording=False),
+    Stage('03b_collect-eda', run_collect_eda,
+          inputs=lambda: _all_rows('eda'),
+          outputs=lambda: [results_folder + 'eda_results.csv'],
+          per_recording=False),
+    Stage('04a_summary-ecg', run_summary_ecg,
+          inputs=lambda: _all_rows('ecg') +
+          _script_files('04a_summary-ecg.py', 'summary.py', 'results_store.py'),
+          outputs=lambda: [results_folder + 'ecg_summary_with_lines.png', results_folder + 'ecg_summary.csv'],
+          per_recording=False),
+    Stage('04b_summary-eda', run_summary_eda,
+          inputs=lambda: _all_rows('eda') +
+          _script_files('04b_summary-eda.py', 'summary.py', 'results_store.py'),
+          outputs=lambda: [results_folder + 'eda_summary_with_lines.png', results_folder + 'eda_summary.csv'],
+          per_recording=False),
+    Stage('05a_ICC-ecg', run_icc_ecg,
+          inputs=lambda: _all_rows('ecg') +
+          _script_files('05a_ICC-ecg.py', 'icc.py', 'summary.py', 'results_store.py'),
+          outputs=lambda: [results_folder + 'ecg_icc.csv'],
+          params=ICC_PARAMS, per_recording=False),
+    Stage('05b_ICC-eda', run_icc_eda,
+          inputs=lambda: _all_rows('eda') +
+          _script_files('05b_ICC-eda.py', 'icc.py', 'summary.py', 'results_store.py'),
+          outputs=lambda: [results_folder + 'eda_icc.csv'],
+          params=ICC_PARAMS, per_recording=False),
+]
+
+
+# ## Fingerprints
+
+def load_state(state_file):
+    if not os.path.exists(state_file):
+        return {"hashes": {}, "stages": {}}
+    with open(state_file) as f:
+        return json.load(f)
+
+
+def save_state(state_file, state):
+    # Merge with the file as it is now, so runs of other shards are not overwritten
+    current = load_state(state_file)
+    current["hashes"].update(state["hashes"])
+    for stage, done in state["stages"].items():
+        current["stages"].setdefault(stage, {}).update(done)
+    state = current
+
+    os.makedirs(os.path.dirname(state_file), exist_ok=True)
+    with open(state_file + '.tmp', 'w') as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+    os.replace(state_file + '.tmp', state_file)
+
+
+def file_hash(path, state):
+    """SHA-256 of a file; reused as long as the file's size and mtime are unchanged."""
+    stat = os.stat(path)
+    known = state["hashes"].get(path)
+    if known is not None and known[0] == stat.st_size and known[1] == stat.st_mtime_ns:
+        return known[2]
+
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    state["hashes"][path] = [stat.st_size, stat.st_mtime_ns, h.hexdigest()]
+    return h.hexdigest()
+
+
+def fingerprint(stage, inputs, state):
+    h = hashlib.sha256(json.dumps({"stage": stage.name, "params": stage.params}, sort_keys=True).encode())
+    for path in inputs:
+        h.update(path.encode())
+        h.update(file_hash(path, state).encode())
+    return h.hexdigest()
+
+
+def _stale(stage, key, inputs, outputs, state, force):
+    fp = fingerprint(stage, inputs, state)
+    done = state["stages"].get(stage.name, {}).get(key)
+    missing = any(not os.path.exists(path) for path in outputs)
+    return (force or missing or done != fp), fp
+
+
+# ## Runner
+
+def run(stages=None, recordings=None, n_workers=1, force=False, state_file=None, n_shards=1, shard_index=0):
+    """Run all stale stages / recordings; returns {stage name: number of re-run recordings}.
+
+    recordings are (participant, task, session) tuples, by default those of find_recordings().
+    """
+    stages = STAGES if stages is None else stages
+    if recordings is None:
+        entries = manifest.shard(find_recordings(), n_shards, shard_index)
+        recordings = [(entry["participant"], entry["task"], entry["session"]) for entry in entries]
+    state_file = state_file or os.path.join(derivative_folder, 'pipeline_state.json')
+    state = load_state(state_file)
+
+    summary = {}
+    for stage in stages:
+        done = state["stages"].setdefault(stage.name, {})
+
+        if not stage.per_recording:
+            if n_shards > 1:
+                print(f"{stage.name}: cohort stage, skipped in shard {shard_index} of {n_shards}")
+                continue
+            inputs = stage.inputs()
+            if not all(os.path.exists(path) for path in inputs):
+                print(f"{stage.name}: inputs missing, skipped")
+                continue
+            is_stale, fp = _stale(stage, 'cohort', inputs, stage.outputs(), state, force)
+            if is_stale:
+                print(f"{stage.name}: running")
+                # Like a failed recording: reported, left stale for the next run, the other stages go on
+                try:
+                    with instrument.stage(stage.name):
+                        stage.run()
+                except Exception as e:
+                    print(f"{stage.name}: failed: {type(e).__name__}: {e}")
+                else:
+                    done['cohort'] = fp
+            summary[stage.name] = int(is_stale)
+            save_state(state_file, state)
+            continue
+
+        jobs, fingerprints = [], []
+        for pi, ti, si in recordings:
+            inputs = stage.inputs(pi, ti, si)
+            if not all(os.path.exists(path) for path in inputs):
+                print(f"{stage.name}: inputs of {_name(pi, ti, si)} missing, skipped")
+                continue
+            is_stale, fp = _stale(stage, _name(pi, ti, si), inputs, stage.outputs(pi, ti, si), state, force)
+            if is_stale:
+                jobs.append({"participant": pi, "task": ti, "session": si})
+                fingerprints.append(fp)
+
+        print(f"{stage.name}: {len(jobs)} of {len(recordings)} recordings to run")
+        outputs = instrument.run_jobs(stage.run, jobs, n_workers=n_workers, capture_errors=True, group=stage.name)
+        for job, fp, output in zip(jobs, fingerprints, outputs):
+            if isinstance(output, parallel.JobError):
+                print(f"{stage.name}: {_name(**job)} failed: {output.error}")
+            else:
+                done[_name(**job)] = fp
+        summary[stage.name] = len(jobs)
+        save_state(state_file, state)
+
+    return summary
+
+
+if __name__ == '__main__':
+    if instrument_run:
+        instrument.enable()
+    print(run(n_workers=n_workers, n_shards=n_shards, shard_index=shard_index))
+    if instrument_run:
+        instrument.write_report(os.path.join(results_folder, 'pipeline_run_report.json'),
+                                {"n_workers": n_workers, "n_shards": n_shards, "shard_index": shard_index})
+        instrument.print_summary()
@@ -0,0 +1,232 @@
+# # Signal quality
+# A cheap screen of every channel, run at import time, so the NeuroKit analysis can skip
+# recordings that are mostly electrode-off or saturated (or only analyse their clean
+# part) instead of spending minutes on them and then failing or producing garbage.
+#
+# The channel is cut into windows (a few seconds for ECG, longer for the slow EDA) and
+# every window is checked at once on a (window, samples) array, block by block from the
+# memory-mapped store:
+#   - nan:        missing samples
+#   - flatline:   a constant signal, below one ADC step (electrode off, cable unplugged)
+#   - saturation: samples at the ends of the BITalino ADC range (clipped signal)
+#   - noise:      power above the signal band / power within it (EMG, movement, mains)
+# Runs of good windows are the clean segments of the channel. For EDA the rises of the
+# 1 s means are counted as well; a recording without any SCR-like rise is flagged
+# (it is analysed as usual, but has no SCRs to plot).
+#
+# The results are stored in the sidecar of the recording (key "qc") and listed in the
+# manifest, which makes them the QC index of the raw data folder.
+
+import numpy as np
+import pandas as pd
+
+import opensignals
+import signal_store
+
+# Windows processed at once (bounds the memory use on long recordings)
+BLOCK_WINDOWS = 512
+
+# Bits of the BITalino (r)evolution analog channels A1-A4, if the sidecar does not say
+DEFAULT_RESOLUTION = 10
+
+# Per modality: window length (s), signal band (Hz, None skips the noise check), largest
+# accepted noise ratio, shortest clean segment (s) worth analysing; other channels get DEFAULT_CHECKS
+CHECKS = {
+    'ECG': {"window": 2, "band": (0.5, 40), "max_noise_ratio": 1.0, "min_duration": 30},
+    'EDA': {"window": 20, "band": (0, 5), "max_noise_ratio": 1.0, "min_duration": 60},
+}
+DEFAULT_CHECKS = {"window": 2, "band": None, "max_noise_ratio": None, "min_duration": 30}
+
+# A window is saturated if more than this fraction of its samples lies at the range ends
+MAX_SATURATED = 0.01
+
+# Smallest rise (µS) of the 1 s EDA means that counts as SCR activity
+SCR_MIN_AMPLITUDE = 0.05
+
+ISSUES = ['nan', 'flatline', 'saturation', 'noise']
+
+
+def adc_range(channel, resolution=DEFAULT_RESOLUTION):
+    """Smallest and largest value of a channel in its stored unit, and the size of one ADC step."""
+    low, high = opensignals.convert(channel, np.array([0.0, 2 ** resolution - 1]), resolution)
+    return low, high, (high - low) / (2 ** resolution - 1)
+
+
+def _runs(mask):
+    """Start and stop indices of the runs of True in a boolean array."""
+    edges = np.flatnonzero(np.diff(np.concatenate([[0], mask.astype(np.int8), [0]])))
+    return edges[::2], edges[1::2]
+
+
+def _noise_ratio(windows, sampling_rate, band):
+    # Power spectrum of every (demeaned) window at once
+    spectrum = np.abs(np.fft.rfft(windows - windows.mean(axis=1, keepdims=True), axis=1)) ** 2
+    frequencies = np.fft.rfftfreq(windows.shape[1], 1 / sampling_rate)
+    in_band = (frequencies > band[0]) & (frequencies <= band[1])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return spectrum[:, frequencies > band[1]].sum(axis=1) / spectrum[:, in_band].sum(axis=1)
+
+
+def _window_checks(windows, sampling_rate, low, high, step, checks):
+    """Boolean [issue, window] array of the issues of a (window, samples) block, and the noise ratios."""
+    nan = np.isnan(windows).any(axis=1)
+    with np.errstate(invalid='ignore'):
+        flat = np.ptp(windows, axis=1) < step
+        saturated = ((windows <= low + step / 2) | (windows >= high - step / 2)).mean(axis=1) > MAX_SATURATED
+
+    band = checks["band"]
+    if band is None or sampling_rate <= 2 * band[1]:
+        ratio = np.full(len(windows), np.nan)
+        noisy = np.zeros(len(windows), dtype=bool)
+    else:
+        ratio = np.where(nan | flat, np.nan, _noise_ratio(windows, sampling_rate, band))
+        with np.errstate(invalid='ignore'):
+            noisy = ratio > checks["max_noise_ratio"]
+    return np.array([nan, flat & ~nan, saturated, noisy]), ratio
+
+
+def scr_count(second_means, min_amplitude=SCR_MIN_AMPLITUDE):
+    """Number of rises of the 1 s EDA means by at least min_amplitude."""
+    rise = np.diff(second_means)
+    starts, stops = _runs(rise > 0)
+    total = np.concatenate([[0.0], np.cumsum(rise)])
+    return int(((total[stops] - total[starts]) >= min_amplitude).sum())
+
+
+def check_channel(data, sampling_rate, channel, resolution=DEFAULT_RESOLUTION):
+    """The QC record of one channel (a JSON-serializable dict).
+
+    status is 'ok' (no bad window), 'partial' (the longest clean segment is at least
+    min_duration long) or 'bad'; segment is the longest clean segment [start, stop] in samples.
+    """
+    checks = CHECKS.get(channel.upper(), DEFAULT_CHECKS)
+    low, high, step = adc_range(channel, resolution)
+    n_samples = len(data)
+    window = max(min(int(round(checks["window"] * sampling_rate)), n_samples), 1)
+    n_windows = n_samples // window
+    second = max(int(round(sampling_rate)), 1)
+
+    issues, ratios, seconds = [], [], []
+    for first in range(0, n_windows, BLOCK_WINDOWS):
+        last = min(first + BLOCK_WINDOWS, n_windows)
+        windows = np.asarray(data[first * window:last * window], dtype=np.float64).reshape(-1, window)
+        block_issues, block_ratios = _window_checks(windows, sampling_rate, low, high, step, checks)
+        issues.append(block_issues)
+        ratios.append(block_ratios)
+        if channel.upper() == 'EDA':
+            samples = windows.ravel()
+            seconds.append(samples[:len(samples) // second * second].reshape(-1, second).mean(axis=1))
+
+    issues = np.concatenate(issues, axis=1) if issues else np.zeros((len(ISSUES), 0), dtype=bool)
+    ratios = np.concatenate(ratios) if ratios else np.empty(0)
+    good = ~issues.any(axis=0)
+
+    # Longest run of good windows; the samples after the last full window go with it
+    starts, stops = _runs(good)
+    if len(starts):
+        longest = np.argmax(stops - starts)
+        segment = [int(starts[longest] * window), int(stops[longest] * window)]
+        if stops[longest] == n_windows:
+            segment[1] = n_samples
+    else:
+        segment = [0, 0]
+
+    if good.all() and n_windows:
+        status = 'ok'
+    elif (segment[1] - segment[0]) / sampling_rate >= checks["min_duration"]:
+        status = 'partial'
+    else:
+        status = 'bad'
+
+    record = {
+        "status": status,
+        "issues": [issue for issue, found in zip(ISSUES, issues.any(axis=1)) if found],
+        "window_s": window / sampling_rate,
+        "n_windows": int(n_windows),
+        "bad_windows": {issue: int(count) for issue, count in zip(ISSUES, issues.sum(axis=1))},
+        "good_fraction": float(good.mean()) if n_windows else 0.0,
+        "noise_ratio": float(np.nanmedian(ratios)) if np.isfinite(ratios).any() else None,
+        "segment": segment,
+    }
+    if channel.upper() == 'EDA':
+        record["scr_count"] = scr_count(np.concatenate(seconds)) if seconds else 0
+        if record["scr_count"] == 0:
+            record["issues"].append('no_scr_activity')
+    return record
+
+
+def check_recording(folder, name, resolutions=None):
+    """Check every channel of a recording and store the records in its sidecar."""
+    meta, channels = signal_store.open_recording(folder, name)
+    resolutions = resolutions or meta.get("resolutions") or {}
+    meta["qc"] = {channel.upper(): check_channel(data, meta["sampling_rate"], channel,
+                                                 resolutions.get(channel, DEFAULT_RESOLUTION))
+                  for channel, data in channels.items()}
+    signal_store.write_sidecar(folder, name, meta)
+    return meta["qc"]
+
+
+def index(raw_folder, entries):
+    """Manifest entries with their QC records; recordings imported without QC are checked now."""
+    checked = []
+    for entry in entries:
+        if entry.get("qc") is None:
+            entry = dict(entry, qc=check_recording(raw_folder, entry["name"]))
+        checked.append(entry)
+    return checked
+
+
+def gate(qc, channel, mode='segment'):
+    """Whether and how to analyse a channel with QC record(s) qc.
+
+    Returns (analyse, segment): mode None analyses everything; 'skip' leaves out 'bad'
+    channels; 'segment' also restricts 'partial' channels to their longest clean segment.
+    segment is [start, stop] in samples, or None for the whole recording.
+    """
+    record = (qc or {}).get(channel.upper())
+    if mode is None or record is None:
+        return True, None
+    if mode not in ('skip', 'segment'):
+        raise ValueError(f"Unknown quality gate '{mode}', use 'skip', 'segment' or None.")
+    if record["status"] == 'bad':
+        return False, None
+    if record["status"] == 'partial' and mode == 'segment':
+        return True, record["segment"]
+    return True, None
+
+
+def select(entries, channel, mode='segment'):
+    """The entries that pass the gate (each with its 'segment') and those that do not."""
+    passed, failed = [], []
+    for entry in entries:
+        analyse, segment = gate(entry.get("qc"), channel, mode)
+        if analyse:
+            passed.append(dict(entry, segment=segment))
+        else:
+            failed.append(entry)
+    return passed, failed
+
+
+def table(entries):
+    """The QC records of all entries, one row per recording and channel."""
+    rows = []
+    for entry in entries:
+        for channel, record in (entry.get("qc") or {}).items():
+            row = {"recording": entry["name"], "channel": channel}
+            row.update({key: value for key, value in record.items() if key != 'bad_windows'})
+            row["issues"] = ','.join(record["issues"])
+            row.update({f"{issue}_windows": count for issue, count in record["bad_windows"].items()})
+            rows.append(row)
+    return pd.DataFrame(rows)
+
+
+if __name__ == '__main__':
+    import sys
+
+    import manifest
+
+    # Check (again) every recording of a raw data folder and print the QC index
+    folder = sys.argv[1]
+    for entry in manifest.load(folder):
+        check_recording(folder, entry["name"])
+    print(table(manifest.load(folder)).to_string(index=False))
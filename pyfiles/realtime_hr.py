@@ -0,0 +1,300 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# # Real-time heart rate
+# Beat-by-beat heart rate during a live session. Sample blocks as they come from the
+# acquisition (here: a replay of a stored recording, directly or through a local TCP
+# socket standing in for the BITalino connection) run through the 02a filtering
+# (filters.EcgPreprocessor) and an incremental version of the Pan-Tompkins detector in
+# pan_tompkins.py. Only the last few seconds are kept, in ring buffers.
+#
+# A beat is confirmed once the integrated signal has been seen for one refractory period
+# (200 ms) after it. The replay harness measures the end-to-end latency of every beat,
+# i.e. the wall time from the arrival of the block with the R peak to the output of its
+# heart rate, and compares the beats with the offline detector.
+
+import socket
+import threading
+import time
+
+import numpy as np
+from scipy.ndimage import maximum_filter1d
+
+import filters
+import manifest
+import pan_tompkins
+import signal_store
+
+# Parameters of the replay harness
+raw_data_folder = '/Users/erwin/Documents/ProjectPsychophysiologyData/raw-data/'
+recording = None  # e.g. 'sub-1_spiderhand'; None takes the first ECG recording
+source = 'file'  # 'file' replays the recording directly, 'socket' through a local TCP socket
+block_size = 50  # Samples per block (50 ms at 1000 Hz)
+speed = 1.0  # 1.0 replays in real time, 2.0 twice as fast, 0 as fast as possible
+seconds = 60  # Length of the replay (None for the whole recording)
+
+
+class RingBuffer:
+    """The last capacity samples of a stream, addressed by absolute sample index."""
+
+    def __init__(self, capacity):
+        self.data = np.zeros(capacity)
+        self.end = 0  # Index after the newest sample
+
+    @property
+    def start(self):
+        return max(0, self.end - len(self.data))
+
+    def extend(self, values):
+        values = np.asarray(values)[-len(self.data):]
+        position = self.end % len(self.data)
+        first = min(len(values), len(self.data) - position)
+        self.data[position:position + first] = values[:first]
+        self.data[:len(values) - first] = values[first:]
+        self.end += len(values)
+
+    def get(self, start, stop):
+        if start < self.start or stop > self.end:
+            raise IndexError(f"Samples {start}-{stop} are not in the buffer ({self.start}-{self.end})")
+        return self.data.take(np.arange(start, stop) % len(self.data))
+
+
+class OnlineDetector:
+    """Incremental R-peak detection and heart rate, block by block.
+
+    process() returns the beats confirmed by a block as dicts with the sample index of
+    the R peak, the RR interval and heart rate (None for the first beat) and the delay,
+    i.e. how much signal after the R peak was needed to confirm it (in seconds). Beats of
+    the two-second learning period at the start are only confirmed at its end and are
+    flagged with learning=True.
+    """
+
+    def __init__(self, sampling_rate=1000, lowcut=0.5, highcut=30.0, window=pan_tompkins.WINDOW,
+                 refractory=pan_tompkins.REFRACTORY, buffer_seconds=5):
+        self.sampling_rate = sampling_rate
+        self.preprocessor = filters.EcgPreprocessor(*filters.ecg_bandpass(sampling_rate, lowcut, highcut))
+        self.width = max(int(round(window * sampling_rate)), 1)
+        self.refractory = int(round(refractory * sampling_rate))
+        # Lengths in samples; the rate itself may be a float (e.g. after filters.resample)
+        self._second = max(int(round(sampling_rate)), 1)
+        self._learning_samples = int(round(2 * sampling_rate))
+
+        # Filtered ECG by sample index; squared derivative and integrated signal by index
+        # of the squared derivative (squared[i] is the slope between samples i and i + 1)
+        capacity = int(max(buffer_seconds, 3) * sampling_rate)
+        self.filtered = RingBuffer(capacity)
+        self.squared = RingBuffer(capacity)
+        self.integrated = RingBuffer(capacity)
+        self._window = np.zeros(self.width)  # Last width squared values, for the integration
+
+        self.thresholds = None
+        self._learning = []  # Candidates of the learning period (2 s from the first one)
+        self._next = self.width  # First position not yet searched for candidates
+        self._last_candidate = None
+        self._last_beat = None
+
+    def process(self, block):
+        # Blocks longer than a second are split so the buffers always hold the search range
+        beats = []
+        for start in range(0, len(block), self._second):
+            beats.extend(self._process(block[start:start + self._second]))
+        return beats
+
+    def _process(self, block):
+        filtered, squared = self.preprocessor.process(block)
+        self.filtered.extend(filtered)
+        self.squared.extend(squared)
+
+        # Moving-window integration, continued from the last width squared values
+        extended = np.concatenate([self._window, squared])
+        sums = np.cumsum(extended)
+        self.integrated.extend((sums[self.width:] - sums[:-self.width]) / self.width)
+        self._window = extended[-self.width:]
+
+        beats = []
+        for position in self._candidates():
+            beats.extend(self._candidate(position))
+        return beats
+
+    def _candidates(self):
+        # Local maxima that are the largest value within one refractory period on both
+        # sides; a position is final once the refractory period after it has arrived
+        stop = self.integrated.end - self.refractory
+        if stop <= self._next:
+            return []
+        offset = max(self._next - self.refractory, self.integrated.start)
+        segment = self.integrated.get(offset, self.integrated.end)
+        maxima = maximum_filter1d(segment, size=2 * self.refractory + 1, mode='constant', cval=-np.inf)
+
+        positions = np.arange(self._next, stop)
+        i = positions - offset
+        is_peak = (segment[i] == maxima[i]) & (segment[i] > segment[i - 1]) & (segment[i] >= segment[i + 1])
+        self._next = stop
+
+        candidates = []
+        for position in positions[is_peak]:
+            if self._last_candidate is None or position - self._last_candidate >= self.refractory:
+                candidates.append(position)
+                self._last_candidate = position
+        return candidates
+
+    def _candidate(self, position):
+        height = self.integrated.get(position, position + 1)[0]
+        slope = self.squared.get(position - self.width + 1, position + 1).max()
+
+        # The thresholds start after a learning period of two seconds
+        if self.thresholds is None:
+            self._learning.append((position, height, slope))
+            first = self._learning[0][0]
+            if position < first + self._learning_samples:
+                return []
+            levels = pan_tompkins.initial_levels(self.integrated.get(first, first + self._learning_samples))
+            self.thresholds = pan_tompkins.AdaptiveThresholds(*levels, self.sampling_rate, self.refractory)
+            candidates, self._learning = self._learning, []
+            learning = True
+        else:
+            candidates = [(position, height, slope)]
+            learning = False
+
+        beats = []
+        for candidate in candidates:
+            for qrs in self.thresholds.update(*candidate):
+                beat = self._beat(qrs)
+                beat["learning"] = learning
+                beats.append(beat)
+        return beats
+
+    def _beat(self, qrs):
+        # R peak on the maximum of the filtered ECG in the integration window (if still buffered)
+        start = qrs - self.width + 2
+        if start >= self.filtered.start:
+            r_peak = start + int(self.filtered.get(start, qrs + 2).argmax())
+        else:
+            r_peak = qrs + 1
+
+        rr = None if self._last_beat is None else (r_peak - self._last_beat) / self.sampling_rate
+        self._last_beat = r_peak
+        return {
+            "sample": r_peak,
+            "rr": rr,
+            "heart_rate": None if rr is None else 60 / rr,
+            "delay": (self.filtered.end - r_peak) / self.sampling_rate,
+        }
+
+
+# ## Sources
+# Generators of sample blocks; a block is yielded as soon as its last sample would
+# have been acquired.
+
+def file_source(data, sampling_rate, block_size=50, speed=1.0):
+    """Replay an array block by block, paced like a live acquisition (speed 0: no pacing)."""
+    start = time.perf_counter()
+    for position in range(0, len(data), block_size):
+        block = np.asarray(data[position:position + block_size], dtype=np.float64)
+        if speed:
+            delay = start + (position + len(block)) / sampling_rate / speed - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        yield block
+
+
+def serve(data, sampling_rate, block_size=50, speed=1.0, host='127.0.0.1', port=0):
+    """Stand-in for the acquisition device: streams float64 samples over TCP to one client.
+
+    Runs in a background thread; returns the port to connect to.
+    """
+    server = socket.create_server((host, port))
+
+    def send():
+        connection, _ = server.accept()
+        with connection, server:
+            for block in file_source(data, sampling_rate, block_size, speed):
+                connection.sendall(block.astype('<f8').tobytes())
+
+    threading.Thread(target=send, daemon=True).start()
+    return server.getsockname()[1]
+
+
+def socket_source(port, host='127.0.0.1'):
+    """Yield the samples received over TCP, as they arrive, until the sender closes."""
+    with socket.create_connection((host, port)) as connection:
+        connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        pending = b''
+        while True:
+            data = connection.recv(65536)
+            if not data:
+                break
+            pending += data
+            n_bytes = len(pending) - len(pending) % 8
+            if n_bytes:
+                yield np.frombuffer(pending[:n_bytes], dtype='<f8')
+                pending = pending[n_bytes:]
+
+
+# ## Replay harness
+
+def replay(blocks, detector, show=True):
+    """Run the detector over a source; returns the beats with their end-to-end latency."""
+    arrivals = []  # (index after the last sample, arrival time) per block
+    received = 0
+    beats = []
+    for block in blocks:
+        arrived = time.perf_counter()
+        received += len(block)
+        arrivals.append((received, arrived))
+
+        for beat in detector.process(block):
+            # Wall time since the block holding the R peak arrived
+            ends = [end for end, _ in arrivals]
+            beat["latency"] = time.perf_counter() - arrivals[np.searchsorted(ends, beat["sample"], side='right')][1]
+            beats.append(beat)
+            if show and beat["heart_rate"] is not None:
+                print(f"{beat['sample'] / detector.sampling_rate:8.2f} s  {beat['heart_rate']:6.1f} bpm  "
+                      f"(latency {beat['latency'] * 1000:6.1f} ms)")
+
+        # Only blocks that can still hold an unconfirmed beat are needed
+        while len(arrivals) > 1 and arrivals[1][0] < detector.filtered.start:
+            arrivals.pop(0)
+    return beats
+
+
+def latency_report(beats, percentiles=(50, 90, 95, 99)):
+    """Percentiles of the end-to-end latency and of the detection delay, in ms (after the learning period)."""
+    beats = [beat for beat in beats if not beat["learning"]]
+    latency = np.array([beat["latency"] for beat in beats]) * 1000
+    delay = np.array([beat["delay"] for beat in beats]) * 1000
+    report = {}
+    for name, values in (("latency", latency), ("delay", delay)):
+        for p in percentiles:
+            report[f"{name} p{p} ms"] = round(float(np.percentile(values, p)), 1) if len(values) else np.nan
+        report[f"{name} max ms"] = round(float(values.max()), 1) if len(values) else np.nan
+    return report
+
+
+if __name__ == '__main__':
+    entry = manifest.select(manifest.load(raw_data_folder), modality='ECG')[0] if recording is None else \
+        next(entry for entry in manifest.load(raw_data_folder) if entry["name"] == recording)
+    sampling_rate = entry["sampling_rate"]
+    data = signal_store.open_channel(raw_data_folder, entry["name"], 'ecg')
+    if seconds is not None:
+        data = data[:int(seconds * sampling_rate)]
+    print(f"Replaying {entry['name']} ({len(data) / sampling_rate:.0f} s) from the {source}, "
+          f"{block_size} samples per block, speed {speed}")
+
+    if source == 'file':
+        blocks = file_source(data, sampling_rate, block_size, speed)
+    elif source == 'socket':
+        blocks = socket_source(serve(data, sampling_rate, block_size, speed))
+    else:
+        raise ValueError(f"Unknown source '{source}', use 'file' or 'socket'.")
+
+    detector = OnlineDetector(sampling_rate)
+    beats = replay(blocks, detector)
+
+    # Agreement with the offline detector on the same samples (within 50 ms)
+    offline = pan_tompkins.ecg_peaks(np.asarray(data), sampling_rate=sampling_rate)
+    online = np.array([beat["sample"] for beat in beats])
+    matched = sum(np.abs(offline - sample).min() <= 0.05 * sampling_rate for sample in online) if len(offline) else 0
+    print(f"{len(online)} beats online, {len(offline)} offline, {matched} matched")
+    for name, value in latency_report(beats).items():
+        print(f"{name:16s} {value}")
@@ -0,0 +1,282 @@
+# # Figure rendering
+# The diagnostic figures of 03a / 03b are drawn in a separate stage after the
+# analysis. It reads the processing outputs from the nk_cache folder (so nothing is
+# recomputed), uses the non-interactive Agg backend in worker processes and closes
+# every figure as soon as it is saved, so each worker holds at most one figure.
+# The plot functions take the compact processing outputs (see compact.py).
+
+import matplotlib
+import matplotlib.pyplot as plt
+import neurokit2 as nk
+import numpy as np
+
+from neurokit2.signal.signal_rate import _signal_rate_plot
+from neurokit2.ecg.ecg_peaks import _ecg_peaks_plot
+from neurokit2.ecg.ecg_segment import ecg_segment
+
+import analysis
+import instrument
+import nk_cache
+import parallel
+import signal_store
+
+# Number of heartbeats overlaid in the heartbeat panel when plotting envelopes
+MAX_SEGMENT_BEATS = 200
+
+
+def minmax_envelope(y, n_pixels):
+    """Reduce a trace to the min and max of each of n_pixels bins.
+
+    Returns the sample indices of the kept points (in time order) so the envelope
+    draws exactly like the full trace at that width, with 2 points per bin.
+    """
+    y = np.asarray(y)
+    n = len(y)
+    if n <= 2 * n_pixels:
+        return np.arange(n)
+
+    bin_size = -(-n // n_pixels)
+    n_bins = -(-n // bin_size)
+
+    # Pad the last bin with its own last value so all bins can be reshaped at once
+    padded = np.empty(n_bins * bin_size, dtype=y.dtype)
+    padded[:n] = y
+    padded[n:] = y[-1]
+    bins = padded.reshape(n_bins, bin_size)
+
+    offsets = np.arange(n_bins) * bin_size
+    indices = np.sort(np.stack([bins.argmin(axis=1), bins.argmax(axis=1)], axis=1), axis=1)
+    indices = (indices + offsets[:, None]).ravel()
+    return np.minimum(indices, n - 1)
+
+
+def _plot_envelope(ax, y, sampling_rate, n_pixels, **kwargs):
+    indices = minmax_envelope(y, n_pixels)
+    return ax.plot(indices / sampling_rate, np.asarray(y)[indices], **kwargs)
+
+
+def _ecg_peaks_envelope_plot(ecg_cleaned, peaks, sampling_rate, raw, quality, n_pixels, ax):
+    # Same panel as _ecg_peaks_plot, with every trace reduced to its min/max envelope;
+    # R-peaks are drawn at their exact sample positions
+    ax.set_xlabel("Time (seconds)")
+    ax.set_title("ECG signal and peaks")
+
+    low = min(np.min(raw), np.min(ecg_cleaned))
+    high = max(np.max(raw), np.max(ecg_cleaned))
+    quality = nk.rescale(quality, to=[low, high])
+    indices = minmax_envelope(quality, n_pixels)
+    ax.fill_between(indices / sampling_rate, quality.min(), quality[indices], alpha=0.12, zorder=0,
+                    facecolor="#4CAF50", label="Signal quality")
+
+    _plot_envelope(ax, raw, sampling_rate, n_pixels, color="#B0BEC5", label="Raw signal", zorder=1)
+    ax.scatter(peaks / sampling_rate, ecg_cleaned[peaks], color="#FFC107", label="R-peaks", zorder=2)
+    _plot_envelope(ax, ecg_cleaned, sampling_rate, n_pixels, color="#F44336", label="Cleaned signal",
+                   zorder=3, linewidth=1)
+    ax.legend(loc="upper right")
+    return ax
+
+
+def _signal_rate_envelope_plot(rate, peaks, sampling_rate, n_pixels, ax):
+    # Same panel as _signal_rate_plot, with the rate reduced to its min/max envelope
+    ax.set_title("Heart Rate")
+    ax.set_xlabel("Time (seconds)")
+    ax.set_ylabel("Beats per minute (bpm)")
+
+    _plot_envelope(ax, rate, sampling_rate, n_pixels, color="#FF5722", label="Rate", linewidth=1.5)
+    ax.axhline(y=np.mean(rate), label="Mean", linestyle="--", color="#FF9800")
+    # Every rate point is drawn at its exact sample position, however long the recording
+    ax.scatter(peaks / sampling_rate, rate[peaks], color="#FFC107", label="Peaks", zorder=2)
+    ax.legend(loc="upper right")
+    return ax
+
+
+def plot_ecg(signals_full, info, figure_filename, n_pixels=None):
+    """Figure of nk.ecg_process outputs (signals_full a compact.Signals)."""
+    # Following is modification of ecg_plot()
+    # https://neuropsychology.github.io/NeuroKit/_modules/neurokit2/ecg/ecg_plot.html#ecg_plot
+    # With n_pixels, every trace is reduced to a min/max envelope of that many bins first
+
+    # Select segment to plot
+    ecg_signals = signals_full.to_dataframe()  # You can adjust the segment here if needed
+
+    # Extract R-peaks (from the signals as they might have been cropped; an index array, no scan)
+    if "ECG_R_Peaks" in signals_full.columns:
+        info["ECG_R_Peaks"] = signals_full.events("ECG_R_Peaks")
+
+    # Prepare figure and set axes
+    gs = matplotlib.gridspec.GridSpec(2, 2, width_ratios=[2 / 3, 1 / 3])
+    fig = plt.figure(constrained_layout=False)
+    ax0 = fig.add_subplot(gs[0, :-1])
+    ax1 = fig.add_subplot(gs[1, :-1], sharex=ax0)
+    ax2 = fig.add_subplot(gs[:, -1])
+
+    if n_pixels:
+        ax0 = _ecg_peaks_envelope_plot(
+            ecg_signals["ECG_Clean"].values,
+            info["ECG_R_Peaks"],
+            info["sampling_rate"],
+            raw=ecg_signals["ECG_Raw"].values,
+            quality=ecg_signals["ECG_Quality"].values,
+            n_pixels=n_pixels,
+            ax=ax0,
+        )
+        ax1 = _signal_rate_envelope_plot(
+            ecg_signals["ECG_Rate"].values,
+            info["ECG_R_Peaks"],
+            info["sampling_rate"],
+            n_pixels=n_pixels,
+            ax=ax1,
+        )
+
+        # Overlaying every beat of a long recording adds nothing (and ecg_segment copies
+        # the whole DataFrame per beat); use a block of beats from the middle instead
+        segment_signals, segment_peaks = ecg_signals, info["ECG_R_Peaks"]
+        if len(segment_peaks) > MAX_SEGMENT_BEATS:
+            first = (len(segment_peaks) - MAX_SEGMENT_BEATS) // 2
+            segment_peaks = segment_peaks[first:first + MAX_SEGMENT_BEATS]
+            start = max(segment_peaks[0] - 2 * info["sampling_rate"], 0)
+            end = min(segment_peaks[-1] + 2 * info["sampling_rate"], len(ecg_signals))
+            segment_signals = ecg_signals.iloc[start:end].reset_index(drop=True)
+            segment_peaks = segment_peaks - start
+    else:
+        # Plot signals
+        phase = None
+        if "ECG_Phase_Ventricular" in ecg_signals.columns:
+            phase = ecg_signals["ECG_Phase_Ventricular"].values
+
+        ax0 = _ecg_peaks_plot(
+            ecg_signals["ECG_Clean"].values,
+            info=info,
+            sampling_rate=info["sampling_rate"],
+            raw=ecg_signals["ECG_Raw"].values,
+            quality=ecg_signals["ECG_Quality"].values,
+            phase=phase,
+            ax=ax0,
+        )
+
+        # Plot Heart Rate
+        ax1 = _signal_rate_plot(
+            ecg_signals["ECG_Rate"].values,
+            info["ECG_R_Peaks"],
+            sampling_rate=info["sampling_rate"],
+            title="Heart Rate",
+            ytitle="Beats per minute (bpm)",
+            color="#FF5722",
+            color_mean="#FF9800",
+            color_points="#FFC107",
+            ax=ax1,
+        )
+        segment_signals, segment_peaks = ecg_signals, info["ECG_R_Peaks"]
+
+    # Plot individual heartbeats
+    ax2 = ecg_segment(
+        segment_signals,
+        segment_peaks,
+        info["sampling_rate"],
+        show="return",
+        ax=ax2,
+    )
+
+    ax0.set_position([0.1, 0.9, 0.8, 0.2])
+    ax1.set_position([0.1, 0.5, 0.8, 0.2])
+    ax2.set_position([0.1, 0.1, 0.8, 0.2])
+
+    # Save the figure to a file and close it to free memory
+    fig.savefig(figure_filename, bbox_inches='tight', pad_inches=0.1)
+    plt.close(fig)
+    print(f"Saved figure to {figure_filename}")
+
+
+def _eda_envelope_plot(eda_signals, info, sampling_rate, n_pixels):
+    # Same three panels as nk.eda_plot, with every trace reduced to its min/max envelope;
+    # SCR onsets and peaks are drawn at their exact sample positions
+    fig, (ax0, ax1, ax2) = plt.subplots(nrows=3, ncols=1, sharex=True)
+    fig.suptitle("Electrodermal Activity (EDA)", fontweight="bold")
+    plt.tight_layout(h_pad=0.2)
+
+    ax0.set_title("Raw and Cleaned Signal")
+    _plot_envelope(ax0, eda_signals["EDA_Raw"].values, sampling_rate, n_pixels, color="#B0BEC5",
+                   label="Raw", zorder=1)
+    _plot_envelope(ax0, eda_signals["EDA_Clean"].values, sampling_rate, n_pixels, color="#9C27B0",
+                   label="Cleaned", linewidth=1.5, zorder=1)
+    ax0.legend(loc="upper right")
+
+    phasic = eda_signals["EDA_Phasic"].values
+    onsets = np.asarray(info["SCR_Onsets"])
+    peaks = np.asarray(info["SCR_Peaks"])
+    onsets = onsets[~np.isnan(onsets)].astype(int) if onsets.dtype.kind == 'f' else onsets
+    peaks = peaks[~np.isnan(peaks)].astype(int) if peaks.dtype.kind == 'f' else peaks
+
+    ax1.set_title("Skin Conductance Response (SCR)")
+    _plot_envelope(ax1, phasic, sampling_rate, n_pixels, color="#E91E63", label="Phasic Component",
+                   linewidth=1.5, zorder=1)
+    ax1.scatter(onsets / sampling_rate, phasic[onsets], color="#FFA726", label="SCR - Onsets", zorder=2)
+    ax1.scatter(peaks / sampling_rate, phasic[peaks], color="#1976D2", label="SCR - Peaks", zorder=2)
+    ax1.legend(loc="upper right")
+
+    ax2.set_title("Skin Conductance Level (SCL)")
+    ax2.set_xlabel("Time (seconds)")
+    _plot_envelope(ax2, eda_signals["EDA_Tonic"].values, sampling_rate, n_pixels, color="#673AB7",
+                   label="Tonic Component", linewidth=1.5)
+    ax2.legend(loc="upper right")
+    return fig
+
+
+def plot_eda(signals_full, info, figure_filename, n_pixels=None):
+    """Figure of nk.eda_process outputs (signals_full a compact.Signals)."""
+    signals_full = signals_full.to_dataframe()
+
+    # With n_pixels, every trace is reduced to a min/max envelope of that many bins first
+    if n_pixels:
+        fig = _eda_envelope_plot(signals_full, info, info["sampling_rate"], n_pixels)
+    else:
+        nk.eda_plot(signals_full, info)
+        fig = plt.gcf()
+
+    # Save the figure to a file and close it to free memory
+    fig.savefig(figure_filename, bbox_inches='tight', pad_inches=0.1)
+    plt.close(fig)
+    print(f"Saved figure to {figure_filename}")
+
+
+def _render(kind, plot, raw_data_folder, results_folder, participant, task, cache_folder=None,
+            n_pixels=None, target_rate=None, segment=None, session=None):
+    # Same input as the analysis stage (target_rate and segment included), so the cache entry is found
+    data, sampling_rate = analysis.read_recording(raw_data_folder, participant, task, kind, target_rate, segment,
+                                                  session)
+    if data is None:
+        return None
+
+    # Cached by the analysis stage; only recomputed if the cache is switched off or evicted
+    with instrument.stage('load'):
+        signals_full, info = nk_cache.process_compact(kind, data, sampling_rate=sampling_rate,
+                                                      cache_folder=cache_folder)
+
+    figure_filename = results_folder + f'/{signal_store.recording_name(participant, task, session)}_{kind}_nk.png'
+    try:
+        with instrument.stage('plot'):
+            plot(signals_full, info, figure_filename, n_pixels=n_pixels)
+    finally:
+        # Never keep figures of a failed plot around
+        plt.close('all')
+    return figure_filename
+
+
+def render_ecg(raw_data_folder, results_folder, participant, task, cache_folder=None, n_pixels=None,
+               target_rate=None, segment=None, session=None):
+    return _render('ecg', plot_ecg, raw_data_folder, results_folder, participant, task, cache_folder, n_pixels,
+                   target_rate, segment, session)
+
+
+def render_eda(raw_data_folder, results_folder, participant, task, cache_folder=None, n_pixels=None,
+               target_rate=None, segment=None, session=None):
+    return _render('eda', plot_eda, raw_data_folder, results_folder, participant, task, cache_folder, n_pixels,
+                   target_rate, segment, session)
+
+
+def render_all(render, jobs, n_workers=1):
+    """Render the figures of all jobs; failed figures are reported, not raised."""
+    outputs = instrument.run_jobs(render, jobs, n_workers=n_workers, capture_errors=True, group='render')
+    for error in parallel.failed(outputs):
+        print(f"Rendering {error.job['participant']} {error.job['task']} failed: {error.error}")
+    return outputs
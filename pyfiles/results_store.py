@@ -0,0 +1,188 @@
+# # Results store
+# The interval-related results of 03a / 03b, one partition per recording: a small .csv
+# file (<results>/<kind>_rows/<recording>.csv) written atomically as soon as the
+# recording is analysed, so a crash keeps everything finished so far and a re-run only
+# replaces the recordings it processes.
+#
+# The results of a kind are the partitions of the recordings that are in the manifest
+# of the raw data folder (current), whichever run wrote them. Partitions of recordings
+# removed or renamed since are stale: they are left out and reported, and prune()
+# deletes them. Both export_csv (ecg_results.csv / eda_results.csv) and read() follow
+# this rule. read() returns one typed table (floats for the metrics) and keeps it as a
+# columnar <kind>_results.npz cache; only partitions that changed since the cache was
+# written are parsed again.
+
+import os
+
+import numpy as np
+import pandas as pd
+
+import manifest
+import signal_store
+import summary
+
+LABELS = ['Participant', 'Condition']
+
+
+def partition_folder(results_folder, kind):
+    return os.path.join(results_folder, f'{kind}_rows')
+
+
+def partition_path(results_folder, kind, participant, task, session=None):
+    name = signal_store.recording_name(participant, task, session)
+    return os.path.join(partition_folder(results_folder, kind), name + '.csv')
+
+
+def cache_path(results_folder, kind):
+    return os.path.join(results_folder, f'{kind}_results.npz')
+
+
+def write(results_folder, kind, participant, task, results, session=None):
+    """Store the results (a DataFrame) of one recording, replacing an older partition."""
+    filename = partition_path(results_folder, kind, participant, task, session)
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    results.to_csv(filename + '.tmp', index=False)
+    os.replace(filename + '.tmp', filename)
+    return filename
+
+
+def remove(results_folder, kind, participant, task, session=None):
+    """Remove the partition of a recording (e.g. one that failed in this run), if any."""
+    filename = partition_path(results_folder, kind, participant, task, session)
+    if os.path.exists(filename):
+        os.remove(filename)
+
+
+def partitions(results_folder, kind):
+    """Paths of all partitions, in natural recording order (sub-2 before sub-10)."""
+    folder = partition_folder(results_folder, kind)
+    if not os.path.isdir(folder):
+        return []
+    names = [filename[:-len('.csv')] for filename in os.listdir(folder) if filename.endswith('.csv')]
+    names.sort(key=lambda name: manifest.sort_key({"name": name}))
+    return [os.path.join(folder, name + '.csv') for name in names]
+
+
+def current(results_folder, kind, raw_data_folder):
+    """The partitions of the recordings in the manifest of raw_data_folder, and the stale rest."""
+    names = {entry["name"] for entry in manifest.load(raw_data_folder)}
+    paths, stale = [], []
+    for path in partitions(results_folder, kind):
+        (paths if os.path.basename(path)[:-len('.csv')] in names else stale).append(path)
+    return paths, stale
+
+
+def _report_stale(kind, stale):
+    if stale:
+        names = ', '.join(os.path.basename(path)[:-len('.csv')] for path in stale)
+        print(f"Leaving out the {kind.upper()} results of {len(stale)} recording(s) no longer in the "
+              f"raw data folder: {names} (see results_store.prune)")
+
+
+def prune(results_folder, kind, raw_data_folder):
+    """Delete the stale partitions (see current); returns their paths."""
+    _, stale = current(results_folder, kind, raw_data_folder)
+    for path in stale:
+        os.remove(path)
+    return stale
+
+
+def writer(results_folder, kind):
+    """A parallel.run_jobs callback storing the results of every recording as soon as it is done.
+
+    A recording that failed or gave no results loses its partition from an earlier run.
+    """
+    def callback(job, results):
+        if isinstance(results, pd.DataFrame):
+            write(results_folder, kind, job["participant"], job["task"], results, job.get("session"))
+        else:
+            remove(results_folder, kind, job["participant"], job["task"], job.get("session"))
+    return callback
+
+
+def export_csv(results_folder, kind, raw_data_folder, filename=None):
+    """Concatenate the current partitions into <kind>_results.csv, as 03a / 03b wrote it.
+
+    Returns the filename, or None if there are no results.
+    """
+    paths, stale = current(results_folder, kind, raw_data_folder)
+    _report_stale(kind, stale)
+    if not paths:
+        return None
+    filename = filename or os.path.join(results_folder, f'{kind}_results.csv')
+    # round_trip keeps every float exactly as the analysis wrote it
+    rows = [pd.read_csv(path, float_precision='round_trip') for path in paths]
+    pd.concat(rows, ignore_index=True).to_csv(filename, index=False)
+    return filename
+
+
+def _load_cache(filename):
+    if not os.path.exists(filename):
+        return None
+    with np.load(filename, allow_pickle=False) as data:
+        columns = [str(column) for column in data["columns"]]
+        return {
+            "files": {str(path): (int(size), int(mtime), int(start), int(stop))
+                      for path, size, mtime, start, stop in zip(data["paths"], data["sizes"], data["mtimes"],
+                                                                data["starts"], data["stops"])},
+            "table": pd.DataFrame({column: data[f"column/{column}"] for column in columns}),
+        }
+
+
+def _save_cache(filename, table, paths, stats, starts, stops):
+    arrays = {f"column/{column}": table[column].to_numpy(dtype=str if column in LABELS else np.float64)
+              for column in table.columns}
+    arrays.update(columns=np.array(list(table.columns), dtype=str), paths=np.array(paths, dtype=str),
+                  sizes=np.array([size for size, _ in stats], dtype=np.int64),
+                  mtimes=np.array([mtime for _, mtime in stats], dtype=np.int64),
+                  starts=np.array(starts, dtype=np.int64), stops=np.array(stops, dtype=np.int64))
+    with open(filename + '.tmp', 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(filename + '.tmp', filename)
+
+
+def read(results_folder, kind, raw_data_folder, participants=None, tasks=None):
+    """The current results of a kind as one table: Participant, Condition and float metric columns.
+
+    Without partitions (results from before the store) <kind>_results.csv is read instead.
+    """
+    if not partitions(results_folder, kind):
+        table = summary.numeric(pd.read_csv(os.path.join(results_folder, f'{kind}_results.csv')))
+    else:
+        paths, stale = current(results_folder, kind, raw_data_folder)
+        _report_stale(kind, stale)
+        if not paths:
+            raise ValueError(f"No {kind.upper()} results of the recordings in {raw_data_folder}")
+        table = _read_partitions(results_folder, kind, paths)
+
+    if participants is not None:
+        table = table[table['Participant'].isin(participants)]
+    if tasks is not None:
+        table = table[table['Condition'].isin(tasks)]
+    return table.reset_index(drop=True)
+
+
+def _read_partitions(results_folder, kind, paths):
+    cache = _load_cache(cache_path(results_folder, kind))
+    stats = [(stat.st_size, stat.st_mtime_ns) for stat in map(os.stat, paths)]
+
+    parts, starts, stops, changed = [], [], [], False
+    position = 0
+    for path, (size, mtime) in zip(paths, stats):
+        known = cache["files"].get(path) if cache is not None else None
+        if known is not None and known[:2] == (size, mtime):
+            part = cache["table"].iloc[known[2]:known[3]]
+        else:
+            part = summary.numeric(pd.read_csv(path, float_precision='round_trip'))
+            changed = True
+        parts.append(part)
+        starts.append(position)
+        position += len(part)
+        stops.append(position)
+
+    table = pd.concat(parts, ignore_index=True)
+    # Labels first, then the metrics in the order of the first partition
+    table = table[LABELS + [column for column in table.columns if column not in LABELS]]
+    if changed or cache is None or len(cache["files"]) != len(paths):
+        _save_cache(cache_path(results_folder, kind), table, paths, stats, starts, stops)
+    return table
@@ -0,0 +1,245 @@
+# # Binary signal store
+# Every recording is stored as one raw little-endian float64 file per channel
+# (e.g. sub-1_baseline_ecg.bin) next to a small JSON sidecar (sub-1_baseline.json)
+# that holds the sampling rate, the channel names and participant / task / session.
+# Downstream stages open the channels with np.memmap, so nothing is parsed or copied.
+
+import json
+import os
+
+import numpy as np
+
+# Data type of all stored channels
+DTYPE = '<f8'
+
+
+def recording_name(participant, task, session=None):
+    """Name of a recording as used in all file names, e.g. sub-1_baseline."""
+    name = f"{participant}_{task}"
+    if session:
+        name += f"-{session}"
+    return name
+
+
+def sidecar_path(folder, name):
+    return os.path.join(folder, name + '.json')
+
+
+def channel_path(folder, name, channel):
+    return os.path.join(folder, f"{name}_{channel.lower()}.bin")
+
+
+def csv_path(folder, name, channel):
+    return os.path.join(folder, f"{name}_{channel.lower()}.csv")
+
+
+def write_sidecar(folder, name, meta):
+    # Write to a temporary file first so a crash never leaves half a sidecar behind
+    filename = sidecar_path(folder, name)
+    with open(filename + '.tmp', 'w') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(filename + '.tmp', filename)
+
+
+def read_sidecar(folder, name):
+    with open(sidecar_path(folder, name)) as f:
+        return json.load(f)
+
+
+def exists(folder, name):
+    return os.path.exists(sidecar_path(folder, name))
+
+
+class RecordingWriter:
+    """Write a recording block by block; the sidecar is written on close()."""
+
+    def __init__(self, folder, name, channels, sampling_rate, participant=None, task=None,
+                 session=None):
+        os.makedirs(folder, exist_ok=True)
+        self.folder = folder
+        self.name = name
+        self.meta = {
+            "participant": participant,
+            "task": task,
+            "session": session,
+            "sampling_rate": sampling_rate,
+            "channels": list(channels),
+            "n_samples": 0,
+            "dtype": DTYPE,
+        }
+        self._files = {channel: open(channel_path(folder, name, channel), 'wb') for channel in channels}
+
+    def append(self, block):
+        """Append a dict of {channel name: samples}; all channels must be given the same length."""
+        lengths = {len(block[channel]) for channel in self._files}
+        if len(lengths) > 1:
+            raise ValueError(f"Channels of {self.name} differ in length: {sorted(lengths)}")
+
+        for channel, f in self._files.items():
+            np.asarray(block[channel], dtype=DTYPE).tofile(f)
+        self.meta["n_samples"] += lengths.pop() if lengths else 0
+
+    def close(self):
+        for f in self._files.values():
+            f.close()
+
+        # The sidecar is written last: a recording only exists once its sidecar does
+        write_sidecar(self.folder, self.name, self.meta)
+        return self.meta
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            for f in self._files.values():
+                f.close()
+
+
+def write_recording(folder, name, channels, sampling_rate, participant=None, task=None,
+                    session=None, export_csv=False):
+    """Write a dict of {channel name: samples} as one recording."""
+    with RecordingWriter(folder, name, channels, sampling_rate, participant, task, session) as writer:
+        writer.append(channels)
+    meta = writer.meta
+
+    if export_csv:
+        export_recording_csv(folder, name)
+
+    return meta
+
+
+def open_channel(folder, name, channel, meta=None):
+    """Open one channel read-only with np.memmap (no parsing, no copy)."""
+    if meta is None:
+        meta = read_sidecar(folder, name)
+    if channel.upper() not in [c.upper() for c in meta["channels"]]:
+        raise KeyError(f"{name} has no channel {channel}, only {meta['channels']}")
+
+    # np.memmap cannot map an empty file
+    if meta["n_samples"] == 0:
+        return np.empty(0, dtype=meta["dtype"])
+    return np.memmap(channel_path(folder, name, channel), dtype=meta["dtype"], mode='r',
+                     shape=(meta["n_samples"],))
+
+
+def open_recording(folder, name):
+    """Return the sidecar and a dict of {channel name: memmap} for a recording."""
+    meta = read_sidecar(folder, name)
+    channels = {channel: open_channel(folder, name, channel, meta) for channel in meta["channels"]}
+    return meta, channels
+
+
+def export_recording_csv(folder, name, csv_folder=None):
+    """Export every channel to the one-value-per-line .csv files used before the binary store."""
+    csv_folder = csv_folder or folder
+    os.makedirs(csv_folder, exist_ok=True)
+
+    meta, channels = open_recording(folder, name)
+    filenames = []
+    for channel, data in channels.items():
+        filename = csv_path(csv_folder, name, channel)
+        np.savetxt(filename, data, delimiter=',', header=channel.upper())
+        filenames.append(filename)
+    return filenames
+
+
+# ## Stage outputs
+# Intermediate results of a stage (e.g. preprocessed_ecg) are stored as one .npy file
+# per recording and field in <folder>/<stage>/. Each recording has a small index entry
+# (<recording>.json) listing its fields, so recordings can be written independently,
+# also from parallel workers. Consumers open only the arrays they need, memory-mapped,
+# so loading costs O(selected data) and no pickle is involved.
+
+def stage_folder(folder, stage):
+    return os.path.join(folder, stage)
+
+
+def read_stage_index(folder, stage):
+    """Index entries of all recordings of a stage, sorted by recording name."""
+    path = stage_folder(folder, stage)
+    if not os.path.isdir(path):
+        return []
+
+    records = []
+    for filename in sorted(os.listdir(path)):
+        if filename.endswith('.json'):
+            with open(os.path.join(path, filename)) as f:
+                records.append(json.load(f))
+    return records
+
+
+def open_stage_field(folder, stage, participant, condition, field, shape, dtype=np.float64, session=None):
+    """A writable memory-mapped .npy file for one field, created in place.
+
+    Fill it and pass it to write_stage_record, which then only flushes it: a field can
+    be computed straight into the store without holding it in memory.
+    """
+    path = stage_folder(folder, stage)
+    os.makedirs(path, exist_ok=True)
+    filename = os.path.join(path, f"{recording_name(participant, condition, session)}_{field}.npy")
+    return np.lib.format.open_memmap(filename, mode='w+', dtype=dtype, shape=shape)
+
+
+def _stored_at(data, filename):
+    """Whether data is a memmap of filename (e.g. from open_stage_field)."""
+    return (isinstance(data, np.memmap) and data.filename is not None
+            and os.path.exists(filename) and os.path.samefile(data.filename, filename))
+
+
+def write_stage_record(folder, stage, participant, condition, arrays, session=None):
+    """Store the arrays ({field: array}) of one recording and its index entry."""
+    path = stage_folder(folder, stage)
+    os.makedirs(path, exist_ok=True)
+    name = recording_name(participant, condition, session)
+
+    fields = {}
+    for field, data in arrays.items():
+        filename = f"{name}_{field}.npy"
+        if _stored_at(data, os.path.join(path, filename)):
+            data.flush()
+        else:
+            data = np.asarray(data)
+            np.save(os.path.join(path, filename), data, allow_pickle=False)
+        fields[field] = {"file": filename, "dtype": data.dtype.str, "shape": list(data.shape)}
+
+    # The index entry is written last (and atomically), replacing an older one
+    record = {
+        "name": name,
+        "participant": participant,
+        "condition": condition,
+        "session": session,
+        "fields": fields,
+    }
+    filename = os.path.join(path, name + '.json')
+    with open(filename + '.tmp', 'w') as f:
+        json.dump(record, f, indent=2)
+    os.replace(filename + '.tmp', filename)
+
+
+def stage_record_path(folder, stage, participant, condition, session=None):
+    return os.path.join(stage_folder(folder, stage), recording_name(participant, condition, session) + '.json')
+
+
+def open_stage(folder, stage, fields=None, participants=None, conditions=None):
+    """Open the stored arrays of a stage, memory-mapped.
+
+    Returns a list of dicts (participant, condition, session and one entry per field),
+    restricted to the given fields / participants / conditions if specified.
+    """
+    records = []
+    for record in read_stage_index(folder, stage):
+        if participants is not None and record["participant"] not in participants:
+            continue
+        if conditions is not None and record["condition"] not in conditions:
+            continue
+
+        entry = {key: record[key] for key in ("participant", "condition", "session")}
+        for field, meta in record["fields"].items():
+            if fields is None or field in fields:
+                entry[field] = np.load(os.path.join(stage_folder(folder, stage), meta["file"]),
+                                       mmap_mode='r', allow_pickle=False)
+        records.append(entry)
+    return records
@@ -0,0 +1,119 @@
+# # Condition summaries
+# 04a_summary-ecg.py and 04b_summary-eda.py summarize the results table (one row per
+# recording) per condition. Summary pivots that table once into a participant x
+# condition x metric array, so condition means and task / baseline ratios of every
+# metric are single NumPy operations over the whole array. A missing recording is a NaN
+# cell: it is left out of the means and reported by missing(), instead of breaking the
+# summary of everyone else.
+
+import warnings
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+
+def numeric(results):
+    """The results table with every metric as floats.
+
+    nk.*_intervalrelated stores many metrics as one-element arrays, which end up as
+    '[[0.5]]' in the .csv files; columns without any number are dropped.
+    """
+    columns = {}
+    for column in results.columns:
+        values = results[column]
+        if column not in ('Participant', 'Condition') and values.dtype == object:
+            values = pd.to_numeric(values.astype(str).str.strip('[] '), errors='coerce')
+            if values.isna().all():
+                continue
+        columns[column] = values
+    return pd.DataFrame(columns)
+
+
+class Summary:
+    """Results of all recordings as values[participant, condition, metric]."""
+
+    def __init__(self, results, conditions=None, metrics=None):
+        """results has Participant and Condition columns; metrics defaults to every other column.
+
+        Participants keep the order of the table; conditions default to that order too.
+        Several rows of one participant and condition (e.g. sessions) are averaged.
+        """
+        results = numeric(results)
+        self.participants = list(pd.unique(results['Participant']))
+        self.conditions = list(pd.unique(results['Condition'])) if conditions is None else list(conditions)
+        if metrics is None:
+            metrics = [column for column in results.columns if column not in ('Participant', 'Condition')]
+        self.metrics = list(metrics)
+
+        table = results.groupby(['Participant', 'Condition'], sort=False)[self.metrics].mean()
+        cells = pd.MultiIndex.from_product([self.participants, self.conditions], names=['Participant', 'Condition'])
+        self.values = table.reindex(cells).to_numpy(dtype=np.float64).reshape(
+            len(self.participants), len(self.conditions), len(self.metrics))
+
+    @classmethod
+    def read_csv(cls, filename, conditions=None, metrics=None):
+        return cls(pd.read_csv(filename), conditions, metrics)
+
+    def _index(self, metric):
+        return self.metrics.index(metric)
+
+    def metric(self, metric):
+        """One metric as a participant x condition DataFrame."""
+        return pd.DataFrame(self.values[:, :, self._index(metric)], index=self.participants,
+                            columns=self.conditions)
+
+    def missing(self):
+        """(participant, condition) pairs without any result."""
+        empty = np.isnan(self.values).all(axis=2)
+        return [(self.participants[p], self.conditions[c]) for p, c in zip(*np.nonzero(empty))]
+
+    def counts(self):
+        """Number of participants with a value, as a condition x metric DataFrame."""
+        return pd.DataFrame((~np.isnan(self.values)).sum(axis=0), index=self.conditions, columns=self.metrics)
+
+    def means(self):
+        """Mean over participants (missing cells left out), as a condition x metric DataFrame."""
+        with _ignore_empty():
+            return pd.DataFrame(np.nanmean(self.values, axis=0), index=self.conditions, columns=self.metrics)
+
+    def ratios(self, baseline='baseline'):
+        """Task / baseline ratios as an array [participant, task, metric] and the task names.
+
+        A ratio is NaN where either value is missing or the baseline is 0.
+        """
+        b = self.conditions.index(baseline)
+        tasks = [condition for condition in self.conditions if condition != baseline]
+        task_values = self.values[:, [self.conditions.index(task) for task in tasks], :]
+        base = self.values[:, b:b + 1, :]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratios = np.where(base != 0, task_values / base, np.nan)
+        return ratios, tasks
+
+    def ratio(self, metric, baseline='baseline'):
+        """Task / baseline ratios of one metric as a participant x task DataFrame."""
+        ratios, tasks = self.ratios(baseline)
+        return pd.DataFrame(ratios[:, :, self._index(metric)], index=self.participants, columns=tasks)
+
+    def mean_ratios(self, baseline='baseline'):
+        """Mean task / baseline ratio over participants, as a task x metric DataFrame."""
+        ratios, tasks = self.ratios(baseline)
+        with _ignore_empty():
+            return pd.DataFrame(np.nanmean(ratios, axis=0), index=tasks, columns=self.metrics)
+
+    def table(self, baseline='baseline'):
+        """Means, participant counts and mean ratios to the baseline of every metric, one row per condition."""
+        means = self.means().add_suffix('_Mean')
+        counts = self.counts().add_suffix('_N')
+        ratios = self.mean_ratios(baseline).add_suffix('_Ratio').reindex(self.conditions)
+        table = pd.concat([means, counts, ratios], axis=1)
+        table.index.name = 'Condition'
+        return table
+
+
+@contextmanager
+def _ignore_empty():
+    # np.nanmean warns on all-NaN slices (e.g. a condition nobody has); those are NaN anyway
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        yield
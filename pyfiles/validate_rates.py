@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# # Validation: processing at a lower sampling rate
+# 03a / 03b can downsample a modality before the NeuroKit analysis (ecg_rate / eda_rate).
+# This script processes every recording of the raw data folder at its own sampling rate
+# and at each candidate rate, and compares the interval-related metrics and the time
+# nk.*_process takes. A rate is safe to use when all its metrics stay within the
+# tolerance of the full-rate result (SCR counts must be identical).
+
+import time
+
+import neurokit2 as nk
+import numpy as np
+import pandas as pd
+
+import analysis
+import manifest
+
+# Parameters
+raw_data_folder = '/Users/erwin/Documents/ProjectPsychophysiologyData/raw-data/'
+results_folder = '/Users/erwin/Documents/ProjectPsychophysiologyData/results/'
+
+# Candidate rates (Hz) and the metrics compared per modality
+rates = {
+    'eda': [100, 50, 20, 10],
+    'ecg': [500, 250],
+}
+metrics = {
+    'eda': ['SCR_Peaks_N', 'SCR_Peaks_Amplitude_Mean', 'EDA_Tonic_SD'],
+    'ecg': ['ECG_Rate_Mean', 'HRV_MeanNN', 'HRV_SDNN', 'HRV_RMSSD'],
+}
+
+# Largest accepted relative difference of a metric to its full-rate value
+tolerance = 0.02
+
+FUNCTIONS = {
+    'ecg': (nk.ecg_process, nk.ecg_intervalrelated),
+    'eda': (nk.eda_process, nk.eda_intervalrelated),
+}
+
+
+def process(kind, data, sampling_rate):
+    """Seconds taken by nk.*_process and the interval-related results (one row)."""
+    process_function, intervalrelated = FUNCTIONS[kind]
+    start = time.perf_counter()
+    signals, info = process_function(data, sampling_rate=sampling_rate)
+    seconds = time.perf_counter() - start
+    return seconds, intervalrelated(signals, sampling_rate=sampling_rate).iloc[0]
+
+
+def relative_difference(value, reference):
+    value, reference = float(np.ravel(value)[0]), float(np.ravel(reference)[0])
+    if np.isnan(value) and np.isnan(reference):
+        return 0.0
+    return abs(value - reference) / max(abs(reference), 1e-12)
+
+
+def validate(kind, entry):
+    """One row per rate (the first at the recording's own rate) for one recording."""
+    rows = []
+    for target_rate in [None] + rates[kind]:
+        data, sampling_rate = analysis.read_recording(raw_data_folder, entry["participant"], entry["task"],
+                                                      kind, target_rate, session=entry["session"])
+        seconds, results = process(kind, data, sampling_rate)
+        rows.append(dict({"recording": entry["name"], "modality": kind, "sampling_rate": sampling_rate,
+                          "seconds": seconds},
+                         **{metric: float(np.ravel(results[metric])[0]) for metric in metrics[kind]}))
+
+    reference = rows[0]
+    for row in rows:
+        row["speedup"] = reference["seconds"] / row["seconds"]
+        for metric in metrics[kind]:
+            row[f"{metric} difference"] = relative_difference(row[metric], reference[metric])
+    return rows
+
+
+def summarize(table):
+    """Per modality and rate: the largest difference of every metric and the median speedup."""
+    rows = []
+    for (kind, sampling_rate), group in table.groupby(['modality', 'sampling_rate'], sort=False):
+        row = {"modality": kind, "sampling_rate": sampling_rate, "median speedup": group["speedup"].median()}
+        for metric in metrics[kind]:
+            row[f"max {metric} difference"] = group[f"{metric} difference"].max()
+        differences = group[[f"{metric} difference" for metric in metrics[kind]]]
+        row["unchanged"] = bool((differences <= tolerance).all(axis=None)) and \
+            (kind != 'eda' or bool((group["SCR_Peaks_N difference"] == 0).all()))
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+if __name__ == '__main__':
+    entries = manifest.load(raw_data_folder)
+
+    rows = []
+    for kind in rates:
+        for entry in manifest.select(entries, modality=kind.upper()):
+            rows.extend(validate(kind, entry))
+
+    table = pd.DataFrame(rows)
+    output_filename = results_folder + 'rate_validation.csv'
+    table.to_csv(output_filename, index=False)
+    print(f"Saved per-recording results to {output_filename}")
+
+    print(summarize(table).round(4).to_string(index=False))
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# helper modules live next to the notebook scripts in pyfiles/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'pyfiles'))
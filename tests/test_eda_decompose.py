@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+import scipy.signal as signal
+
+import eda_decompose
+
+
+def _scrs(onsets, amplitudes, fs, duration):
+    # Phasic signal of SCRs (difference of exponentials, peak ~2 s after onset)
+    t = np.arange(int(duration * fs)) / fs
+    x = np.zeros_like(t)
+    for onset, amplitude in zip(onsets, amplitudes):
+        s = np.clip(t - onset, 0, None)
+        shape = np.exp(-s / 4) - np.exp(-s / 0.75)
+        x += amplitude * shape / shape.max()
+    return x
+
+
+def _online(x, height, distance, block_sizes):
+    detector = eda_decompose.OnlinePeaks(height, distance)
+    peaks, start = [], 0
+    for size in block_sizes:
+        peaks.extend(detector.process(x[start:start + size]))
+        start += size
+    # Flush: distance samples past the end confirm the last peaks, as find_peaks sees them
+    peaks.extend(detector.process(np.full(detector.distance, -np.inf)))
+    return np.array([peak for peak in peaks if peak < len(x)], dtype=int)
+
+
+@pytest.mark.parametrize("fs", [10, 32, 15.5])
+def test_online_peaks_match_find_peaks_for_sparse_scrs(fs):
+    rng = np.random.default_rng(1)
+    duration = 300
+    # SCRs a few seconds apart, some below the height and two closer together than the distance
+    onsets = np.sort(rng.uniform(0, duration - 10, size=40))
+    onsets = np.concatenate([onsets, [onsets[5] + 0.5]])
+    amplitudes = rng.uniform(0.005, 0.5, size=len(onsets))
+    x = _scrs(onsets, amplitudes, fs, duration)
+
+    expected, _ = signal.find_peaks(x, height=0.02, distance=fs)
+    block_sizes = rng.integers(1, 3 * int(fs), size=len(x))
+    assert len(expected) > 10
+    assert np.array_equal(_online(x, 0.02, fs, block_sizes), expected)
+
+
+def test_online_peaks_float_distance():
+    # Peaks 15 samples apart are too close for distance 15.5
+    x = np.zeros(100)
+    x[[20, 35, 70]] = [1.0, 0.5, 0.8]
+    expected, _ = signal.find_peaks(x, height=0.02, distance=15.5)
+    assert np.array_equal(_online(x, 0.02, 15.5, [7] * 15), expected)
+
+
+def test_decompose_online_with_a_float_sampling_rate():
+    fs = 15.5
+    eda = 2 + 0.01 * np.arange(int(120 * fs)) / fs + _scrs([20, 60, 90], [0.3, 0.2, 0.4], fs, 120)
+    tonic, phasic, peaks, decomposer = eda_decompose.decompose_online(eda, fs)
+    assert len(tonic) == len(phasic) == len(eda)
+    assert np.isnan(tonic[-decomposer.delay:]).all() and not np.isnan(tonic[:-decomposer.delay]).any()
+    assert len(peaks) == 3
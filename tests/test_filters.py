@@ -0,0 +1,20 @@
+import numpy as np
+import pytest
+
+import filters
+
+
+@pytest.mark.parametrize("factor", [2, 10, 100])
+def test_decimate_keeps_a_constant_signal_constant(factor):
+    # e.g. 5 uS EDA: no transient at either end (zero padding gave ~2.5 uS at the start)
+    y = filters.decimate(np.full(3000 + 7, 5.0), factor)
+    assert len(y) == -(-3007 // factor)
+    assert np.allclose(y, 5.0, rtol=0, atol=1e-9)
+
+
+def test_streaming_decimator_matches_decimate():
+    x = np.cumsum(np.random.default_rng(0).normal(size=10001)) + 5
+    decimator = filters.Decimator(10)
+    blocks = [decimator.process(x[start:start + 333]) for start in range(0, len(x), 333)]
+    y = np.concatenate(blocks + [decimator.flush()])[decimator.delay:]
+    assert np.allclose(y, filters.decimate(x, 10), rtol=0, atol=1e-12)
@@ -0,0 +1,43 @@
+import neurokit2 as nk
+import numpy as np
+
+import hrv_windows
+
+
+def _peaks(start, stop, sampling_rate, seed=0):
+    # R-peaks between start and stop (s) with RR intervals of 0.6 - 1.0 s
+    rng = np.random.default_rng(seed)
+    rr = rng.uniform(0.6, 1.0, size=int((stop - start) / 0.6) + 1)
+    times = start + np.cumsum(rr)
+    return np.round(times[times < stop] * sampling_rate).astype(int)
+
+
+def test_windows_without_beats_are_nan():
+    # Beats only from 100 s to 300 s of a 400 s recording
+    sampling_rate = 250
+    peaks = _peaks(100, 300, sampling_rate)
+    results = hrv_windows.windowed_hrv(peaks, sampling_rate, window=60, step=30, duration=400)
+
+    empty = (results["Window_End"] <= 100) | (results["Window_Start"] >= 300)
+    assert empty.any() and results["Window_Start"].iloc[-1] >= 300
+    assert (results.loc[empty, "N_Intervals"] == 0).all()
+    assert results.loc[empty, hrv_windows.METRICS].isna().all(axis=None)
+    assert results.loc[~empty, "HRV_MeanNN"].notna().all()
+
+
+def test_no_beats_at_all():
+    results = hrv_windows.windowed_hrv(np.array([], dtype=int), 250, window=60, step=30, duration=200)
+    assert len(results) == 5
+    assert results[hrv_windows.METRICS].isna().all(axis=None)
+
+
+def test_matches_hrv_time():
+    sampling_rate = 1000
+    peaks = _peaks(0, 300, sampling_rate, seed=1)
+    results = hrv_windows.windowed_hrv(peaks, sampling_rate, window=60, step=60, duration=300)
+
+    for _, window in results.iterrows():
+        start, end = window["Window_Start"] * sampling_rate, window["Window_End"] * sampling_rate
+        reference = nk.hrv_time(peaks[(peaks >= start) & (peaks <= end)], sampling_rate=sampling_rate)
+        for metric in ['HRV_MeanNN', 'HRV_SDNN', 'HRV_RMSSD', 'HRV_SDSD', 'HRV_pNN50', 'HRV_pNN20']:
+            assert np.isclose(window[metric], reference[metric].iloc[0], rtol=1e-9), metric
@@ -0,0 +1,49 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+import compact
+import nk_cache
+
+
+def _entry(cache_folder, key):
+    signals = compact.Signals.from_dataframe(pd.DataFrame({"EDA_Clean": np.linspace(1, 2, 100)}))
+    nk_cache.save(cache_folder, key, signals, {"sampling_rate": 100})
+    return nk_cache.entry_path(cache_folder, key)
+
+
+def test_load_of_an_entry_removed_by_another_worker_is_a_miss(tmp_path, monkeypatch):
+    cache_folder = str(tmp_path)
+    assert nk_cache.load(cache_folder, 'missing') is None
+
+    # Removed after it was opened: still read, only the LRU update is skipped
+    _entry(cache_folder, 'a')
+    utime = os.utime
+
+    def removed(path, *args, **kwargs):
+        os.remove(path)
+        return utime(path, *args, **kwargs)
+    monkeypatch.setattr(nk_cache.os, 'utime', removed)
+    signals, info = nk_cache.load(cache_folder, 'a')
+    assert len(signals) == 100 and info["sampling_rate"] == 100
+    assert nk_cache.load(cache_folder, 'a') is None
+
+
+def test_evict_skips_entries_removed_by_another_worker(tmp_path, monkeypatch):
+    cache_folder = str(tmp_path)
+    paths = [_entry(cache_folder, key) for key in 'abc']
+    for age, path in enumerate(paths):
+        os.utime(path, (1000 + age, 1000 + age))
+
+    # 'gone' is listed but already removed; 'a' disappears between stat and remove
+    listdir = os.listdir
+    monkeypatch.setattr(nk_cache.os, 'listdir', lambda folder: listdir(folder) + ['gone.npz'])
+    remove = os.remove
+
+    def remove_twice(path):
+        remove(path)
+        remove(path)
+    monkeypatch.setattr(nk_cache.os, 'remove', remove_twice)
+    nk_cache.evict(cache_folder, max_bytes=os.path.getsize(paths[2]))
+    assert [os.path.exists(path) for path in paths] == [False, False, True]
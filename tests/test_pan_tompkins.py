@@ -0,0 +1,18 @@
+import neurokit2 as nk
+import numpy as np
+
+import pan_tompkins
+import realtime_hr
+
+
+def test_detectors_accept_a_float_sampling_rate():
+    # e.g. the rate filters.resample gives for a non-integer ratio
+    sampling_rate = 250.5
+    ecg = nk.ecg_simulate(duration=30, sampling_rate=250, heart_rate=70, random_state=0)
+    offline = pan_tompkins.ecg_peaks(ecg, sampling_rate=sampling_rate)
+    assert 30 <= len(offline) <= 40
+
+    detector = realtime_hr.OnlineDetector(sampling_rate)
+    online = [beat["sample"] for start in range(0, len(ecg), 100) for beat in detector.process(ecg[start:start + 100])]
+    assert len(online) >= len(offline) - 3
+    assert all(np.abs(offline - sample).min() <= 0.05 * sampling_rate for sample in online)
@@ -0,0 +1,47 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+import results_store
+import signal_store
+
+
+def _store(tmp_path, recordings, stored):
+    # A raw data folder with the given recordings and a partition for every result
+    raw_folder, results_folder = str(tmp_path / 'raw-data'), str(tmp_path / 'results') + os.sep
+    for participant, task in recordings:
+        signal_store.write_recording(raw_folder, signal_store.recording_name(participant, task),
+                                     {'ECG': np.zeros(10)}, 1000, participant, task)
+    for i, (participant, task) in enumerate(stored):
+        results = pd.DataFrame({"Participant": [participant], "Condition": [task], "ECG_Rate_Mean": [60.0 + i]})
+        results_store.write(results_folder, 'ecg', participant, task, results)
+    return raw_folder, results_folder
+
+
+def test_read_and_export_use_the_partitions_of_current_recordings(tmp_path):
+    recordings = [('sub-1', 'baseline'), ('sub-2', 'baseline'), ('sub-10', 'baseline')]
+    raw_folder, results_folder = _store(tmp_path, recordings, recordings + [('sub-3', 'baseline')])
+
+    paths, stale = results_store.current(results_folder, 'ecg', raw_folder)
+    assert [os.path.basename(path) for path in paths] == ['sub-1_baseline.csv', 'sub-2_baseline.csv',
+                                                          'sub-10_baseline.csv']
+    assert [os.path.basename(path) for path in stale] == ['sub-3_baseline.csv']
+
+    table = results_store.read(results_folder, 'ecg', raw_folder)
+    exported = pd.read_csv(results_store.export_csv(results_folder, 'ecg', raw_folder))
+    assert table['Participant'].tolist() == exported['Participant'].tolist() == ['sub-1', 'sub-2', 'sub-10']
+    assert np.array_equal(table['ECG_Rate_Mean'], exported['ECG_Rate_Mean'])
+
+    # Pruning removes the stale partition only
+    assert results_store.prune(results_folder, 'ecg', raw_folder) == stale
+    assert results_store.partitions(results_folder, 'ecg') == paths
+
+
+def test_read_drops_partitions_of_removed_recordings_from_the_cache(tmp_path):
+    recordings = [('sub-1', 'baseline'), ('sub-2', 'baseline')]
+    raw_folder, results_folder = _store(tmp_path, recordings, recordings)
+    assert len(results_store.read(results_folder, 'ecg', raw_folder)) == 2
+
+    os.remove(signal_store.sidecar_path(raw_folder, 'sub-2_baseline'))
+    assert results_store.read(results_folder, 'ecg', raw_folder)['Participant'].tolist() == ['sub-1']